@@ -0,0 +1,98 @@
+# scripts/bench.py
+# Offline throughput benchmark: runs chunk_sheets.py against fake_google.py and
+# reports, per run, wall time, API calls per playlist, bytes on the wire, YouTube
+# units and the child's peak RSS. Runs share one fake world, so the first run is a
+# cold start and later runs exercise the incremental path.
+#
+# Knobs (environment):
+#   BENCH_RUNS     runs against the same world (default 3)
+#   BENCH_HOURS    world hours between runs, i.e. how many new uploads appear (default 24)
+#   BENCH_KEYS     YouTube API keys handed to the script (default 3)
+#   BENCH_JSON     also write the report to this path
+#   BENCH_VERBOSE  1 = show the script's own output
+#   FAKE_*         see fake_google.py (channels, latency, error injection, quota)
+# Anything chunk_sheets.py reads (PLAYLIST_LIMIT, CONCURRENCY, STORE_PATH, ...) is
+# passed through; PLAYLIST_LIMIT defaults to every channel and STORE_PATH /
+# SOURCE_CACHE / YT_CACHE_PATH to a scratch directory, as in the workflow.
+# REFRESH_MAX_DAYS defaults to 0 (every playlist due each run): runs are world hours
+# apart but the same real day, so the refresh scheduler would otherwise skip them.
+#
+# Example: FAKE_CHANNELS=500 FAKE_LATENCY_MS=40 CONCURRENCY=4 python scripts/bench.py
+
+import os, sys, json, time, tempfile, subprocess
+from fake_google import World, serve, env_for
+
+RUNS    = int(os.getenv("BENCH_RUNS", "3") or "3")
+HOURS   = float(os.getenv("BENCH_HOURS", "24") or "24")
+KEYS    = int(os.getenv("BENCH_KEYS", "3") or "3")
+OUT     = os.getenv("BENCH_JSON", "").strip()
+VERBOSE = os.getenv("BENCH_VERBOSE", "").strip() == "1"
+SCRIPT  = os.path.join(os.path.dirname(os.path.abspath(__file__)), "chunk_sheets.py")
+
+def run_once(env):
+    """Run the script once; returns (exit code, wall seconds, peak RSS in MB)."""
+    t0 = time.perf_counter()
+    out = None if VERBOSE else subprocess.DEVNULL
+    p = subprocess.Popen([sys.executable, SCRIPT], env=env, stdout=out, stderr=subprocess.STDOUT)
+    _, status, usage = os.wait4(p.pid, 0)
+    p.returncode = os.waitstatus_to_exitcode(status)
+    wall = time.perf_counter() - t0
+    rss = usage.ru_maxrss / (1024 * 1024 if sys.platform == "darwin" else 1024)
+    return p.returncode, wall, rss
+
+def report_row(i, code, wall, rss, s):
+    calls = sum(s["calls"].values())
+    yt = sum(v for k, v in s["calls"].items() if k.startswith("yt."))
+    pl = s["playlists"]
+    return {
+        "run": i, "exit": code, "wall_s": round(wall, 2), "peak_rss_mb": round(rss, 1),
+        "playlists": pl, "calls": calls, "yt_calls": yt, "gapi_calls": calls - yt,
+        "calls_per_playlist": round(calls / pl, 2) if pl else None,
+        "playlists_per_s": round(pl / wall, 2) if wall else None,
+        "yt_units": s["yt_units"], "bytes_in": s["bytes_in"], "bytes_out": s["bytes_out"],
+        "errors": s["errors"], "by_endpoint": dict(sorted(s["calls"].items())),
+    }
+
+def main():
+    world = World()
+    srv, world, root = serve(world)
+    scratch = tempfile.mkdtemp(prefix="chunk-bench-")
+    env = dict(os.environ)
+    env.update(env_for(root, KEYS))
+    env.setdefault("PLAYLIST_LIMIT", str(len(world.channels)))
+    env.setdefault("STORE_PATH", os.path.join(scratch, "chunk_store.sqlite"))
+    env.setdefault("SOURCE_CACHE", os.path.join(scratch, "source.json"))
+    env.setdefault("YT_CACHE_PATH", os.path.join(scratch, "yt_cache.sqlite"))
+    env.setdefault("REFRESH_MAX_DAYS", "0")
+    env["PYTHONUNBUFFERED"] = "1"
+    print(f"BENCH: {root} channels={len(world.channels)} runs={RUNS} scratch={scratch}")
+
+    rows = []
+    for i in range(1, RUNS + 1):
+        if i > 1:
+            world.advance(HOURS)
+        world.reset_stats()
+        code, wall, rss = run_once(env)
+        rows.append(report_row(i, code, wall, rss, world.snapshot()))
+        r = rows[-1]
+        print(f"RUN {i}: exit={r['exit']} wall={r['wall_s']}s playlists={r['playlists']} "
+              f"calls={r['calls']} ({r['calls_per_playlist']}/playlist, yt={r['yt_calls']} gapi={r['gapi_calls']}) "
+              f"units={r['yt_units']} in={r['bytes_in'] / 1e6:.2f}MB out={r['bytes_out'] / 1e6:.2f}MB "
+              f"rss={r['peak_rss_mb']}MB errors={r['errors'] or '-'}")
+        for k, v in r["by_endpoint"].items():
+            print(f"    {k:28s} {v}")
+    srv.shutdown()
+
+    report = {"channels": len(world.channels), "hours_between_runs": HOURS,
+              "env": {k: env[k] for k in sorted(env) if k.startswith(("FAKE_", "CONCURRENCY", "PLAYLIST_LIMIT",
+                                                                      "STORE_PATH", "SOURCE_CACHE", "YT_CACHE", "SHARD_"))},
+              "runs": rows}
+    if OUT:
+        with open(OUT, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"BENCH: report -> {OUT}")
+    if any(r["exit"] for r in rows):
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -2,15 +2,15 @@
 # Main job: read config from the source sheet, fetch YouTube data, and write per-playlist chunks
 # into Google Drive (each chunk is a Google Sheet). Uses user OAuth (refresh token) via oauth_helper.
 
-import os, sys, json, time, re, io
+import os, sys, json, time, re, math, threading, hashlib, gzip, sqlite3, bisect, functools, itertools
 import datetime as dt
 from dateutil import tz
 from typing import Dict, List, Tuple, Optional
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from contextlib import contextmanager
 import requests
 
-from googleapiclient.errors import HttpError
-from googleapiclient.discovery import build
-from oauth_helper import build_drive_service, build_sheets_service
+from google_rest import sheets, drive, HttpError, client_stats
 
 # ---------- ENV / constants ----------
 
@@ -22,14 +22,93 @@ CHUNKS_FOLDER_ID = os.getenv("CHUNKS_FOLDER_ID", "").strip()
 
 PLAYLIST_LIMIT = int(os.getenv("PLAYLIST_LIMIT", "5") or "5")
 ROWS_PER_DOC   = int(os.getenv("ROWS_PER_DOC", "20000") or "20000")
+CONCURRENCY    = max(1, int(os.getenv("CONCURRENCY", "1") or "1"))
+# playlists in flight sharing videos.list requests; concurrent mode only (CONCURRENCY > 1)
+PACK_PLAYLISTS = max(CONCURRENCY, int(os.getenv("PACK_PLAYLISTS", "8") or "8")) if CONCURRENCY > 1 else 1
+INCREMENTAL    = os.getenv("INCREMENTAL", "1").strip() != "0"
+STATS_REFRESH  = os.getenv("STATS_REFRESH", "1").strip() != "0"
+YT_DAILY_QUOTA = int(os.getenv("YT_DAILY_QUOTA", "10000") or "10000")
+YT_KEY_QPS     = float(os.getenv("YT_KEY_QPS", "5") or "5")
+YT_UNITS_PER_PLAYLIST = float(os.getenv("YT_UNITS_PER_PLAYLIST", "3") or "3")
+TIME_BUDGET_MIN  = float(os.getenv("TIME_BUDGET_MIN", "240") or "240")  # playlist processing wall time per run
+# refresh scheduling: a playlist is due once its expected new videos (plus weighted count
+# churn) add up to one, but never sooner than REFRESH_MIN_DAYS or later than REFRESH_MAX_DAYS
+REFRESH_MIN_DAYS = int(os.getenv("REFRESH_MIN_DAYS", "1") or "1")
+REFRESH_MAX_DAYS = int(os.getenv("REFRESH_MAX_DAYS", "7") or "7")
+REFRESH_STATS_WEIGHT = float(os.getenv("REFRESH_STATS_WEIGHT", "10") or "10")  # new-video equivalents of 100%/day view growth
+REFRESH_COVER_SHARE  = float(os.getenv("REFRESH_COVER_SHARE", "0.25") or "0.25")  # run share kept for overdue playlists
+ACTIVITY_ALPHA   = 0.5          # weight of the latest scan in the activity averages
+ANNUAL_LIMIT   = 1001
+OVERFLOW_MARGIN = 1.5       # first-page projection must exceed the cap by this factor
+OVERFLOW_COOLDOWN_DAYS = int(os.getenv("OVERFLOW_COOLDOWN_DAYS", "7") or "7")
+GAPI_RETRIES     = int(os.getenv("GAPI_RETRIES", "6") or "6")  # Sheets/Drive: 429/5xx/socket errors, exponential backoff
+CHECKPOINT_SECS  = float(os.getenv("CHECKPOINT_SECS", "300") or "300")  # min seconds between checkpoints
+STREAM_ROWS      = max(50, int(os.getenv("STREAM_ROWS", "500") or "500"))  # rows per write while a playlist is still fetching
+GRID_GROW_ROWS   = max(1, int(os.getenv("GRID_GROW_ROWS", "5000") or "5000"))  # rows added to a chunk doc's grid at a time
+COMPACT          = os.getenv("COMPACT", "1").strip() != "0"
+COMPACT_SHARE    = float(os.getenv("COMPACT_SHARE", "0.1") or "0.1")  # tombstoned share of a doc that triggers compaction
+SWEEP_DAYS       = int(os.getenv("SWEEP_DAYS", "7") or "7")  # docs are also compacted when not swept for this long
+RESUME           = os.getenv("RESUME", "1").strip() != "0"
+STATE_GZIP_BYTES = 256 * 1024   # state files above this size are stored gzip-compressed
+STORE_PATH       = os.getenv("STORE_PATH", "").strip()  # local SQLite staging store; empty = write Sheets directly
+SOURCE_CACHE     = os.getenv("SOURCE_CACHE", "").strip()  # parsed source sheet, reused while its modifiedTime holds
+REPORT_HISTORY   = int(os.getenv("REPORT_HISTORY", "30") or "30")  # run reports kept in Drive
+# YouTube response cache: ETag revalidation of identical requests across runs; empty = off
+YT_CACHE_PATH    = os.getenv("YT_CACHE_PATH", "").strip()
+YT_CACHE_MB      = float(os.getenv("YT_CACHE_MB", "200") or "200")
+YT_CACHE_DAYS    = float(os.getenv("YT_CACHE_DAYS", "14") or "14")
+
+# sharded runs: each matrix job takes the playlists and chunk docs of one shard and saves a
+# state fragment; a MERGE_SHARDS job folds the fragments of the same run back together
+SHARD_COUNT  = max(1, int(os.getenv("SHARD_COUNT", "1") or "1"))
+SHARD_INDEX  = int(os.getenv("SHARD_INDEX", "0") or "0") % SHARD_COUNT
+MERGE_SHARDS = os.getenv("MERGE_SHARDS", "").strip() == "1"
+SHARDED      = SHARD_COUNT > 1 and not MERGE_SHARDS
+RUN_ID       = os.getenv("GITHUB_RUN_ID", "").strip()
+STATE_NAME   = "chunks_state.json"
 
 BAKU_TZ    = tz.gettz("Asia/Baku")
+BAKU_FMT   = "%d.%m.%Y %H:%M:%S"
+QUOTA_TZ   = tz.gettz("America/Los_Angeles")  # YouTube quota day resets at Pacific midnight
 WINDOW_DAYS = 365
 SHORTS_LIMIT = 182
 
+HEADERS = [
+    "videoId","playlistId","channelTitle","publishedAt","title","duration_s","isShorts",
+    "viewCount","likeCount","commentCount","categoryId","defaultLanguage","topicCategories_ru",
+    "hasPaidProductPlacement","firstSeenAt","lastUpdatedAt","isTombstoned","tombstoneReason"
+]
+INDEX_HEADERS = ["playlistId","docId","docName","lastScanAt","rowsInDoc"]
+
 SESSION = requests.Session()
-YOUTUBE_ENDPOINT = "https://www.googleapis.com/youtube/v3"
-KEY_IDX = 0
+YT_SLOTS = threading.BoundedSemaphore(CONCURRENCY)  # YouTube requests in flight
+YOUTUBE_ENDPOINT = os.getenv("YOUTUBE_ENDPOINT", "").strip() or "https://www.googleapis.com/youtube/v3"
+
+# st (chunks_state) is shared between workers; writes to one chunk doc are serialized
+ST_LOCK = threading.RLock()
+DOC_LOCKS: Dict[str, threading.Lock] = {}
+
+# videoId -> (docId, row) across all chunk docs, persisted as VIDEO_INDEX_NAME
+VIDEO_INDEX_NAME = "videos_index.json"
+VX = {"docs": {}, "where": {}, "dirty": set()}
+
+# run-scoped write-behind: tabs already confirmed per doc, pending VideosIndex rows
+CONFIRMED_TABS = set()
+INDEX_PENDING: Dict[str, dict] = {}
+INDEX_ROWS: Optional[Dict[str, int]] = None
+CKPT_LOCK = threading.Lock()
+# the next checkpoint waits CHECKPOINT_SECS, or 10x as long as the last one took once the
+# state is big enough for that to matter, so checkpoints stay a small share of the run
+CKPT = {"next": time.monotonic() + CHECKPOINT_SECS}
+# name -> {"id", "version"} of state files read or written this run (optimistic concurrency)
+DRIVE_FILES: Dict[str, dict] = {}
+
+STORE: Optional[sqlite3.Connection] = None
+STORE_LOCK = threading.Lock()
+
+YT_CACHE: Optional[sqlite3.Connection] = None
+YT_CACHE_LOCK = threading.Lock()
+YT_CACHE_STATS = {"revalidated": 0, "stored": 0, "evicted": 0}
 
 # ---------- util ----------
 
@@ -37,11 +116,78 @@ def fail(code, msg, ec=2):
     print(f"ERROR[{code}]: {msg}")
     sys.exit(ec)
 
+def now_baku():
+    return dt.datetime.now(BAKU_TZ).strftime("%d.%m.%Y %H:%M:%S")
+
 def a1(sheet, rng):
     if not (sheet.startswith("'") and sheet.endswith("'")):
         sheet = f"'{sheet}'"
     return f"{sheet}!{rng}"
 
+def col_letter(i):
+    s = ""; i += 1
+    while i > 0:
+        i, r = divmod(i - 1, 26)
+        s = chr(65 + r) + s
+    return s
+
+def stable_hash(s):
+    return int(hashlib.sha1(s.encode("utf-8")).hexdigest()[:8], 16)
+
+def shard_name(name, shard=None):
+    base, ext = os.path.splitext(name)
+    return f"{base}.shard{SHARD_INDEX if shard is None else shard}{ext}"
+
+# ---------- instrumentation ----------
+
+LAT_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)  # seconds; plus one overflow bucket
+METRICS = {"api": {}, "phase": {}, "playlists": {}}
+METRICS_LOCK = threading.Lock()
+PL_LOCAL = threading.local()  # YouTube units spent for the playlist this thread is working on
+REPORT_NAME = "run_reports.json"
+
+def observe(kind, name, secs, error=False, retries=0, nbytes=0):
+    with METRICS_LOCK:
+        m = METRICS[kind].get(name)
+        if m is None:
+            m = METRICS[kind][name] = {"n": 0, "errors": 0, "retries": 0, "bytes": 0, "s": 0.0,
+                                       "max_s": 0.0, "hist": [0] * (len(LAT_BUCKETS) + 1)}
+        m["n"] += 1; m["errors"] += bool(error); m["retries"] += retries; m["bytes"] += nbytes
+        m["s"] += secs; m["max_s"] = max(m["max_s"], secs)
+        m["hist"][bisect.bisect_left(LAT_BUCKETS, secs)] += 1
+
+@contextmanager
+def timed(kind, name):
+    t0 = time.perf_counter(); error = False
+    try:
+        yield
+    except BaseException:
+        error = True
+        raise
+    finally:
+        observe(kind, name, time.perf_counter() - t0, error)
+
+def instrumented(name):
+    """Time every call of a Sheets/Drive wrapper as METRICS["api"][name]."""
+    def wrap(fn):
+        @functools.wraps(fn)
+        def inner(*a, **kw):
+            with timed("api", name):
+                return fn(*a, **kw)
+        return inner
+    return wrap
+
+def hist_quantile(hist, q):
+    """Upper bucket bound (seconds) below which a q share of observations fell."""
+    n = sum(hist)
+    if not n:
+        return None
+    acc = 0
+    for i, c in enumerate(hist):
+        acc += c
+        if acc >= q * n:
+            return LAT_BUCKETS[i] if i < len(LAT_BUCKETS) else float("inf")
+
 def parse_http(e: HttpError):
     try:
         status = getattr(e.resp, "status", None)
@@ -57,66 +203,78 @@ def parse_http(e: HttpError):
 
 # ---------- Google APIs (Drive / Sheets) ----------
 
+@instrumented("sheets.values.get")
 def sheets_values_get(spreadsheet_id, rng):
     try:
-        svc = build_sheets_service()
-        return svc.spreadsheets().values().get(spreadsheetId=spreadsheet_id, range=rng).execute().get("values", [])
+        return sheets.values_get(spreadsheet_id, rng, retries=GAPI_RETRIES).get("values", [])
     except HttpError as e:
         s, m = parse_http(e); fail("SHEETS_GET", f"{s} {spreadsheet_id} {rng} {m}")
     except Exception:
         fail("SHEETS_GET", "unexpected")
 
+@instrumented("sheets.values.batchGet")
+def sheets_values_batch_get(spreadsheet_id, ranges, major_dimension="ROWS"):
+    try:
+        r = sheets.values_batch_get(spreadsheet_id, ranges, major_dimension, retries=GAPI_RETRIES)
+        return [vr.get("values", []) for vr in r.get("valueRanges", [])]
+    except HttpError as e:
+        s, m = parse_http(e); fail("SHEETS_GET", f"{s} {spreadsheet_id} {m}")
+    except Exception:
+        fail("SHEETS_GET", "unexpected")
+
+@instrumented("sheets.values.batchUpdate")
 def sheets_values_batch_update(spreadsheet_id, data, value_input_option="RAW"):
     try:
-        svc = build_sheets_service()
         body = {"valueInputOption": value_input_option, "data": data}
-        return svc.spreadsheets().values().batchUpdate(spreadsheetId=spreadsheet_id, body=body).execute()
+        return sheets.values_batch_update(spreadsheet_id, body, retries=GAPI_RETRIES)
     except HttpError as e:
         s, m = parse_http(e); fail("SHEETS_WRITE", f"{s} {spreadsheet_id} {m}")
     except Exception:
         fail("SHEETS_WRITE", "unexpected")
 
+@instrumented("sheets.values.append")
 def sheets_values_append(spreadsheet_id, rng, values):
     try:
-        svc = build_sheets_service()
-        body = {"values": values}
-        return svc.spreadsheets().values().append(
-            spreadsheetId=spreadsheet_id, range=rng,
-            valueInputOption="RAW", insertDataOption="INSERT_ROWS", body=body
-        ).execute()
+        return sheets.values_append(spreadsheet_id, rng, values, retries=GAPI_RETRIES)
     except HttpError as e:
         s, m = parse_http(e); fail("SHEETS_APPEND", f"{s} {spreadsheet_id} {m}")
     except Exception:
         fail("SHEETS_APPEND", "unexpected")
 
-def sheets_meta(spreadsheet_id):
+@instrumented("sheets.get")
+def sheets_meta(spreadsheet_id, fields=None):
     try:
-        svc = build_sheets_service()
-        return svc.spreadsheets().get(spreadsheetId=spreadsheet_id).execute()
+        return sheets.get(spreadsheet_id, fields=fields, retries=GAPI_RETRIES)
     except HttpError as e:
         s, m = parse_http(e); fail("SHEETS_META", f"{s} {spreadsheet_id} {m}")
     except Exception:
         fail("SHEETS_META", "unexpected")
 
+@instrumented("sheets.batchUpdate")
+def sheets_batch_update(spreadsheet_id, reqs):
+    try:
+        return sheets.batch_update(spreadsheet_id, {"requests": reqs}, retries=GAPI_RETRIES)
+    except HttpError as e:
+        s, m = parse_http(e); fail("SHEETS_WRITE", f"{s} {spreadsheet_id} {m}")
+    except Exception:
+        fail("SHEETS_WRITE", "unexpected")
+
+@instrumented("drive.files.create")
 def drive_create_sheet_in_folder(name, folder_id):
     try:
-        svc = build_drive_service()
         meta = {"name": name, "mimeType": "application/vnd.google-apps.spreadsheet", "parents": [folder_id]}
-        f = svc.files().create(body=meta, fields="id", supportsAllDrives=True).execute()
+        f = drive.files_create(meta, fields="id", retries=GAPI_RETRIES)
         return f["id"]
     except HttpError as e:
         s, m = parse_http(e); fail("DRIVE_CREATE", f"{s} {m}")
     except Exception:
         fail("DRIVE_CREATE", "unexpected")
 
+@instrumented("drive.files.list")
 def drive_find_file_by_name(name, folder_id):
     try:
-        svc = build_drive_service()
         q = f"'{folder_id}' in parents and name = '{name}' and trashed = false"
-        r = svc.files().list(
-            q=q, spaces="drive", fields="files(id,name)", pageSize=1,
-            includeItemsFromAllDrives=True, supportsAllDrives=True
-        ).execute()
+        r = drive.files_list(q, fields="files(id,name)", page_size=1, retries=GAPI_RETRIES)
         files = r.get("files", [])
         return files[0]["id"] if files else None
     except HttpError as e:
@@ -124,43 +282,103 @@ def drive_find_file_by_name(name, folder_id):
     except Exception:
         fail("DRIVE_SEARCH", "unexpected")
 
-def drive_download_text(file_id):
+@instrumented("drive.files.get")
+def drive_modified_time(file_id):
     try:
-        svc = build_drive_service()
-        req = svc.files().get_media(fileId=file_id, supportsAllDrives=True)
-        buf = io.BytesIO()
-        from googleapiclient.http import MediaIoBaseDownload
-        dl = MediaIoBaseDownload(buf, req)
-        done = False
-        while not done:
-            status, done = dl.next_chunk()
-        buf.seek(0)
-        return buf.read().decode("utf-8")
+        f = drive.files_get(file_id, fields="modifiedTime", retries=GAPI_RETRIES)
+        return f.get("modifiedTime", "")
+    except HttpError as e:
+        s, m = parse_http(e); fail("DRIVE_META", f"{s} {file_id} {m}")
+    except Exception:
+        fail("DRIVE_META", "unexpected")
+
+@instrumented("drive.files.get")
+def drive_file_version(file_id):
+    try:
+        f = drive.files_get(file_id, fields="version", retries=GAPI_RETRIES)
+        return str(f.get("version", ""))
+    except HttpError as e:
+        s, m = parse_http(e); fail("DRIVE_META", f"{s} {file_id} {m}")
+    except Exception:
+        fail("DRIVE_META", "unexpected")
+
+@instrumented("drive.files.list")
+def drive_lookup(name, folder_id):
+    try:
+        q = f"'{folder_id}' in parents and name = '{name}' and trashed = false"
+        r = drive.files_list(q, fields="files(id,name,version)", page_size=1, retries=GAPI_RETRIES)
+        files = r.get("files", [])
+        return files[0] if files else None
+    except HttpError as e:
+        s, m = parse_http(e); fail("DRIVE_SEARCH", f"{s} {m}")
+    except Exception:
+        fail("DRIVE_SEARCH", "unexpected")
+
+@instrumented("drive.files.get_media")
+def drive_download_bytes(file_id):
+    try:
+        return drive.files_get_media(file_id, retries=GAPI_RETRIES)
     except HttpError as e:
         s, m = parse_http(e); fail("DRIVE_READ", f"{s} {m}")
     except Exception:
         fail("DRIVE_READ", "unexpected")
 
-def drive_overwrite_text(name, folder_id, text):
+def drive_read_state_text(name):
+    """
+    Read a state file from CHUNKS_FOLDER_ID (gunzipping if needed) and remember its
+    id and version for drive_write_state_text. Returns None if it does not exist.
+    """
+    meta = drive_lookup(name, CHUNKS_FOLDER_ID)
+    if not meta:
+        return None
+    DRIVE_FILES[name] = {"id": meta["id"], "version": str(meta.get("version", ""))}
+    raw = drive_download_bytes(meta["id"])
+    if raw[:2] == b"\x1f\x8b":
+        raw = gzip.decompress(raw)
+    return raw.decode("utf-8")
+
+def drive_write_state_text(name, text):
+    """
+    Update a state file in place with a simple upload, keeping its file id.
+    Fails with STATE_CONFLICT when the update moved the file's version by more than
+    one past what this run last read or wrote, i.e. another run saved it in between.
+    Best effort: Drive v3 has no conditional update, so the check comes after the
+    write; after a conflict this run writes the file no more. No extra request is
+    spent on the check.
+    """
+    data = text.encode("utf-8"); mimetype = "application/json"
+    if len(data) > STATE_GZIP_BYTES:
+        data = gzip.compress(data); mimetype = "application/gzip"
+    meta = DRIVE_FILES.get(name)
+    if meta and meta.get("conflict"):
+        fail("STATE_CONFLICT", f"{name} was modified by another run; not writing it again")
+    if meta is None:
+        found = drive_lookup(name, CHUNKS_FOLDER_ID)
+        if found:
+            meta = {"id": found["id"], "version": str(found.get("version", ""))}
     try:
-        svc = build_drive_service()
-        old_id = drive_find_file_by_name(name, folder_id)
-        from googleapiclient.http import MediaIoBaseUpload
-        media = MediaIoBaseUpload(io.BytesIO(text.encode("utf-8")), mimetype="text/plain", resumable=True)
-        meta = {"name": name, "parents": [folder_id]}
-        if old_id:
-            svc.files().delete(fileId=old_id, supportsAllDrives=True).execute()
-        f = svc.files().create(body=meta, media_body=media, fields="id", supportsAllDrives=True).execute()
-        return f["id"]
+        with timed("api", "drive.files.upload"):
+            if meta:
+                f = drive.files_update(meta["id"], media=data, mimetype=mimetype, fields="id,version",
+                                       retries=GAPI_RETRIES)
+            else:
+                body = {"name": name, "parents": [CHUNKS_FOLDER_ID]}
+                f = drive.files_create(body, media=data, mimetype=mimetype, fields="id,version",
+                                       retries=GAPI_RETRIES)
     except HttpError as e:
         s, m = parse_http(e); fail("DRIVE_WRITE", f"{s} {m}")
     except Exception:
         fail("DRIVE_WRITE", "unexpected")
+    version = str(f.get("version", ""))
+    DRIVE_FILES[name] = {"id": f["id"], "version": version}
+    if meta and meta["version"].isdigit() and version.isdigit() and int(version) > int(meta["version"]) + 1:
+        DRIVE_FILES[name]["conflict"] = True
+        fail("STATE_CONFLICT", f"{name} was modified by another run since version {meta['version']}")
+    return f["id"]
 
 # ---------- helper data from config sheet ----------
 
-def get_helper_maps():
-    vals = sheets_values_get(SOURCE_SHEET_ID, a1(MAP_SHEET_TAB, "A:H"))
+def get_helper_maps(vals):
     header_map = {}
     topic_ru = {}
     for row in vals:
@@ -189,104 +407,521 @@ def find_header_indices(header, names):
         idx[n] = low[k]
     return idx
 
-def get_baza_columns(header_map):
-    hdr = sheets_values_get(SOURCE_SHEET_ID, a1(SOURCE_SHEET_TAB, "1:1"))
-    header = hdr[0] if hdr else []
+def column_letters(header, header_map):
     if not header:
         fail("BAZA_EMPTY", "no header")
-
-    pl_name = header_map["relatedplaylists.uploads"]
-    vc_name = header_map["videocount"]
-    tc_name = header_map["topiccategories[]"]
-    tt_name = header_map["title"]
-
-    names = [pl_name, vc_name, tc_name, tt_name]
+    names = [header_map["relatedplaylists.uploads"], header_map["videocount"],
+             header_map["topiccategories[]"], header_map["title"]]
     idx = find_header_indices(header, names)
+    return [col_letter(idx[n]) for n in names]
 
-    def col_letter(i):
-        s = ""; i += 1
-        while i > 0:
-            i, r = divmod(i - 1, 26)
-            s = chr(65 + r) + s
-        return s
-
-    iu = idx[pl_name]; iv = idx[vc_name]; it = idx[tc_name]; ititle = idx[tt_name]
-    lu = col_letter(iu); lv = col_letter(iv); lt = col_letter(it); ltitle = col_letter(ititle)
-
-    cu     = sheets_values_get(SOURCE_SHEET_ID, a1(SOURCE_SHEET_TAB, f"{lu}2:{lu}"))
-    cv     = sheets_values_get(SOURCE_SHEET_ID, a1(SOURCE_SHEET_TAB, f"{lv}2:{lv}"))
-    ct     = sheets_values_get(SOURCE_SHEET_ID, a1(SOURCE_SHEET_TAB, f"{lt}2:{lt}"))
-    ctitle = sheets_values_get(SOURCE_SHEET_ID, a1(SOURCE_SHEET_TAB, f"{ltitle}2:{ltitle}"))
-
+def get_baza_columns(cols):
+    cu, cv, ct, ctitle = [c[0] if c else [] for c in cols]
     n = max(len(cu), len(cv), len(ct), len(ctitle))
     uploads, vcounts, topics, titles = [], [], [], []
     for i in range(n):
-        u  = cu[i][0].strip()     if i < len(cu)     and cu[i]     else ""
+        u  = cu[i].strip()     if i < len(cu)     else ""
         pid = u.split()[0] if u else ""
         uploads.append(pid)
-        vv = cv[i][0].strip()     if i < len(cv)     and cv[i]     else ""
+        vv = cv[i].strip()     if i < len(cv)     else ""
         vcounts.append(vv if vv else None)
-        tt = ct[i][0].strip()     if i < len(ct)     and ct[i]     else ""
+        tt = ct[i].strip()     if i < len(ct)     else ""
         topics.append(tt)
-        tv = ctitle[i][0].strip() if i < len(ctitle) and ctitle[i] else ""
+        tv = ctitle[i].strip() if i < len(ctitle) else ""
         titles.append(tv)
     return uploads, vcounts, topics, titles
 
+def load_source():
+    """
+    Helper maps and the four source columns. Everything comes from one
+    values.batchGet (majorDimension=COLUMNS) using the column letters of the last
+    run; a second call is needed only if the header moved. When SOURCE_CACHE is
+    set and the sheet's Drive modifiedTime is unchanged, nothing is downloaded.
+    Returns (header_map, topic_ru, uploads, vcounts, topics, titles).
+    """
+    mtime = drive_modified_time(SOURCE_SHEET_ID) if SOURCE_CACHE else None
+    key = [SOURCE_SHEET_ID, SOURCE_SHEET_TAB, MAP_SHEET_TAB]
+    cache = {}
+    if SOURCE_CACHE and os.path.exists(SOURCE_CACHE):
+        try:
+            with open(SOURCE_CACHE, encoding="utf-8") as f:
+                cache = json.load(f)
+        except Exception:
+            cache = {}
+        if cache.get("key") != key:
+            cache = {}
+    if mtime and cache.get("modifiedTime") == mtime and "data" in cache:
+        print(f"INFO[SOURCE_CACHE]: unchanged since {mtime}")
+        return tuple(cache["data"])
+
+    guess = cache.get("letters") or []
+    ranges = [a1(MAP_SHEET_TAB, "A:H"), a1(SOURCE_SHEET_TAB, "1:1")]
+    ranges += [a1(SOURCE_SHEET_TAB, f"{c}2:{c}") for c in guess]
+    res = sheets_values_batch_get(SOURCE_SHEET_ID, ranges, "COLUMNS")
+    map_cols = res[0]
+    nrows = max((len(c) for c in map_cols), default=0)
+    map_rows = [[c[i] if i < len(c) else "" for c in map_cols] for i in range(nrows)]
+    header_map, topic_ru = get_helper_maps(map_rows)
+    header = [c[0] if c else "" for c in res[1]]
+    letters = column_letters(header, header_map)
+    if letters == guess:
+        cols = res[2:]
+    else:
+        cols = sheets_values_batch_get(SOURCE_SHEET_ID, [a1(SOURCE_SHEET_TAB, f"{c}2:{c}") for c in letters], "COLUMNS")
+    data = (header_map, topic_ru) + get_baza_columns(cols)
+    if SOURCE_CACHE:
+        os.makedirs(os.path.dirname(SOURCE_CACHE) or ".", exist_ok=True)
+        tmp = SOURCE_CACHE + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"key": key, "modifiedTime": mtime, "letters": letters, "data": data}, f, ensure_ascii=False)
+        os.replace(tmp, SOURCE_CACHE)
+    return data
+
 # ---------- filtering helpers ----------
 
+TV_TOPIC = "телевизионные программы"
+
 def is_tv(topic_cell_text):
-    return "телевизионные программы" in (topic_cell_text or "").strip().lower()
+    return TV_TOPIC in (topic_cell_text or "").strip().lower()
 
-def over_10k(vc):
+def count_int(vc):
     if not vc:
-        return False
+        return None
     try:
-        x = int(re.sub(r"[^\d]", "", vc))
-        return x > 10000
+        return int(re.sub(r"[^\d]", "", vc))
     except Exception:
-        return False
+        return None
+
+def over_10k(vc):
+    x = count_int(vc)
+    return x is not None and x > 10000
+
+def select_channels(uploads, vcounts, topics, titles):
+    """
+    Source columns -> (candidates, title_map, vc_map). Candidates are playlists that
+    are neither over 10k videos nor TV; vc_map holds the parsed videoCount or None.
+    """
+    candidates, title_map, vc_map = [], {}, {}
+    for pid, vc, tc, t in zip(uploads, vcounts, topics, titles):
+        if not pid:
+            continue
+        title_map[pid] = t
+        vc_map[pid] = count_int(vc)
+        if not over_10k(vc) and not is_tv(tc):
+            candidates.append(pid)
+    return candidates, title_map, vc_map
 
 # ---------- YouTube helpers ----------
 
-def key():
-    global KEY_IDX
-    return API_KEYS[KEY_IDX % len(API_KEYS)]
+def quota_day():
+    return dt.datetime.now(QUOTA_TZ).date().isoformat()
+
+def key_fp(k):
+    # keys are persisted in state by fingerprint only
+    return hashlib.sha1(k.encode("utf-8")).hexdigest()[:12]
+
+class KeyPool:
+    """
+    API keys with per-key unit accounting for the current Pacific quota day,
+    retirement on quotaExceeded, a token bucket of YT_KEY_QPS requests per second
+    and cooldowns from Retry-After / rate-limit responses.
+    """
+
+    def __init__(self, keys, daily_quota=YT_DAILY_QUOTA, qps=YT_KEY_QPS):
+        self.keys = list(keys)
+        self.daily_quota = daily_quota
+        self.qps = qps
+        self.lock = threading.Lock()
+        self.day = quota_day()
+        self.spent = {k: 0 for k in self.keys}
+        self.retired = set()
+        self.ready_at = {k: 0.0 for k in self.keys}
+        self.tokens = {k: 1.0 for k in self.keys}
+        self.refill_at = {k: time.monotonic() for k in self.keys}
+        self.run_units = 0
+        self.rotations = 0
+        self.idx = 0
+
+    def _roll_day(self):
+        day = quota_day()
+        if day != self.day:
+            self.day = day
+            self.spent = {k: 0 for k in self.keys}
+            self.retired.clear()
+
+    def _live(self, cost):
+        return [k for k in self.keys if k not in self.retired and self.spent[k] + cost <= self.daily_quota]
+
+    def acquire(self, cost):
+        """
+        Blocks until some live key is ready, charges `cost` units to it and returns it.
+        Returns None when every key is out of quota for today.
+        """
+        while True:
+            with self.lock:
+                self._roll_day()
+                live = self._live(cost)
+                if not live:
+                    return None
+                now = time.monotonic()
+                wait = None
+                for i in range(len(self.keys)):
+                    k = self.keys[(self.idx + i) % len(self.keys)]
+                    if k not in live:
+                        continue
+                    self.tokens[k] = min(max(1.0, self.qps), self.tokens[k] + (now - self.refill_at[k]) * self.qps)
+                    self.refill_at[k] = now
+                    delay = max(self.ready_at[k] - now, (1.0 - self.tokens[k]) / self.qps if self.qps > 0 else 0.0)
+                    if delay <= 0:
+                        self.tokens[k] -= 1.0
+                        self.spent[k] += cost
+                        self.run_units += cost
+                        return k
+                    wait = delay if wait is None else min(wait, delay)
+            time.sleep(min(wait or 0.05, 60))
+
+    def retire(self, k):
+        with self.lock:
+            if k not in self.retired:
+                self.retired.add(k)
+                self.rotations += 1
+                print(f"WARN[YT_KEY_RETIRED]: key {key_fp(k)} out of quota until Pacific midnight")
+
+    def cool(self, k, seconds):
+        with self.lock:
+            self.ready_at[k] = max(self.ready_at[k], time.monotonic() + seconds)
+            self.idx = (self.keys.index(k) + 1) % len(self.keys)
+            self.rotations += 1
+
+    def remaining(self):
+        with self.lock:
+            self._roll_day()
+            return sum(self.daily_quota - self.spent[k] for k in self._live(1))
+
+    def load(self, saved):
+        """
+        Restore today's tally from state (st["quota"]); older days are ignored.
+        """
+        if not saved or saved.get("day") != self.day:
+            return
+        keys = saved.get("keys", {})
+        with self.lock:
+            for k in self.keys:
+                rec = keys.get(key_fp(k)) or {}
+                self.spent[k] = int(rec.get("spent", 0))
+                if rec.get("retired"):
+                    self.retired.add(k)
+
+    def dump(self):
+        with self.lock:
+            return {
+                "day": self.day,
+                "keys": {key_fp(k): {"spent": self.spent[k], "retired": k in self.retired} for k in self.keys},
+            }
+
+# with fewer keys than shards every shard draws on every key, and budgets a share of them
+KEYS_SHARED = SHARDED and len(API_KEYS) < SHARD_COUNT
+
+def shard_keys(keys):
+    # disjoint key sets per shard when there are enough keys to go round
+    if SHARDED and not KEYS_SHARED:
+        return keys[SHARD_INDEX::SHARD_COUNT]
+    return keys
+
+KEYS = KeyPool(shard_keys(API_KEYS))
+
+def yt_error_reason(r):
+    try:
+        errs = r.json().get("error", {}).get("errors", [])
+        return errs[0].get("reason", "") if errs else ""
+    except Exception:
+        return ""
+
+def retry_after(r):
+    v = r.headers.get("Retry-After", "")
+    try:
+        return max(0.0, float(v))
+    except ValueError:
+        return None
 
-def rotate_key():
-    global KEY_IDX
-    KEY_IDX += 1
+def open_yt_cache():
+    global YT_CACHE
+    if not YT_CACHE_PATH:
+        return
+    os.makedirs(os.path.dirname(YT_CACHE_PATH) or ".", exist_ok=True)
+    YT_CACHE = sqlite3.connect(YT_CACHE_PATH, check_same_thread=False)
+    YT_CACHE.execute("PRAGMA journal_mode=WAL")
+    YT_CACHE.execute("PRAGMA synchronous=OFF")  # losing the tail of a cache is harmless
+    YT_CACHE.execute("""CREATE TABLE IF NOT EXISTS responses (
+        k      TEXT PRIMARY KEY,
+        etag   TEXT NOT NULL,
+        body   BLOB NOT NULL,
+        size   INTEGER NOT NULL,
+        used   REAL NOT NULL
+    )""")
+    YT_CACHE.execute("CREATE INDEX IF NOT EXISTS responses_used ON responses(used)")
+    YT_CACHE.commit()
+    evict_yt_cache()
+    n, size = YT_CACHE.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses").fetchone()
+    print(f"INFO[YT_CACHE]: {YT_CACHE_PATH} entries={n} mb={size / 1e6:.1f}")
+
+def evict_yt_cache():
+    """Drop entries unused for YT_CACHE_DAYS, then least recently used ones above YT_CACHE_MB."""
+    with YT_CACHE_LOCK:
+        cur = YT_CACHE.execute("DELETE FROM responses WHERE used < ?", (time.time() - YT_CACHE_DAYS * 86400,))
+        evicted = cur.rowcount
+        total = YT_CACHE.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        cap = int(YT_CACHE_MB * 1e6)
+        if total > cap:
+            drop = []
+            for k, size in YT_CACHE.execute("SELECT k, size FROM responses ORDER BY used"):
+                if total <= cap:
+                    break
+                drop.append((k,)); total -= size
+            YT_CACHE.executemany("DELETE FROM responses WHERE k = ?", drop)
+            evicted += len(drop)
+        YT_CACHE.commit()
+        YT_CACHE_STATS["evicted"] += evicted
+
+def close_yt_cache():
+    global YT_CACHE
+    if YT_CACHE is None:
+        return
+    evict_yt_cache()
+    YT_CACHE.close(); YT_CACHE = None
+    c = YT_CACHE_STATS
+    print(f"INFO[YT_CACHE]: revalidated={c['revalidated']} stored={c['stored']} evicted={c['evicted']}")
+
+def yt_cache_key(path, params):
+    return hashlib.sha1(json.dumps([path, sorted(params.items())], default=str).encode("utf-8")).hexdigest()
+
+def yt_cache_get(k):
+    """(etag, body bytes) of a cached response, or (None, None)."""
+    if YT_CACHE is None:
+        return None, None
+    with YT_CACHE_LOCK:
+        row = YT_CACHE.execute("SELECT etag, body FROM responses WHERE k = ?", (k,)).fetchone()
+    return (row[0], gzip.decompress(row[1])) if row else (None, None)
+
+def yt_cache_put(k, etag, body, hit=False):
+    if YT_CACHE is None or not etag:
+        return
+    with YT_CACHE_LOCK:
+        if hit:
+            YT_CACHE.execute("UPDATE responses SET used = ? WHERE k = ?", (time.time(), k))
+            YT_CACHE_STATS["revalidated"] += 1
+        else:
+            data = gzip.compress(body, 1)
+            YT_CACHE.execute("INSERT OR REPLACE INTO responses (k, etag, body, size, used) VALUES (?, ?, ?, ?, ?)",
+                             (k, etag, data, len(data), time.time()))
+            YT_CACHE_STATS["stored"] += 1
+        if (YT_CACHE_STATS["stored"] + YT_CACHE_STATS["revalidated"]) % 200 == 0:
+            YT_CACHE.commit()
 
 def yt_get(path, params, cost=1):
-    for attempt in range(6):
+    ck = yt_cache_key(path, params)
+    etag, cached = yt_cache_get(ck)
+    headers = {"If-None-Match": etag} if etag else {}
+    attempt = 0; tries = 0; t0 = time.perf_counter()
+    while attempt < 6:
+        k = KEYS.acquire(cost)
+        if k is None:
+            observe("api", f"yt.{path}", time.perf_counter() - t0, True, max(0, tries - 1))
+            fail("YOUTUBE_QUOTA", f"all keys exhausted for {KEYS.day} ({path})")
+        PL_LOCAL.units = getattr(PL_LOCAL, "units", 0) + cost
+        tries += 1
         try:
-            p = dict(params); p["key"] = key()
-            r = SESSION.get(f"{YOUTUBE_ENDPOINT}/{path}", params=p, timeout=30)
+            p = dict(params); p["key"] = k
+            with YT_SLOTS:
+                r = SESSION.get(f"{YOUTUBE_ENDPOINT}/{path}", params=p, headers=headers, timeout=30)
+            if r.status_code == 304 and cached is not None:
+                observe("api", f"yt.{path}", time.perf_counter() - t0, False, tries - 1)
+                yt_cache_put(ck, etag, cached, hit=True)
+                return json.loads(cached)
             if r.status_code == 200:
-                return r.json()
+                observe("api", f"yt.{path}", time.perf_counter() - t0, False, tries - 1, len(r.content))
+                js = r.json()
+                yt_cache_put(ck, r.headers.get("ETag") or js.get("etag"), r.content)
+                return js
+            reason = yt_error_reason(r)
+            if r.status_code == 403 and reason in ("quotaExceeded", "dailyLimitExceeded"):
+                KEYS.retire(k); continue
             if r.status_code in (403, 429, 503):
-                rotate_key(); time.sleep(min(60, 2 ** attempt)); continue
+                wait = retry_after(r)
+                KEYS.cool(k, wait if wait is not None else min(60, 2 ** attempt))
+                attempt += 1; continue
             r.raise_for_status()
         except requests.RequestException:
-            time.sleep(min(60, 2 ** attempt)); continue
+            time.sleep(min(60, 2 ** attempt))
+        attempt += 1
+    observe("api", f"yt.{path}", time.perf_counter() - t0, True, max(0, tries - 1))
     fail("YOUTUBE_API", path)
 
+def plan_budget(st, wanted):
+    """
+    Number of playlists today's remaining quota and TIME_BUDGET_MIN can cover, using
+    the units and seconds per playlist measured on earlier runs (YT_UNITS_PER_PLAYLIST
+    and no time limit until there is history). Shards sharing keys get an equal
+    share of what is left on them.
+    """
+    q = st.get("quota") or {}
+    per = float(q.get("units_per_playlist") or YT_UNITS_PER_PLAYLIST)
+    left = KEYS.remaining()
+    if KEYS_SHARED:
+        print(f"INFO[QUOTA_SHARED]: {len(KEYS.keys)} keys for {SHARD_COUNT} shards; "
+              f"budgeting 1/{SHARD_COUNT} of remaining={left}")
+        left //= SHARD_COUNT
+    cap = int(left // max(per, 0.1))
+    secs = q.get("seconds_per_playlist")
+    if secs:
+        # PACK_PLAYLISTS playlists are processed side by side
+        cap = min(cap, int(TIME_BUDGET_MIN * 60 * PACK_PLAYLISTS // max(float(secs), 0.1)))
+    print(f"INFO[QUOTA_BUDGET]: day={KEYS.day} remaining={left} units/playlist={per:.1f} "
+          f"s/playlist={secs or '-'} cap={cap} wanted={wanted}")
+    return min(wanted, cap)
+
+def quota_state(st):
+    """KEYS.dump() plus the run averages (units/seconds per playlist) already in st["quota"]."""
+    q = KEYS.dump()
+    q.update({k: v for k, v in (st.get("quota") or {}).items() if k not in q})
+    return q
+
+def record_quota(st, playlists_done):
+    q = quota_state(st)
+    prev = st.get("quota") or {}
+    if playlists_done:
+        per = KEYS.run_units / playlists_done
+        q["units_per_playlist"] = round(per if prev.get("units_per_playlist") is None
+                                        else 0.7 * prev["units_per_playlist"] + 0.3 * per, 2)
+        with METRICS_LOCK:
+            took = [m["s"] for m in METRICS["playlists"].values()]
+        if took:
+            per = sum(took) / len(took)
+            q["seconds_per_playlist"] = round(per if prev.get("seconds_per_playlist") is None
+                                              else 0.7 * prev["seconds_per_playlist"] + 0.3 * per, 2)
+    st["quota"] = q
+    print(f"INFO[QUOTA]: units={KEYS.run_units} rotations={KEYS.rotations} retired={len(KEYS.retired)}")
+
+# ---------- refresh scheduling ----------
+# st["activity"][playlistId] = {"at": last scan (UTC ISO), "new": new videos per day,
+# "churn": view growth of known videos per day (0.1 = 10%), "views", "units": per scan}
+
+def refresh_rate(a):
+    """Expected value of a scan per elapsed day, in new-video equivalents."""
+    return a.get("new", 0) + REFRESH_STATS_WEIGHT * a.get("churn", 0)
+
+def schedule(st, playlists, limit):
+    """
+    Up to `limit` playlists for this run, most valuable first. Playlists are due
+    once 1/refresh_rate days have passed (clamped to REFRESH_MIN_DAYS..MAX_DAYS);
+    due ones are ranked by expected value per quota unit. Never-scanned playlists go
+    first and REFRESH_COVER_SHARE of the rest of the run to the longest overdue, so
+    the whole source list is covered even when busy channels could fill the run alone.
+    """
+    today = dt.datetime.utcnow().date()
+    act = st.get("activity") or {}
+    per = float((st.get("quota") or {}).get("units_per_playlist") or YT_UNITS_PER_PLAYLIST)
+    fresh, overdue, ranked = [], [], []
+    for i, pid in enumerate(playlists):
+        a = act.get(pid)
+        if not a:
+            fresh.append(pid)
+            continue
+        days = (today - dt.date.fromisoformat(a["at"][:10])).days
+        rate = refresh_rate(a)
+        interval = min(REFRESH_MAX_DAYS, max(REFRESH_MIN_DAYS, 1 / rate if rate > 0 else REFRESH_MAX_DAYS))
+        if days < interval:
+            continue
+        if days >= REFRESH_MAX_DAYS:
+            overdue.append((-days, i, pid))
+        ranked.append((-rate * days / max(a.get("units") or per, 1), i, pid))
+    # a first scan brings in the whole window, so unscanned playlists come first
+    picked = fresh[:limit]
+    stale = [pid for _, _, pid in sorted(overdue)]
+    n = math.ceil((limit - len(picked)) * REFRESH_COVER_SHARE)
+    picked += stale[:n]
+    seen = set(picked)
+    for pid in [pid for _, _, pid in sorted(ranked)] + stale[n:]:
+        if len(picked) >= limit:
+            break
+        if pid not in seen:
+            picked.append(pid); seen.add(pid)
+    print(f"INFO[SCHEDULE]: candidates={len(playlists)} due={len(ranked) + len(fresh)} "
+          f"never_scanned={len(fresh)} overdue={len(overdue)} picked={len(picked)} limit={limit}")
+    return picked
+
+def record_activity(st, playlist_id, new, known_views, views, units):
+    """Fold one scan into the playlist's activity averages."""
+    now = dt.datetime.utcnow().replace(microsecond=0)
+    with ST_LOCK:
+        acts = st.setdefault("activity", {})
+        a = acts.get(playlist_id)
+        if a is None:
+            # the first scan lists the whole window
+            acts[playlist_id] = {"at": now.isoformat() + "Z", "new": round(new / WINDOW_DAYS, 4),
+                                 "churn": 0.0, "views": views, "units": round(units, 2)}
+            return
+        days = max((now - dt.datetime.fromisoformat(a["at"].rstrip("Z"))).total_seconds() / 86400, 1 / 24)
+        mix = lambda old, x: round(ACTIVITY_ALPHA * x + (1 - ACTIVITY_ALPHA) * (old or 0), 4)
+        a["new"] = mix(a.get("new"), new / days)
+        if a.get("views") and known_views:
+            a["churn"] = mix(a.get("churn"), max(0, known_views - a["views"]) / a["views"] / days)
+        a["views"] = views
+        a["units"] = round(mix(a.get("units"), units), 2)
+        a["at"] = now.isoformat() + "Z"
+
+ISO_DURATION = re.compile(r'PT(?:(\d+)H)?(?:(\d+)M)?(?:(\d+)S)?')
+
 def iso_to_sec(s):
     if not s:
         return None
-    m = re.fullmatch(r'PT(?:(\d+)H)?(?:(\d+)M)?(?:(\d+)S)?', s)
+    m = ISO_DURATION.fullmatch(s)
     if not m:
         return None
     h = int(m.group(1) or 0); mnt = int(m.group(2) or 0); sec = int(m.group(3) or 0)
     return h * 3600 + mnt * 60 + sec
 
-def list_since(playlist_id, since_iso, limit_annual=1001):
-    out = []; page = None
+def project_annual(items, since_iso):
+    """
+    Videos per window extrapolated from one full page of playlist items, or None
+    when the page already reaches past since_iso (the real count is then known).
+    """
+    pas = [it["contentDetails"].get("videoPublishedAt") for it in items]
+    pas = [x for x in pas if x]
+    if len(pas) < 50 or min(pas) < since_iso:
+        return None
+    now = dt.datetime.now(dt.timezone.utc)
+    oldest = dt.datetime.fromisoformat(min(pas).replace("Z", "+00:00"))
+    start = dt.datetime.fromisoformat(since_iso.replace("Z", "+00:00"))
+    span = max((now - oldest).total_seconds(), 86400.0)
+    return int(len(pas) * (now - start).total_seconds() / span)
+
+def list_since(playlist_id, since_iso, limit_annual=ANNUAL_LIMIT, known=None, head_etag=None, project=False):
+    """
+    Page the uploads playlist newest-first and collect videos published since since_iso.
+    Paging stops at the first video already in `known` (incremental mode); if the
+    first page's etag equals head_etag nothing was added and no further pages are read.
+    With project=True, a first page whose publish rate extrapolates past the cap
+    ends the scan before deep paging.
+    Returns ({videoId: videoPublishedAt}, first page etag, projected count or None);
+    the dict is None when the playlist reaches or is projected past limit_annual.
+    """
+    out = {}; page = None; etag = None; projected = None
+    known = known or {}
     while True:
         js = yt_get("playlistItems", {
             "part": "contentDetails", "maxResults": 50, "playlistId": playlist_id,
             **({"pageToken": page} if page else {})
         }, 1)
         items = js.get("items", [])
+        if etag is None:
+            etag = js.get("etag") or ""
+            if head_etag and etag == head_etag:
+                break
+            if project:
+                projected = project_annual(items, since_iso)
+                if projected is not None and projected >= limit_annual * OVERFLOW_MARGIN:
+                    return None, etag, projected
         if not items:
             break
         stop = False
@@ -295,10 +930,12 @@ def list_since(playlist_id, since_iso, limit_annual=1001):
             pa = it["contentDetails"].get("videoPublishedAt")
             if not pa:
                 continue
-            if pa >= since_iso:
-                out.append(v)
+            if v in known:
+                stop = True
+            elif pa >= since_iso:
+                out[v] = pa
                 if len(out) >= limit_annual:
-                    return []
+                    return None, etag, len(out)
             else:
                 stop = True
         if stop:
@@ -306,46 +943,93 @@ def list_since(playlist_id, since_iso, limit_annual=1001):
         page = js.get("nextPageToken")
         if not page:
             break
-    return out
-
-FIELDS = ",".join([
-    "items(id,",
-    "snippet(publishedAt,title,tags,categoryId,defaultLanguage,defaultAudioLanguage),",
-    "contentDetails(duration,licensedContent),",
-    "status(madeForKids,selfDeclaredMadeForKids),",
-    "statistics(viewCount,likeCount,commentCount),",
-    "topicDetails(topicCategories),",
-    "paidProductPlacementDetails(hasPaidProductPlacement))",
-])
+    return out, etag, projected
+
+# HEADERS column -> (videos.list part, field) it is filled from
+VIDEO_FIELD_SOURCES = {
+    "publishedAt": ("snippet", "publishedAt"),
+    "title": ("snippet", "title"),
+    "duration_s": ("contentDetails", "duration"),
+    "viewCount": ("statistics", "viewCount"),
+    "likeCount": ("statistics", "likeCount"),
+    "commentCount": ("statistics", "commentCount"),
+    "categoryId": ("snippet", "categoryId"),
+    "defaultLanguage": ("snippet", "defaultLanguage"),
+    "topicCategories_ru": ("topicDetails", "topicCategories"),
+    "hasPaidProductPlacement": ("paidProductPlacementDetails", "hasPaidProductPlacement"),
+}
+
+def video_parts_and_fields(columns):
+    parts = {}
+    for col in columns:
+        if col in VIDEO_FIELD_SOURCES:
+            part, field = VIDEO_FIELD_SOURCES[col]
+            parts.setdefault(part, []).append(field)
+    mask = ",".join(f"{p}({','.join(f)})" for p, f in parts.items())
+    return ",".join(parts), f"items(id,{mask})"
+
+VIDEO_PARTS, FIELDS = video_parts_and_fields(HEADERS)
+DURATION_FIELDS = "items(id,contentDetails(duration))"
+
+def classify_shorts(st, ids, published):
+    """
+    Phase one of the two-phase fetch: durations only, for IDs with no verdict yet.
+    Shorts are remembered in st["shorts"] as videoId -> publishedAt (from `published`)
+    until they leave the window; videos already placed in a chunk doc are known not
+    to be Shorts. Returns the IDs that are not Shorts.
+    """
+    with ST_LOCK:
+        shorts = st.setdefault("shorts", {})
+        todo = [v for v in ids if v not in shorts and locate_video(v) is None]
+    found = VIDEOS.get("durations", todo) if todo else []
+    with ST_LOCK:
+        for vid, d in found:
+            if d is not None and d <= SHORTS_LIMIT:
+                shorts[vid] = published.get(vid, "")
+        return [v for v in ids if v not in shorts]
+
+def prune_shorts(st, since_iso):
+    """
+    Forget Shorts published before since_iso, which listings no longer return.
+    Older states kept a duration instead of the date: those entries take the date
+    from the scan state, or are dropped.
+    """
+    with ST_LOCK:
+        shorts = st.get("shorts") or {}
+        legacy = [v for v, pa in shorts.items() if not isinstance(pa, str)]
+        if legacy:
+            seen = {v: pa for ps in (st.get("playlists") or {}).values() for v, pa in (ps.get("videos") or {}).items()}
+            for v in legacy:
+                shorts[v] = seen.get(v, "")
+        keep = {v: pa for v, pa in shorts.items() if pa >= since_iso}
+        st["shorts"] = keep
+    if len(keep) < len(shorts):
+        print(f"INFO[SHORTS_PRUNE]: dropped={len(shorts) - len(keep)} kept={len(keep)}")
+
+def fetch_durations(ids):
+    """[(videoId, seconds)] for up to 50 IDs."""
+    js = yt_get("videos", {"part": "contentDetails", "id": ",".join(ids), "fields": DURATION_FIELDS}, 1)
+    items = js.get("items", [])
+    return [(it.get("id"), iso_to_sec(it.get("contentDetails", {}).get("duration"))) for it in items]
 
 def fetch_videos(ids):
     out = []
     for i in range(0, len(ids), 50):
         batch = ",".join(ids[i:i+50])
-        js = yt_get("videos", {
-            "part": "snippet,contentDetails,statistics,status,topicDetails,paidProductPlacementDetails",
-            "id": batch, "fields": FIELDS
-        }, 1)
+        js = yt_get("videos", {"part": VIDEO_PARTS, "id": batch, "fields": FIELDS}, 1)
         for it in js.get("items", []):
             sn = it.get("snippet", {})
             cd = it.get("contentDetails", {})
-            st = it.get("status", {})
             stt = it.get("statistics", {})
             td = it.get("topicDetails", {})
             pp = it.get("paidProductPlacementDetails", {})
-            dur = iso_to_sec(cd.get("duration"))
             rec = {
                 "videoId": it.get("id"),
                 "publishedAt": sn.get("publishedAt"),
                 "title": sn.get("title"),
-                "tags": sn.get("tags", []),
                 "categoryId": sn.get("categoryId"),
                 "defaultLanguage": sn.get("defaultLanguage"),
-                "defaultAudioLanguage": sn.get("defaultAudioLanguage"),
-                "duration_s": dur,
-                "licensedContent": cd.get("licensedContent"),
-                "madeForKids": st.get("madeForKids"),
-                "selfDeclaredMadeForKids": st.get("selfDeclaredMadeForKids"),
+                "duration": cd.get("duration"),
                 "viewCount": stt.get("viewCount"),
                 "likeCount": stt.get("likeCount"),
                 "commentCount": stt.get("commentCount"),
@@ -355,45 +1039,202 @@ def fetch_videos(ids):
             out.append(rec)
     return out
 
+STATS_FIELDS = "items(id,statistics(viewCount,likeCount,commentCount))"
+
+def fetch_stats(ids):
+    """
+    Counts only, for videos whose static columns are already in a chunk doc.
+    Returns [(videoId, [viewCount, likeCount, commentCount])].
+    """
+    out = []
+    for i in range(0, len(ids), 50):
+        batch = ",".join(ids[i:i+50])
+        js = yt_get("videos", {"part": "statistics", "id": batch, "fields": STATS_FIELDS}, 1)
+        for it in js.get("items", []):
+            stt = it.get("statistics", {})
+            out.append((it.get("id"), [stt.get("viewCount") or "", stt.get("likeCount") or "",
+                                       stt.get("commentCount") or ""]))
+    return out
+
+class VideoBatcher:
+    """
+    Run-wide packing of videos.list calls. Playlists in flight hand their IDs to
+    get(); IDs are deduplicated across playlists and sent 50 per request, and each
+    playlist gets back the items it asked for. A partial request goes out only once
+    every playlist in flight is waiting here, i.e. nobody could still fill it up.
+    The waiting threads themselves send the requests; a failed request fails only
+    the get() calls that asked for its IDs.
+    """
+
+    def __init__(self, kinds):
+        self.kinds = kinds          # kind -> (fetch(ids) -> items, item -> videoId)
+        self.cond = threading.Condition()
+        self.queued = {k: {} for k in kinds}
+        self.entries = {}           # (kind, videoId) -> [done, item, units, waiters, error]
+        self.active = 0
+        self.waiting = 0
+        self.stats = {"requests": 0, "ids": 0, "shared": 0}
+
+    @contextmanager
+    def producer(self):
+        """Marks the calling thread as a playlist that may still add IDs."""
+        with self.cond:
+            self.active += 1
+        try:
+            yield
+        finally:
+            with self.cond:
+                self.active -= 1
+                self.cond.notify_all()
+
+    def get(self, kind, ids):
+        """Items for `ids` (videos.list drops unknown IDs), blocking until all are resolved."""
+        ids = list(dict.fromkeys(ids))
+        with self.cond:
+            for v in ids:
+                e = self.entries.get((kind, v))
+                if e is None:
+                    e = self.entries[(kind, v)] = [False, None, 0.0, 0, None]
+                    self.queued[kind][v] = None
+                else:
+                    self.stats["shared"] += 1
+                e[3] += 1
+            self.cond.notify_all()
+            self.waiting += 1
+            try:
+                while not all(self.entries[(kind, v)][0] for v in ids):
+                    batch = self._claim()
+                    if batch is None:
+                        self.cond.wait()
+                        continue
+                    self.waiting -= 1
+                    self.cond.release()
+                    try:
+                        self._send(*batch)
+                    finally:
+                        self.cond.acquire()
+                        self.waiting += 1
+            finally:
+                self.waiting -= 1
+            out = []; units = 0.0; error = None
+            for v in ids:
+                e = self.entries[(kind, v)]
+                units += e[2]
+                if e[1] is not None:
+                    out.append(e[1])
+                error = error or e[4]
+                e[3] -= 1
+                if not e[3]:
+                    del self.entries[(kind, v)]
+        PL_LOCAL.units = getattr(PL_LOCAL, "units", 0) + units
+        if error is not None:
+            raise error
+        return out
+
+    def _claim(self):
+        for kind, q in self.queued.items():
+            if len(q) >= 50 or (q and self.waiting >= self.active):
+                batch = list(itertools.islice(q, 50))
+                for v in batch:
+                    del q[v]
+                return kind, batch
+        return None
+
+    def _send(self, kind, batch):
+        fetch, key = self.kinds[kind]
+        before = getattr(PL_LOCAL, "units", 0)
+        try:
+            items = {key(it): it for it in fetch(batch)}
+        except BaseException as e:
+            # raised by get() in every playlist waiting for these IDs
+            with self.cond:
+                for v in batch:
+                    ent = self.entries[(kind, v)]
+                    ent[0], ent[4] = True, e
+                self.cond.notify_all()
+            return
+        finally:
+            # the requesting playlists are charged their share in get()
+            spent, PL_LOCAL.units = getattr(PL_LOCAL, "units", 0) - before, before
+        with self.cond:
+            self.stats["requests"] += 1; self.stats["ids"] += len(batch)
+            for v in batch:
+                e = self.entries[(kind, v)]
+                e[0], e[1], e[2] = True, items.get(v), spent / len(batch)
+            self.cond.notify_all()
+
+VIDEOS = VideoBatcher({
+    "durations": (fetch_durations, lambda it: it[0]),
+    "records":   (fetch_videos, lambda it: it["videoId"]),
+    "stats":     (fetch_stats, lambda it: it[0]),
+})
+
 def fmt_baku(iso_str):
     if not iso_str:
         return ""
     dt_utc = dt.datetime.fromisoformat(iso_str.replace("Z", "+00:00"))
     dt_loc = dt_utc.astimezone(BAKU_TZ)
-    return dt_loc.strftime("%d.%m.%Y %H:%M:%S")
+    return dt_loc.strftime(BAKU_FMT)
+
+def record_rows(recs, playlist_id, channel_title, topic_ru_map, now_loc):
+    """
+    videos.list records -> full HEADERS rows, Shorts dropped.
+    """
+    rows = []
+    for r in recs:
+        d = iso_to_sec(r.get("duration"))
+        if d is not None and d <= SHORTS_LIMIT:
+            continue
+        ru = [topic_ru_map[u] for u in r.get("topicCategories", []) if u in topic_ru_map]
+        rows.append([
+            r.get("videoId") or "",
+            playlist_id,
+            channel_title or "",
+            fmt_baku(r.get("publishedAt") or ""),
+            r.get("title") or "",
+            d if d is not None else "",
+            "FALSE",
+            r.get("viewCount") or "",
+            r.get("likeCount") or "",
+            r.get("commentCount") or "",
+            r.get("categoryId") or "",
+            r.get("defaultLanguage") or "",
+            ", ".join(ru),
+            "TRUE" if r.get("hasPaidProductPlacement") else "FALSE",
+            now_loc,
+            now_loc,
+            "FALSE",
+            "",
+        ])
+    return rows
 
 # ---------- writing rows ----------
 
-HEADERS = [
-    "videoId","playlistId","channelTitle","publishedAt","title","duration_s","isShorts",
-    "viewCount","likeCount","commentCount","categoryId","defaultLanguage","topicCategories_ru",
-    "hasPaidProductPlacement","firstSeenAt","lastUpdatedAt","isTombstoned","tombstoneReason"
-]
-INDEX_HEADERS = ["playlistId","docId","docName","lastScanAt","rowsInDoc"]
+# columns of the stats-only refresh: viewCount..commentCount and lastUpdatedAt
+STATS_SLICE    = slice(HEADERS.index("viewCount"), HEADERS.index("commentCount") + 1)
+UPDATED_IDX    = HEADERS.index("lastUpdatedAt")
+VIEW_IDX       = HEADERS.index("viewCount")
+TOMB_SLICE     = slice(HEADERS.index("isTombstoned"), HEADERS.index("tombstoneReason") + 1)
 
 def ensure_tab(spreadsheet_id, tab_name):
-    svc = build_sheets_service()
-    meta = svc.spreadsheets().get(spreadsheetId=spreadsheet_id).execute()
-    sheets = meta.get("sheets", [])
-    ids = {sh["properties"]["title"]: sh["properties"]["sheetId"] for sh in sheets}
+    if (spreadsheet_id, tab_name) in CONFIRMED_TABS:
+        return
+    _ensure_tab(spreadsheet_id, tab_name)
+    CONFIRMED_TABS.add((spreadsheet_id, tab_name))
+
+@instrumented("sheets.ensureTab")
+def _ensure_tab(spreadsheet_id, tab_name):
+    meta = sheets.get(spreadsheet_id, fields="sheets(properties(sheetId,title))", retries=GAPI_RETRIES)
+    ids = {sh["properties"]["title"]: sh["properties"]["sheetId"] for sh in meta.get("sheets", [])}
     if tab_name in ids:
         return
     if len(ids) == 1 and "Sheet1" in ids:
         req = {"requests": [{"updateSheetProperties": {
             "properties": {"sheetId": ids["Sheet1"], "title": tab_name}, "fields": "title"}}]}
-        svc.spreadsheets().batchUpdate(spreadsheetId=spreadsheet_id, body=req).execute()
+        sheets.batch_update(spreadsheet_id, req, retries=GAPI_RETRIES)
     else:
         req = {"requests": [{"addSheet": {"properties": {"title": tab_name}}}]}
-        svc.spreadsheets().batchUpdate(spreadsheetId=spreadsheet_id, body=req).execute()
-
-def ensure_header(spreadsheet_id, tab_name="videos"):
-    ensure_tab(spreadsheet_id, tab_name)
-    vals = sheets_values_get(spreadsheet_id, a1(tab_name, "1:1"))
-    if not vals or not vals[0]:
-        sheets_values_batch_update(spreadsheet_id, [{"range": a1(tab_name, "A1:R1"), "values": [HEADERS]}]); return
-    cur = vals[0]; need = HEADERS
-    if len(cur) < len(need) or cur[:len(need)] != need:
-        sheets_values_batch_update(spreadsheet_id, [{"range": a1(tab_name, "A1:R1"), "values": [need]}])
+        sheets.batch_update(spreadsheet_id, req, retries=GAPI_RETRIES)
 
 def ensure_index_sheet():
     name = "VideosIndex"
@@ -406,14 +1247,6 @@ def ensure_index_sheet():
         sheets_values_batch_update(fid, [{"range": a1("index", "A1:E1"), "values": [INDEX_HEADERS]}])
     return fid
 
-def read_existing_video_ids(spreadsheet_id, tab_name="videos"):
-    out = {}
-    col = sheets_values_get(spreadsheet_id, a1(tab_name, "A2:A"))
-    for i, row in enumerate(col, start=2):
-        if row and row[0]:
-            out[row[0]] = i
-    return out
-
 def read_index_map(index_id):
     out = {}
     col = sheets_values_get(index_id, a1("index", "A2:A"))
@@ -422,144 +1255,1123 @@ def read_index_map(index_id):
             out[row[0]] = i
     return out
 
-def batch_update_rows(spreadsheet_id, updates):
-    data = []
+# write planning: adjacent rows become one multi-row range, ranges are packed into
+# values.batchUpdate calls of at most WRITE_BATCH_BYTES
+MAX_RANGE_ROWS = 1000
+WRITE_BATCH_BYTES = 2_000_000
+
+def row_runs(updates):
+    """
+    [(row, values)] -> [(first row, [values, ...])], sorted by row with runs of adjacent
+    rows merged. A row listed twice keeps its last values.
+    """
+    by_row = {}
     for row_idx, vals in updates:
-        rng = f"A{row_idx}:R{row_idx}"
-        data.append({"range": a1("videos", rng), "values": [vals]})
-    if data:
-        sheets_values_batch_update(spreadsheet_id, data)
-
-def append_rows(spreadsheet_id, rows):
-    if rows:
-        sheets_values_append(spreadsheet_id, a1("videos", "A1"), rows)
+        by_row[row_idx] = vals
+    runs = []
+    start = None; run = []
+    for row_idx in sorted(by_row):
+        if run and row_idx == start + len(run) and len(run) < MAX_RANGE_ROWS:
+            run.append(by_row[row_idx]); continue
+        if run:
+            runs.append((start, run))
+        start = row_idx; run = [by_row[row_idx]]
+    if run:
+        runs.append((start, run))
+    return runs
+
+def plan_ranges(tab, col_from, col_to, updates):
+    """[(row, values)] -> ValueRange list, one per run of adjacent rows."""
+    return [{"range": a1(tab, f"{col_from}{start}:{col_to}{start + len(run) - 1}"), "values": run}
+            for start, run in row_runs(updates)]
+
+def write_ranges(spreadsheet_id, data):
+    batch = []; size = 0
+    for vr in data:
+        n = len(json.dumps(vr["values"], ensure_ascii=False)) + len(vr["range"]) + 32
+        if batch and size + n > WRITE_BATCH_BYTES:
+            sheets_values_batch_update(spreadsheet_id, batch)
+            batch = []; size = 0
+        batch.append(vr); size += n
+    if batch:
+        sheets_values_batch_update(spreadsheet_id, batch)
+
+# chunk docs are written with spreadsheets.batchUpdate: one call carries the tab and
+# header setup, every changed range and the new rows of a doc, and the grid is grown
+# ahead of the rows in GRID_GROW_ROWS steps instead of by each append
+DOC_GRIDS = {}  # doc_id -> {"sheetId", "rows", "cols", "setup": requests for the first write this run}
+
+def cell_data(v):
+    # what values.batchUpdate with RAW would store; "" clears the cell
+    if v is None or v == "":
+        return {}
+    if isinstance(v, bool):
+        return {"userEnteredValue": {"boolValue": v}}
+    if isinstance(v, (int, float)):
+        return {"userEnteredValue": {"numberValue": v}}
+    return {"userEnteredValue": {"stringValue": str(v)}}
+
+def cells_request(sheet_id, row, col, rows):
+    """updateCells for a block whose top-left cell is (sheet row, 0-based column)."""
+    return {"updateCells": {"start": {"sheetId": sheet_id, "rowIndex": row - 1, "columnIndex": col},
+                            "rows": [{"values": [cell_data(v) for v in r]} for r in rows],
+                            "fields": "userEnteredValue"}}
+
+def new_doc_grid():
+    # a spreadsheet created through Drive starts with one 1000x26 "Sheet1", sheetId 0
+    return {"sheetId": 0, "rows": 1000, "cols": 26,
+            "setup": [{"updateSheetProperties": {"properties": {"sheetId": 0, "title": "videos"}, "fields": "title"}},
+                      cells_request(0, 1, 0, [HEADERS])]}
+
+def doc_grid(doc_id):
+    """
+    The doc's "videos" tab, read once per run. A missing tab is planned as a rename of
+    the default Sheet1 or an addSheet; the header is rewritten on the first write.
+    """
+    g = DOC_GRIDS.get(doc_id)
+    if g is not None:
+        return g
+    meta = sheets_meta(doc_id, "sheets(properties(sheetId,title,gridProperties(rowCount,columnCount)))")
+    props = {p["title"]: p for p in (sh["properties"] for sh in meta.get("sheets", []))}
+    setup = []
+    if "videos" in props:
+        p = props["videos"]
+    elif list(props) == ["Sheet1"]:
+        p = props["Sheet1"]
+        setup.append({"updateSheetProperties": {"properties": {"sheetId": p["sheetId"], "title": "videos"},
+                                                "fields": "title"}})
+    else:
+        p = {"sheetId": max((q["sheetId"] for q in props.values()), default=0) + 1,
+             "gridProperties": {"rowCount": 1000, "columnCount": 26}}
+        setup.append({"addSheet": {"properties": dict(p, title="videos")}})
+    gp = p.get("gridProperties", {})
+    setup.append(cells_request(p["sheetId"], 1, 0, [HEADERS]))
+    g = DOC_GRIDS[doc_id] = {"sheetId": p["sheetId"], "rows": gp.get("rowCount", 1000),
+                             "cols": gp.get("columnCount", 26), "setup": setup}
+    return g
+
+def compile_doc_write(grid, spans, appends, start):
+    """
+    Pending writes of one doc -> spreadsheets.batchUpdate requests: the first-write
+    setup, grid growth, then updateCells for each (row, column, rows) span and for the
+    new rows at `start`. Returns (requests, rows added to the grid).
+    """
+    sid = grid["sheetId"]
+    reqs = list(grid["setup"])
+    grow = 0
+    if appends and start + len(appends) - 1 > grid["rows"]:
+        grow = max(start + len(appends) - 1 - grid["rows"], GRID_GROW_ROWS)
+        reqs.append({"appendDimension": {"sheetId": sid, "dimension": "ROWS", "length": grow}})
+    if grid["cols"] < len(HEADERS):
+        reqs.append({"appendDimension": {"sheetId": sid, "dimension": "COLUMNS", "length": len(HEADERS) - grid["cols"]}})
+    reqs += [cells_request(sid, row, col, rows) for row, col, rows in spans]
+    for i in range(0, len(appends), MAX_RANGE_ROWS):
+        reqs.append(cells_request(sid, start + i, 0, appends[i:i + MAX_RANGE_ROWS]))
+    return reqs, grow
+
+def write_doc(doc_id, spans=(), appends=()):
+    """
+    Apply a doc's writes, normally as one batchUpdate (split only past
+    WRITE_BATCH_BYTES). New rows go right after the last indexed row; returns it.
+    """
+    grid = doc_grid(doc_id)
+    with ST_LOCK:
+        start = VX["docs"].get(doc_id, {}).get("last", 1) + 1
+    reqs, grow = compile_doc_write(grid, spans, appends, start)
+    batch = []; size = 0
+    for req in reqs:
+        n = len(json.dumps(req, ensure_ascii=False))
+        if batch and size + n > WRITE_BATCH_BYTES:
+            sheets_batch_update(doc_id, batch)
+            batch = []; size = 0
+        batch.append(req); size += n
+    if batch:
+        sheets_batch_update(doc_id, batch)
+    grid["setup"] = []; grid["rows"] += grow; grid["cols"] = max(grid["cols"], len(HEADERS))
+    return start
 
 def update_index(index_id, items):
-    now = dt.datetime.now(BAKU_TZ).strftime("%d.%m.%Y %H:%M:%S")
-    existing = read_index_map(index_id)
-    updates = []; appends = []
+    """
+    Upsert VideosIndex rows. The playlistId -> row map is read once per run and
+    kept current from the append responses. Items without lastScanAt (index_patch)
+    leave that column of an existing row alone.
+    """
+    global INDEX_ROWS
+    now = now_baku()
+    if INDEX_ROWS is None:
+        INDEX_ROWS = read_index_map(index_id)
+    existing = INDEX_ROWS
+    updates = []; patches = []; appends = []
     for it in items:
-        row = [it["playlistId"], it["docId"], it["docName"], now, str(it.get("rowsInDoc", ""))]
+        row = [it["playlistId"], it["docId"], it["docName"], it.get("lastScanAt") or now, str(it.get("rowsInDoc", ""))]
         if it["playlistId"] in existing:
             idx = existing[it["playlistId"]]
-            updates.append((idx, row))
+            if it.get("lastScanAt"):
+                updates.append((idx, row))
+            else:
+                patches.append((idx, row))
         else:
             appends.append(row)
-    data = []
-    for row_idx, vals in updates:
-        data.append({"range": a1("index", f"A{row_idx}:E{row_idx}"), "values": [vals]})
-    if data:
-        sheets_values_batch_update(index_id, data)
+    if updates or patches:
+        write_ranges(index_id, plan_ranges("index", "A", "E", updates)
+                     + plan_ranges("index", "A", "C", [(i, r[:3]) for i, r in patches])
+                     + plan_ranges("index", "E", "E", [(i, r[4:]) for i, r in patches]))
     if appends:
-        sheets_values_append(index_id, a1("index", "A1"), appends)
+        r = sheets_values_append(index_id, a1("index", "A1"), appends) or {}
+        m = re.search(r"![A-Z]+(\d+)", r.get("updates", {}).get("updatedRange", ""))
+        if m:
+            for i, row in enumerate(appends):
+                existing[row[0]] = int(m.group(1)) + i
+        else:
+            INDEX_ROWS = None
+
+def queue_index(item):
+    with ST_LOCK:
+        INDEX_PENDING[item["playlistId"]] = item
+
+def index_patch(playlist_id, **cols):
+    # doc columns only: a row already queued by this run keeps its lastScanAt
+    with ST_LOCK:
+        item = INDEX_PENDING.get(playlist_id) or {"playlistId": playlist_id, "lastScanAt": None}
+        INDEX_PENDING[playlist_id] = dict(item, **cols)
+
+def flush_index(index_id):
+    if SHARDED:
+        return  # pending rows travel in the state fragment; the merge job writes them
+    with doc_lock(index_id):
+        with ST_LOCK:
+            items = list(INDEX_PENDING.values())
+            INDEX_PENDING.clear()
+        if items:
+            update_index(index_id, items)
+            print(f"INFO[INDEX_FLUSH]: rows={len(items)}")
 
 # ---------- state in Drive ----------
 
+def load_state_file(name):
+    text = drive_read_state_text(name)
+    if text is None:
+        return None
+    try:
+        return json.loads(text)
+    except Exception:
+        fail("STATE_PARSE", f"invalid json in {name}")
+
 def load_state():
-    name = "chunks_state.json"
-    fid = drive_find_file_by_name(name, CHUNKS_FOLDER_ID)
-    if not fid:
+    """
+    chunks_state.json, or in a sharded run this shard's fragment when it was written
+    by an earlier attempt of the same workflow run.
+    """
+    if SHARDED:
+        frag = load_state_file(shard_name(STATE_NAME))
+        if frag and RUN_ID and frag.get("run_id") == RUN_ID:
+            print(f"INFO[SHARD]: resuming from {shard_name(STATE_NAME)}")
+            INDEX_PENDING.update(frag.get("index_pending", {}))
+            return frag
+    st = load_state_file(STATE_NAME)
+    if st is None:
         st = {"docs": [], "playlist_to_doc": {}}
-        drive_overwrite_text(name, CHUNKS_FOLDER_ID, json.dumps(st, ensure_ascii=False))
-        return st
-    text = drive_download_text(fid)
+        if not SHARDED:
+            drive_write_state_text(STATE_NAME, json.dumps(st, ensure_ascii=False))
+    st.pop("index_pending", None)
+    return st
+
+def snapshot(obj, depth=3):
+    """
+    Copy of the containers in the top `depth` levels of st, enough to serialize it
+    while workers go on: deeper objects (a committed scan's videos, a key's tally)
+    are replaced, never changed in place.
+    """
+    if depth and isinstance(obj, dict):
+        return {k: snapshot(v, depth - 1) for k, v in obj.items()}
+    if depth and isinstance(obj, list):
+        return [snapshot(v, depth - 1) for v in obj]
+    return obj
+
+def save_state(st):
+    """Write chunks_state.json (or this shard's fragment); returns its size in bytes."""
+    with ST_LOCK:
+        if SHARDED:
+            st["run_id"] = RUN_ID
+            st["shard"] = SHARD_INDEX
+            st.setdefault("index_pending", {}).update(INDEX_PENDING)
+        snap = snapshot(st)
+    text = json.dumps(snap, ensure_ascii=False, separators=(",", ":"))
+    drive_write_state_text(shard_name(STATE_NAME) if SHARDED else STATE_NAME, text)
+    return len(text)
+
+def start_progress(st):
+    """
+    Progress cursor for today's run in st["progress"]. With RESUME, an unfinished
+    run from the same day is continued and its finished playlists are returned.
+    """
+    day = dt.datetime.utcnow().date().isoformat()
+    pr = st.get("progress") or {}
+    if RESUME and pr.get("day") == day and not pr.get("complete"):
+        print(f"INFO[RESUME]: {len(pr.get('done', []))} playlists already done today")
+    else:
+        pr = {"day": day, "done": [], "complete": False}
+    st["progress"] = pr
+    return set(pr["done"])
+
+def mark_done(st, playlist_id, index_id):
+    with ST_LOCK:
+        done = st["progress"]["done"]
+        done.append(playlist_id)
+    if time.monotonic() >= CKPT["next"]:
+        checkpoint(st, index_id, periodic=True)
+
+def checkpoint(st, index_id, periodic=False):
+    with CKPT_LOCK:
+        if periodic and time.monotonic() < CKPT["next"]:
+            return  # another worker just took it
+        t = time.monotonic()
+        with timed("phase", "write"):
+            sync_store()
+        with timed("phase", "index"):
+            flush_index(index_id)
+        with ST_LOCK:
+            st["quota"] = quota_state(st)
+        with timed("phase", "state"):
+            size = save_state(st)
+        with timed("phase", "index"):
+            save_video_index()
+        took = time.monotonic() - t
+        CKPT["next"] = time.monotonic() + max(CHECKPOINT_SECS, 10 * took)
+        print(f"INFO[CHECKPOINT]: done={len(st['progress']['done'])} state={size // 1024}KB took={took:.1f}s")
+
+# ---------- video location index ----------
+
+def _vx_set_doc(doc_id, ids, version):
+    old = VX["docs"].get(doc_id)
+    if old:
+        for v in old["rows"]:
+            if VX["where"].get(v, (None,))[0] == doc_id:
+                VX["where"].pop(v, None)
+    rows = {}
+    for i, v in enumerate(ids, start=2):
+        if v:
+            rows[v] = i
+            VX["where"][v] = (doc_id, i)
+    VX["docs"][doc_id] = {"version": version, "rows": rows, "last": len(ids) + 1}
+
+def _read_video_index(name):
+    text = drive_read_state_text(name)
+    if text is None:
+        return None
     try:
         return json.loads(text)
     except Exception:
-        fail("STATE_PARSE", "invalid json")
+        print(f"WARN[VIDEO_INDEX_PARSE]: rebuilding {name}")
+        return None
 
-def save_state(st):
-    drive_overwrite_text("chunks_state.json", CHUNKS_FOLDER_ID, json.dumps(st, ensure_ascii=False, indent=2))
+def _vx_load(raw, only=None):
+    for doc_id, d in raw.get("docs", {}).items():
+        if only is None or doc_id in only:
+            _vx_set_doc(doc_id, d.get("ids", "").split(",") if d.get("ids") else [], d.get("version"))
+
+def load_video_index():
+    raw = _read_video_index(VIDEO_INDEX_NAME)
+    if raw:
+        _vx_load(raw)
+    if SHARDED:
+        frag = _read_video_index(shard_name(VIDEO_INDEX_NAME))
+        if frag and RUN_ID and frag.get("run_id") == RUN_ID:
+            _vx_load(frag)
+
+def reconcile_video_index(st):
+    # one Drive metadata call per doc; column A is reread only for docs edited since the last save
+    for d in st["docs"]:
+        if SHARDED and doc_shard(d) != SHARD_INDEX:
+            continue
+        ver = drive_file_version(d["id"])
+        cur = VX["docs"].get(d["id"])
+        if cur and cur["version"] == ver:
+            continue
+        col = sheets_values_get(d["id"], a1("videos", "A2:A"))
+        _vx_set_doc(d["id"], [row[0] if row else "" for row in col], ver)
+        VX["dirty"].add(d["id"])
+        print(f"INFO[VIDEO_INDEX_RELOAD]: {d.get('name', d['id'])} rows={len(col)}")
+
+def video_rows(doc_id):
+    """
+    {videoId: row} for a chunk doc, from memory only.
+    """
+    with ST_LOCK:
+        d = VX["docs"].setdefault(doc_id, {"version": None, "rows": {}, "last": 1})
+        return dict(d["rows"])
+
+def video_index_append(doc_id, start_row, ids):
+    with ST_LOCK:
+        d = VX["docs"].setdefault(doc_id, {"version": None, "rows": {}, "last": 1})
+        row = start_row or d["last"] + 1
+        for v in ids:
+            d["rows"][v] = row
+            VX["where"][v] = (doc_id, row)
+            row += 1
+        d["last"] = max(d["last"], row - 1)
+        VX["dirty"].add(doc_id)
+
+def locate_video(video_id):
+    return VX["where"].get(video_id)
+
+def save_video_index():
+    with ST_LOCK:
+        dirty = list(VX["dirty"])
+        VX["dirty"].clear()
+    if not dirty:
+        return
+    # a doc written after its version is read here simply gets reread next run
+    versions = {doc_id: drive_file_version(doc_id) for doc_id in dirty}
+    with ST_LOCK:
+        for doc_id in versions:
+            VX["docs"][doc_id]["version"] = versions[doc_id]
+    write_video_index(shard_name(VIDEO_INDEX_NAME) if SHARDED else VIDEO_INDEX_NAME)
+
+def write_video_index(name):
+    with ST_LOCK:
+        out = {}
+        for doc_id, d in VX["docs"].items():
+            ids = [""] * max(0, d["last"] - 1)
+            for v, row in d["rows"].items():
+                ids[row - 2] = v
+            out[doc_id] = {"version": d["version"], "ids": ",".join(ids)}
+    raw = {"docs": out}
+    if SHARDED:
+        raw["run_id"] = RUN_ID
+    drive_write_state_text(name, json.dumps(raw, separators=(",", ":")))
+
+# ---------- local staging store ----------
+# One row per video with its current cells and the cells last pushed to its chunk doc.
+# write_rows only stages; sync_store sends the cell-level difference to Sheets.
+
+FIRST_SEEN_COL = HEADERS.index("firstSeenAt")
+
+def open_store():
+    global STORE
+    if not STORE_PATH:
+        return
+    os.makedirs(os.path.dirname(STORE_PATH) or ".", exist_ok=True)
+    STORE = sqlite3.connect(STORE_PATH, check_same_thread=False)
+    STORE.execute("PRAGMA journal_mode=WAL")
+    STORE.execute("""CREATE TABLE IF NOT EXISTS videos (
+        video_id TEXT PRIMARY KEY,
+        doc_id   TEXT NOT NULL,
+        row      INTEGER,
+        cells    TEXT NOT NULL,
+        pushed   TEXT
+    )""")
+    STORE.execute("CREATE INDEX IF NOT EXISTS videos_doc ON videos(doc_id)")
+    STORE.commit()
+    n = STORE.execute("SELECT COUNT(*) FROM videos").fetchone()[0]
+    print(f"INFO[STORE]: {STORE_PATH} videos={n}")
+
+def _store_fetch(ids):
+    out = {}
+    for i in range(0, len(ids), 500):
+        part = ids[i:i+500]
+        q = f"SELECT video_id, row, cells, pushed FROM videos WHERE video_id IN ({','.join('?' * len(part))})"
+        for vid, row, cells, pushed in STORE.execute(q, part):
+            out[vid] = (row, json.loads(cells), pushed)
+    return out
+
+def stage_rows(doc_id, rows, stats, dead, updated_at):
+    """
+    Record full rows, count refreshes and tombstones in the store. Cells that are
+    unknown (a row that exists in the sheet but was never staged) are kept as None and
+    never pushed. Returns (updates, counts, appends, tombs) shaped like write_doc_rows.
+    """
+    existing = video_rows(doc_id)
+    updates, counts, appends, tombs = [], [], [], []
+    with STORE_LOCK:
+        prev = _store_fetch([r[0] for r in rows] + [vid for vid, _ in stats] + [vid for vid, _ in dead])
+        unknown = json.dumps([None] * len(HEADERS))
+        recs = []
+        for row in rows:
+            vid = row[0]
+            old = prev.get(vid)
+            cells = list(row)
+            if old and old[1][FIRST_SEEN_COL]:
+                cells[FIRST_SEEN_COL] = old[1][FIRST_SEEN_COL]
+            sheet_row = existing.get(vid) or (old[0] if old else None)
+            pushed = old[2] if old else (unknown if sheet_row else None)
+            if sheet_row:
+                updates.append((sheet_row, cells))
+            elif not old:
+                appends.append(cells)
+            recs.append((vid, doc_id, sheet_row, json.dumps(cells, ensure_ascii=False), pushed))
+            prev[vid] = (sheet_row, cells, pushed)
+        for vid, c in stats:
+            old = prev.get(vid)
+            sheet_row = existing.get(vid) or (old[0] if old else None)
+            if not sheet_row:
+                continue
+            cells = old[1] if old else [None] * len(HEADERS)
+            cells[STATS_SLICE] = c
+            cells[UPDATED_IDX] = updated_at
+            counts.append((sheet_row, c))
+            recs.append((vid, doc_id, sheet_row, json.dumps(cells, ensure_ascii=False), old[2] if old else unknown))
+            prev[vid] = (sheet_row, cells, old[2] if old else unknown)
+        for vid, reason in dead:
+            old = prev.get(vid)
+            sheet_row = existing.get(vid) or (old[0] if old else None)
+            if not sheet_row:
+                continue
+            cells = old[1] if old else [None] * len(HEADERS)
+            cells[TOMB_SLICE] = ["TRUE", reason]
+            cells[UPDATED_IDX] = updated_at
+            tombs.append((sheet_row, ["TRUE", reason]))
+            recs.append((vid, doc_id, sheet_row, json.dumps(cells, ensure_ascii=False), old[2] if old else unknown))
+        STORE.executemany("""INSERT INTO videos (video_id, doc_id, row, cells, pushed) VALUES (?, ?, ?, ?, ?)
+            ON CONFLICT(video_id) DO UPDATE SET doc_id=excluded.doc_id, row=excluded.row,
+            cells=excluded.cells, pushed=excluded.pushed""", recs)
+        STORE.commit()
+    return updates, counts, appends, tombs
+
+def cell_diff(old, new):
+    """
+    Changed cells of one row as (first column, last column, values) spans.
+    """
+    spans = []; start = None
+    for i, v in enumerate(new):
+        changed = v is not None and (i >= len(old) or old[i] != v)
+        if changed and start is None:
+            start = i
+        elif not changed and start is not None:
+            spans.append((start, i - 1, new[start:i])); start = None
+    if start is not None:
+        spans.append((start, len(new) - 1, new[start:]))
+    return spans
+
+def sync_store():
+    """
+    Push staged changes: changed cells of existing rows as planned ranges, rows with
+    no sheet position yet as one append per doc.
+    """
+    if STORE is None:
+        return
+    with STORE_LOCK:
+        doc_ids = [r[0] for r in STORE.execute(
+            "SELECT DISTINCT doc_id FROM videos WHERE pushed IS NULL OR cells != pushed")]
+    for doc_id in doc_ids:
+        with doc_lock(doc_id):
+            with STORE_LOCK:
+                pending = STORE.execute("""SELECT video_id, row, cells, pushed FROM videos
+                    WHERE doc_id = ? AND (pushed IS NULL OR cells != pushed) ORDER BY row""", (doc_id,)).fetchall()
+            spans: Dict[Tuple[int, int], list] = {}
+            appends = []; synced = []
+            for vid, row, cells, pushed in pending:
+                cur = json.loads(cells)
+                if row is None:
+                    if None not in cur:
+                        appends.append(cur); synced.append((cells, vid))
+                    continue
+                old = json.loads(pushed) if pushed else []
+                for c0, c1, vals in cell_diff(old, cur):
+                    spans.setdefault((c0, c1), []).append((row, vals))
+                synced.append((cells, vid))
+            data = [(row, c0, run) for (c0, c1), ups in spans.items() for row, run in row_runs(ups)]
+            if data or appends:
+                start = write_doc(doc_id, data, appends)
+            if appends:
+                video_index_append(doc_id, start, [r[0] for r in appends])
+            rows = video_rows(doc_id) if appends else {}
+            with STORE_LOCK:
+                STORE.executemany("UPDATE videos SET pushed = ? WHERE video_id = ?", synced)
+                STORE.executemany("UPDATE videos SET row = ? WHERE video_id = ?",
+                                  [(rows[r[0]], r[0]) for r in appends if r[0] in rows])
+                STORE.commit()
+            ncells = sum(len(vals) for ups in spans.values() for _, vals in ups)
+            print(f"INFO[STORE_SYNC]: {doc_id} cells={ncells} ranges={len(data)} add={len(appends)}")
+
+# ---------- compaction ----------
+# Tombstoned rows stay in place until their doc is compacted: once they reach
+# COMPACT_SHARE of its rows, or SWEEP_DAYS after the doc was last swept (which also
+# drops rows that left the window before tombstoning existed), the dead rows are
+# deleted in one spreadsheets.batchUpdate and every row index is rebuilt from the sheet.
+
+COMPACT_STATS = {"docs": 0, "deleted": 0}
+SWEEP_COLS = [col_letter(HEADERS.index(h)) for h in ("videoId", "playlistId", "publishedAt", "isTombstoned")]
+
+def published_before(cell, cutoff):
+    try:
+        return dt.datetime.strptime(cell, BAKU_FMT) < cutoff
+    except (TypeError, ValueError):
+        return False
+
+def compact_docs(st, since_iso):
+    if not COMPACT:
+        return
+    today = dt.datetime.utcnow().date()
+    stale = (today - dt.timedelta(days=SWEEP_DAYS)).isoformat()
+    # publishedAt is stored as Baku wall time
+    cutoff = dt.datetime.fromisoformat(since_iso.rstrip("Z")).replace(tzinfo=dt.timezone.utc)
+    cutoff = cutoff.astimezone(BAKU_TZ).replace(tzinfo=None)
+    with ST_LOCK:
+        due = [d for d in st["docs"] if not (SHARDED and doc_shard(d) != SHARD_INDEX)
+               and (d.get("dead", 0) >= max(1, COMPACT_SHARE * d.get("rows", 0)) or d.get("swept", "") < stale)]
+    for d in due:
+        compact_doc(st, d, cutoff, today.isoformat())
+    if due:
+        print(f"INFO[COMPACT]: docs={len(due)} deleted={COMPACT_STATS['deleted']}")
+
+def compact_doc(st, d, cutoff, today):
+    doc_id = d["id"]
+    with doc_lock(doc_id):
+        ids, pids, published, tomb = (
+            col[0] if col else [] for col in
+            sheets_values_batch_get(doc_id, [a1("videos", f"{c}2:{c}") for c in SWEEP_COLS], "COLUMNS"))
+        at = lambda col, i: col[i] if i < len(col) else ""
+        dead = [i for i in range(len(ids)) if not ids[i] or at(tomb, i) == "TRUE"
+                or published_before(at(published, i), cutoff)]
+        gone = set(dead)
+        if dead:
+            runs = []  # [first, last] 0-based data indexes, deleted bottom-up so indexes stay valid
+            for i in dead:
+                if runs and runs[-1][1] == i - 1:
+                    runs[-1][1] = i
+                else:
+                    runs.append([i, i])
+            grid = doc_grid(doc_id)
+            sheets_batch_update(doc_id, grid["setup"] + [
+                {"deleteDimension": {"range": {"sheetId": grid["sheetId"], "dimension": "ROWS",
+                                               "startIndex": a + 1, "endIndex": b + 2}}}
+                for a, b in reversed(runs)])
+            grid["setup"] = []; grid["rows"] -= len(dead)
+            live = [v for i, v in enumerate(ids) if i not in gone]
+            with ST_LOCK:
+                _vx_set_doc(doc_id, live, None)
+                VX["dirty"].add(doc_id)
+            if STORE is not None:
+                with STORE_LOCK:
+                    STORE.executemany("DELETE FROM videos WHERE video_id = ? AND doc_id = ?",
+                                      [(ids[i], doc_id) for i in dead if ids[i]])
+                    STORE.executemany("UPDATE videos SET row = ? WHERE video_id = ? AND doc_id = ?",
+                                      [(row, v, doc_id) for row, v in enumerate(live, start=2)])
+                    STORE.commit()
+        live_pids = {at(pids, i) for i in range(len(ids)) if i not in gone}
+        with ST_LOCK:
+            d["rows"] = len(ids) - len(dead); d["dead"] = 0; d["swept"] = today
+            placed = [pid for pid, x in st["playlist_to_doc"].items() if x == doc_id]
+            for pid in placed:
+                if pid not in live_pids:
+                    st["playlist_to_doc"].pop(pid)
+            COMPACT_STATS["docs"] += 1; COMPACT_STATS["deleted"] += len(dead)
+    if dead:
+        # rowsInDoc of every playlist placed here changed; emptied playlists lose their doc
+        for pid in placed:
+            kept = pid in live_pids
+            index_patch(pid, docId=doc_id if kept else "", docName=d.get("name", "") if kept else "",
+                        rowsInDoc=d["rows"] if kept else 0)
+        print(f"INFO[COMPACT_DOC]: {d.get('name', doc_id)} deleted={len(dead)} rows={d['rows']}")
+
+# ---------- shards ----------
+
+def doc_shard(d):
+    # docs created by a sharded run carry their shard; older docs are placed by id hash
+    return int(d.get("shard", stable_hash(d["id"]))) % SHARD_COUNT
+
+def playlist_shard(st, playlist_id):
+    """
+    A playlist already placed in a doc follows that doc; new playlists go by id hash.
+    """
+    doc_id = st["playlist_to_doc"].get(playlist_id)
+    if doc_id:
+        d = next((x for x in st["docs"] if x["id"] == doc_id), None)
+        if d:
+            return doc_shard(d)
+    return stable_hash(playlist_id) % SHARD_COUNT
+
+def next_doc_number(st):
+    # shards number their new docs in disjoint residue classes so names never collide
+    nums = [int(m.group(1)) for d in st["docs"] for m in [re.search(r"_(\d+)$", d.get("name", ""))] if m]
+    n = max(nums, default=0) + 1
+    while SHARDED and n % SHARD_COUNT != SHARD_INDEX:
+        n += 1
+    return n
+
+def merge_fragment(base, shard, frag, prior=None):
+    """
+    Fold the parts of a shard's state fragment that the shard owns into base.
+    prior is base["quota"] as every shard loaded it: a key shared between shards
+    is charged each fragment's spend on top of it.
+    """
+    owned = {d["id"] for d in frag.get("docs", []) if doc_shard(d) == shard}
+    docs = {d["id"]: d for d in base.get("docs", [])}
+    for d in frag.get("docs", []):
+        if d["id"] in owned:
+            docs[d["id"]] = d
+    base["docs"] = sorted(docs.values(), key=lambda d: d.get("name", ""))
+    for pid, doc_id in list(base["playlist_to_doc"].items()):
+        if doc_id in owned and pid not in frag.get("playlist_to_doc", {}):
+            base["playlist_to_doc"].pop(pid)  # emptied by the shard's compaction
+    for pid, doc_id in frag.get("playlist_to_doc", {}).items():
+        if doc_id in owned:
+            base["playlist_to_doc"][pid] = doc_id
+    for key in ("playlists", "overflow", "activity"):
+        dst = base.setdefault(key, {})
+        src = frag.get(key, {})
+        for pid in list(dst):
+            if playlist_shard(frag, pid) == shard and pid not in src:
+                dst.pop(pid)
+        for pid, v in src.items():
+            if playlist_shard(frag, pid) == shard:
+                dst[pid] = v
+    base.setdefault("shorts", {}).update(frag.get("shorts", {}))
+    fq = frag.get("quota") or {}
+    bq = base.setdefault("quota", {})
+    if fq.get("day") and fq.get("day") != bq.get("day"):
+        bq.update({"day": fq["day"], "keys": {}})
+    if fq.get("day") == bq.get("day"):
+        start = (prior or {}).get("keys", {}) if (prior or {}).get("day") == fq.get("day") else {}
+        keys = bq.setdefault("keys", {})
+        for fp, rec in fq.get("keys", {}).items():
+            cur = keys.get(fp) or {"spent": 0, "retired": False}
+            spent = rec.get("spent", 0) - (start.get(fp) or {}).get("spent", 0)
+            keys[fp] = {"spent": cur.get("spent", 0) + max(0, spent),
+                        "retired": bool(cur.get("retired") or rec.get("retired"))}
+    pr = frag.get("progress") or {}
+    bp = base["progress"]
+    bp["day"] = pr.get("day") or bp["day"]
+    bp["done"] = sorted(set(bp["done"]) | set(pr.get("done", [])))
+    bp["complete"] = bp["complete"] and bool(pr.get("complete"))
+    return owned
+
+def merge_shards():
+    """
+    MERGE_SHARDS job: combine this run's fragments into chunks_state.json,
+    videos_index.json and VideosIndex.
+    """
+    base = load_state_file(STATE_NAME) or {"docs": [], "playlist_to_doc": {}}
+    base.pop("index_pending", None)
+    base["progress"] = {"day": None, "done": [], "complete": True}
+    raw_vx = _read_video_index(VIDEO_INDEX_NAME)
+    if raw_vx:
+        _vx_load(raw_vx)
+    per_playlist = {"units_per_playlist": [], "seconds_per_playlist": []}
+    prior = snapshot(base.get("quota") or {})
+    merged = 0
+    for i in range(SHARD_COUNT):
+        frag = load_state_file(shard_name(STATE_NAME, i))
+        if not frag or frag.get("run_id") != RUN_ID:
+            print(f"WARN[SHARD_MISSING]: shard {i} has no fragment for run {RUN_ID}")
+            base["progress"]["complete"] = False
+            continue
+        owned = merge_fragment(base, i, frag, prior)
+        INDEX_PENDING.update(frag.get("index_pending", {}))
+        for key, vals in per_playlist.items():
+            x = (frag.get("quota") or {}).get(key)
+            if x:
+                vals.append(float(x))
+        vx = _read_video_index(shard_name(VIDEO_INDEX_NAME, i))
+        if vx and vx.get("run_id") == RUN_ID:
+            _vx_load(vx, owned)
+        merged += 1
+    if not merged:
+        fail("SHARD_MERGE", f"no fragments for run {RUN_ID}")
+    for key, vals in per_playlist.items():
+        if vals:
+            base["quota"][key] = round(sum(vals) / len(vals), 2)
+    prune_shorts(base, window_start())
+    index_id = ensure_index_sheet()
+    flush_index(index_id)
+    save_state(base)
+    write_video_index(VIDEO_INDEX_NAME)
+    print(f"INFO[SHARD_MERGE]: fragments={merged}/{SHARD_COUNT} docs={len(base['docs'])}")
+
+# chunk doc being created: {"name", "id" once created, "ready": Event}; playlists that
+# need a new doc meanwhile wait for this one instead of creating their own
+NEW_DOC: Dict[str, dict] = {}
 
 def pick_doc_for_playlist(st, playlist_id):
-    if playlist_id in st["playlist_to_doc"]:
-        return st["playlist_to_doc"][playlist_id]
-    docs = sorted(st["docs"], key=lambda x: x.get("rows", 0))
-    for d in docs:
-        if d.get("rows", 0) < ROWS_PER_DOC:
-            st["playlist_to_doc"][playlist_id] = d["id"]; return d["id"]
-    name = f"VideosChunk_{len(st['docs'])+1:04d}"
-    sid = drive_create_sheet_in_folder(name, CHUNKS_FOLDER_ID)
-    st["docs"].append({"id": sid, "name": name, "rows": 0})
-    ensure_header(sid)
-    st["playlist_to_doc"][playlist_id] = sid
-    return sid
+    """
+    The playlist's chunk doc: the one it is already in, else the emptiest doc of this
+    shard with room, else a new doc. The new doc's name is reserved under ST_LOCK;
+    the Drive create and the header write run outside it.
+    """
+    with ST_LOCK:
+        if playlist_id in st["playlist_to_doc"]:
+            return st["playlist_to_doc"][playlist_id]
+        docs = sorted(st["docs"], key=lambda x: x.get("rows", 0))
+        for d in docs:
+            if SHARDED and doc_shard(d) != SHARD_INDEX:
+                continue
+            if d.get("rows", 0) < ROWS_PER_DOC:
+                st["playlist_to_doc"][playlist_id] = d["id"]; return d["id"]
+        new = NEW_DOC.get("pending")
+        create = new is None
+        if create:
+            new = NEW_DOC["pending"] = {"name": f"VideosChunk_{next_doc_number(st):04d}", "id": None,
+                                        "ready": threading.Event()}
+    if create:
+        try:
+            sid = drive_create_sheet_in_folder(new["name"], CHUNKS_FOLDER_ID)
+            DOC_GRIDS[sid] = new_doc_grid()
+            write_doc(sid)  # tab and header right away, so the doc is readable even if nothing lands
+            with ST_LOCK:
+                st["docs"].append({"id": sid, "name": new["name"], "rows": 0, "shard": SHARD_INDEX,
+                                   "swept": dt.datetime.utcnow().date().isoformat()})
+                new["id"] = sid
+        finally:
+            with ST_LOCK:
+                NEW_DOC.pop("pending", None)
+            new["ready"].set()
+    else:
+        new["ready"].wait()
+    if new["id"] is None:
+        fail("DRIVE_CREATE", f"{new['name']} was not created")
+    with ST_LOCK:
+        return st["playlist_to_doc"].setdefault(playlist_id, new["id"])
+
+def doc_lock(doc_id):
+    with ST_LOCK:
+        return DOC_LOCKS.setdefault(doc_id, threading.Lock())
 
 # ---------- main playlist processing ----------
 
-def process_playlist(st, playlist_id, channel_title, since_iso, topic_ru_map, index_id):
-    vid_ids = list_since(playlist_id, since_iso, 1001)
-    if not vid_ids:
-        print(f"SKIP[ANNUAL_LIMIT_OR_EMPTY]: {playlist_id}")
-        return
-    recs = fetch_videos(vid_ids)
-    rows = []
-    now_loc = dt.datetime.now(BAKU_TZ).strftime("%d.%m.%Y %H:%M:%S")
-    for r in recs:
-        d = r.get("duration_s")
-        is_short = bool(d is not None and d <= SHORTS_LIMIT)
-        if is_short:
-            continue
-        tlist = r.get("topicCategories", [])
-        ru = []
-        for u in tlist:
-            if u in topic_ru_map:
-                ru.append(topic_ru_map[u])
-        row = [
-            r.get("videoId") or "",
-            playlist_id,
-            channel_title or "",
-            fmt_baku(r.get("publishedAt") or ""),
-            r.get("title") or "",
-            d if d is not None else "",
-            "TRUE" if is_short else "FALSE",
-            r.get("viewCount") or "",
-            r.get("likeCount") or "",
-            r.get("commentCount") or "",
-            r.get("categoryId") or "",
-            r.get("defaultLanguage") or "",
-            ", ".join(ru),
-            "TRUE" if r.get("hasPaidProductPlacement") else "FALSE",
-            now_loc,
-            now_loc,
-            "FALSE",
-            "",
-        ]
-        rows.append(row)
-    if not rows:
-        print(f"INFO[NONE_ROWS_AFTER_FILTER]: {playlist_id}")
-        return
+def window_start():
+    """Oldest publishedAt (UTC ISO) a chunk doc keeps."""
+    return (dt.datetime.utcnow() - dt.timedelta(days=WINDOW_DAYS)).replace(microsecond=0).isoformat() + "Z"
+
+def scan_playlist(st, playlist_id, since_iso, limit_annual=ANNUAL_LIMIT, video_count=None):
+    """
+    Returns (new_ids, known_ids, expired_ids, scan). known_ids are videos from earlier
+    runs that are still inside the window, expired_ids the ones that just left it;
+    scan is the playlist's next scan state ({"etag", "videos"}), or None when the
+    playlist is over the annual cap (recorded in st["overflow"]). The in-window
+    videos already seen are where the next listing stops.
+    """
+    with ST_LOCK:
+        ps = dict(st.get("playlists", {}).get(playlist_id) or {}) if INCREMENTAL else {}
+    known = {v: pa for v, pa in (ps.get("videos") or {}).items() if pa >= since_iso}
+    expired = [v for v, pa in (ps.get("videos") or {}).items() if pa < since_iso]
+    # a channel with fewer videos in total than the cap cannot overflow it
+    project = not known and (video_count is None or video_count >= limit_annual)
+    new, etag, projected = list_since(playlist_id, since_iso, limit_annual - len(known),
+                                      known=known, head_etag=ps.get("etag") if known else None,
+                                      project=project)
+    if new is None:
+        mark_overflow(st, playlist_id, (projected or 0) + len(known))
+        return [], [], [], None
+    videos = dict(new); videos.update(known)
+    scan = {
+        "etag": etag,
+        "videos": videos,
+    }
+    return list(new), list(known), expired, scan
+
+def commit_scan(st, playlist_id, scan):
+    with ST_LOCK:
+        st.setdefault("playlists", {})[playlist_id] = scan
+        st.get("overflow", {}).pop(playlist_id, None)
+
+def mark_overflow(st, playlist_id, count):
+    until = (dt.datetime.utcnow() + dt.timedelta(days=OVERFLOW_COOLDOWN_DAYS)).date().isoformat()
+    with ST_LOCK:
+        st.setdefault("overflow", {})[playlist_id] = {"until": until, "count": count}
+        st.get("playlists", {}).pop(playlist_id, None)
+
+def in_overflow_cooldown(st, playlist_id):
+    rec = st.get("overflow", {}).get(playlist_id)
+    return bool(rec) and rec.get("until", "") > dt.datetime.utcnow().date().isoformat()
+
+def batched(items, n):
+    buf = []
+    for x in items:
+        buf.append(x)
+        if len(buf) >= n:
+            yield buf
+            buf = []
+    if buf:
+        yield buf
+
+def iter_unshorts(st, ids, published):
+    """IDs that are not Shorts; unclassified ones are resolved 50 at a time as the consumer pulls."""
+    with ST_LOCK:
+        shorts = st.setdefault("shorts", {})
+        todo = [v for v in ids if v not in shorts and locate_video(v) is None]
+        pending = set(todo)
+        ready = [v for v in ids if v not in pending and v not in shorts]
+    yield from ready
+    for batch in batched(todo, 50):
+        with timed("phase", "fetch"):
+            keep = classify_shorts(st, batch, published)
+        yield from keep
+
+def iter_records(ids, missing=None):
+    """Full records 50 at a time; IDs videos.list no longer returns go to `missing`."""
+    for batch in batched(ids, 50):
+        with timed("phase", "fetch"):
+            recs = VIDEOS.get("records", batch)
+        if missing is not None and len(recs) < len(batch):
+            got = {r["videoId"] for r in recs}
+            missing.extend(v for v in batch if v not in got)
+        yield from recs
+
+class RowSink:
+    """
+    Rows, count refreshes and tombstones of one playlist on their way to write_rows.
+    Every STREAM_ROWS items are handed to the writer pool while fetching goes on; at
+    most two chunks are in flight, so memory stays bounded whatever the playlist size.
+    """
+
+    def __init__(self, st, playlist_id, writers):
+        self.st = st
+        self.playlist_id = playlist_id
+        self.writers = writers
+        self.rows, self.stats, self.dead = [], [], []
+        self.pending = []
+        self.totals = [0, 0, 0, 0]  # updated rows, count refreshes, appended rows, tombstoned rows
+
+    def add(self, rows=(), stats=(), dead=()):
+        self.rows.extend(rows); self.stats.extend(stats); self.dead.extend(dead)
+        if len(self.rows) + len(self.stats) + len(self.dead) >= STREAM_ROWS:
+            self.flush()
+
+    def flush(self):
+        if not (self.rows or self.stats or self.dead):
+            return
+        while len(self.pending) >= 2:
+            self._collect(self.pending.pop(0))
+        self.pending.append(self.writers.submit(write_rows, self.st, self.playlist_id,
+                                                self.rows, self.stats, self.dead))
+        self.rows, self.stats, self.dead = [], [], []
+
+    def _collect(self, fut):
+        for i, n in enumerate(fut.result()):
+            self.totals[i] += n
+
+    def close(self):
+        self.flush()
+        while self.pending:
+            self._collect(self.pending.pop(0))
+        return self.totals
+
+def write_doc_rows(doc_id, rows, stats, dead=()):
+    with timed("phase", "dedupe"):
+        existing = video_rows(doc_id)
+        updates, appends = [], []
+        for row in rows:
+            vid = row[0]
+            if vid in existing:
+                updates.append((existing[vid], row))
+            else:
+                appends.append(row)
+        # known videos missing from the doc (Shorts) have no row to refresh
+        counts = [(existing[vid], c) for vid, c in stats if vid in existing]
+        tombs = [(existing[vid], ["TRUE", reason]) for vid, reason in dead if vid in existing]
+    with timed("phase", "write"):
+        now = now_baku()
+        spans = [(row, 0, run) for row, run in row_runs(updates)]
+        spans += [(row, STATS_SLICE.start, run) for row, run in row_runs(counts)]
+        spans += [(row, TOMB_SLICE.start, run) for row, run in row_runs(tombs)]
+        touched = [(r, [now]) for r, _ in counts + tombs]
+        spans += [(row, UPDATED_IDX, run) for row, run in row_runs(touched)]
+        if spans or appends:
+            start = write_doc(doc_id, spans, appends)
+    if appends:
+        with timed("phase", "index"):
+            video_index_append(doc_id, start, [row[0] for row in appends])
+    return updates, counts, appends, tombs
 
+def write_rows(st, playlist_id, rows, stats, dead=()):
     doc_id = pick_doc_for_playlist(st, playlist_id)
-    ensure_header(doc_id)
-    existing = read_existing_video_ids(doc_id)
-    updates, appends = [], []
-    for row in rows:
-        vid = row[0]
-        if vid in existing:
-            updates.append((existing[vid], row))
+    with doc_lock(doc_id):
+        with ST_LOCK:
+            VX["dirty"].add(doc_id)
+        if STORE is not None:
+            with timed("phase", "dedupe"):
+                updates, counts, appends, tombs = stage_rows(doc_id, rows, stats, dead, now_baku())
         else:
-            appends.append(row)
-    if updates:
-        batch_update_rows(doc_id, updates)
-    if appends:
-        append_rows(doc_id, appends)
-        for _ in appends:
-            for d in st["docs"]:
-                if d["id"] == doc_id:
-                    d["rows"] = d.get("rows", 0) + 1
-                    break
-    doc_name = ""
-    for d in st["docs"]:
-        if d["id"] == doc_id:
-            doc_name = d.get("name", ""); break
-    update_index(index_id, [{
-        "playlistId": playlist_id,
-        "docId": doc_id,
-        "docName": doc_name,
-        "rowsInDoc": next((d.get("rows", 0) for d in st["docs"] if d["id"] == doc_id), 0)
-    }])
-    print(f"DONE[PLAYLIST]: {playlist_id} up={len(updates)} add={len(appends)}")
+            updates, counts, appends, tombs = write_doc_rows(doc_id, rows, stats, dead)
+    with ST_LOCK:
+        doc = next((d for d in st["docs"] if d["id"] == doc_id), {})
+        if appends and doc:
+            doc["rows"] = doc.get("rows", 0) + len(appends)
+        if tombs and doc:
+            doc["dead"] = doc.get("dead", 0) + len(tombs)
+        item = {
+            "playlistId": playlist_id,
+            "docId": doc_id,
+            "docName": doc.get("name", ""),
+            "rowsInDoc": doc.get("rows", 0),
+            "lastScanAt": now_baku(),
+        }
+    with timed("phase", "index"):
+        queue_index(item)
+    return len(updates), len(counts), len(appends), len(tombs)
+
+def process_playlist(st, playlist_id, channel_title, since_iso, topic_ru_map, index_id, writers, video_count=None):
+    """
+    Stream one playlist: the listing yields IDs, Shorts are classified and full
+    records fetched through VIDEOS (packed with other playlists' IDs into 50-ID
+    requests), and rows go to a RowSink in STREAM_ROWS chunks, so
+    writing overlaps fetching. Count refreshes (STATS_REFRESH) stream the same way.
+    Rows of videos that left the window or that videos.list no longer returns are
+    tombstoned and dropped from the scan state; compact_docs removes them later.
+    The scan state is committed only after every chunk is written.
+    """
+    t0 = time.perf_counter(); PL_LOCAL.units = 0
+    sink = RowSink(st, playlist_id, writers)
+    gone = []
+    views = [0, 0]  # known videos, new videos
+    with VIDEOS.producer():
+        with timed("phase", "list"):
+            new_ids, known_ids, expired, scan = scan_playlist(st, playlist_id, since_iso, ANNUAL_LIMIT, video_count)
+        if scan is None or not (new_ids or known_ids):
+            print(f"SKIP[ANNUAL_LIMIT_OR_EMPTY]: {playlist_id}")
+            new_ids = known_ids = []
+        sink.add(dead=[(v, "window") for v in expired])
+        with ST_LOCK:
+            shorts = st.setdefault("shorts", {})
+            known_ids = [v for v in known_ids if v not in shorts]
+        recs = iter_records(iter_unshorts(st, new_ids, (scan or {}).get("videos", {})))
+        if known_ids and STATS_REFRESH:
+            for batch in batched(known_ids, 50):
+                with timed("phase", "fetch"):
+                    stats = VIDEOS.get("stats", batch)
+                if len(stats) < len(batch):
+                    got = {vid for vid, _ in stats}
+                    gone.extend(v for v in batch if v not in got)
+                views[0] += sum(count_int(c[0]) or 0 for _, c in stats)
+                sink.add(stats=stats)
+        elif known_ids:
+            recs = itertools.chain(recs, iter_records(known_ids, gone))
+        known = set(known_ids) if not STATS_REFRESH else ()
+        for chunk in batched(recs, STREAM_ROWS):
+            with timed("phase", "transform"):
+                rows = record_rows(chunk, playlist_id, channel_title, topic_ru_map, now_baku())
+            for r in rows:
+                views[r[0] not in known] += count_int(r[VIEW_IDX]) or 0
+            sink.add(rows)
+    if gone:
+        sink.add(dead=[(v, "unavailable") for v in gone])
+        for v in gone:
+            scan["videos"].pop(v, None)
+    up, cnt, add, dead = sink.close()
+    if scan is not None and (new_ids or known_ids) and not (up or cnt or add):
+        print(f"INFO[NONE_ROWS_AFTER_FILTER]: {playlist_id}")
+    if scan is not None:
+        commit_scan(st, playlist_id, scan)
+        record_activity(st, playlist_id, len(new_ids), views[0], views[0] + views[1], PL_LOCAL.units)
+    mark_done(st, playlist_id, index_id)
+    with METRICS_LOCK:
+        METRICS["playlists"][playlist_id] = {"s": round(time.perf_counter() - t0, 3), "units": round(PL_LOCAL.units, 2),
+                                             "rows": up + add, "stats": cnt, "dead": dead}
+    print(f"DONE[PLAYLIST]: {playlist_id} up={up} stats={cnt} add={add} dead={dead}")
+
+def run_concurrent(st, playlists, title_map, vc_map, since_iso, topic_ru_map, index_id, writers):
+    # PACK_PLAYLISTS playlists stream in parallel so VIDEOS can pack their IDs, with at
+    # most CONCURRENCY YouTube requests in flight (YT_SLOTS); their row chunks share the
+    # writer pool, where doc_lock keeps writes to the same VideosChunk doc in order
+    with ThreadPoolExecutor(PACK_PLAYLISTS, thread_name_prefix="yt") as fetchers:
+        futs = [
+            fetchers.submit(process_playlist, st, pid, title_map.get(pid, ""), since_iso, topic_ru_map,
+                            index_id, writers, vc_map.get(pid))
+            for pid in playlists
+        ]
+        try:
+            for f in as_completed(futs):
+                f.result()
+        except BaseException:
+            # playlists not started yet are dropped; the ones in flight finish or fail on their own
+            fetchers.shutdown(wait=False, cancel_futures=True)
+            raise
+
+# ---------- run report ----------
+
+def _ms(secs):
+    if secs is None or secs == float("inf"):
+        return None if secs is None else "inf"
+    return round(secs * 1000)
+
+def summarize(m):
+    return {"n": m["n"], "errors": m["errors"], "retries": m["retries"], "bytes": m["bytes"],
+            "total_s": round(m["s"], 3), "mean_ms": round(m["s"] * 1000 / m["n"]) if m["n"] else None,
+            "p50_ms": _ms(hist_quantile(m["hist"], 0.5)), "p95_ms": _ms(hist_quantile(m["hist"], 0.95)),
+            "max_ms": round(m["max_s"] * 1000), "hist": m["hist"]}
+
+def run_report(started, t0, playlists, status):
+    cs = client_stats()
+    with METRICS_LOCK:
+        api = {k: summarize(v) for k, v in sorted(METRICS["api"].items())}
+        phases = {k: summarize(v) for k, v in METRICS["phase"].items()}
+        per = dict(METRICS["playlists"])
+    slow = sorted(per.items(), key=lambda kv: -kv[1].get("s", 0))[:10]
+    return {
+        "run_id": RUN_ID, "shard": SHARD_INDEX if SHARDED else None, "status": status,
+        "started": started, "wall_s": round(time.perf_counter() - t0, 2),
+        "playlists": playlists, "done": len(per),
+        "quota": {"day": KEYS.day, "units": KEYS.run_units, "rotations": KEYS.rotations,
+                  "retired": len(KEYS.retired)},
+        "buckets_s": list(LAT_BUCKETS),
+        "phases": phases, "api": api,
+        "http": cs.get("http", {}),
+        "oauth": {"refreshes": cs.get("refreshes")},
+        "yt_cache": dict(YT_CACHE_STATS) if YT_CACHE_PATH else None,
+        "videos_list": dict(VIDEOS.stats),
+        "compaction": dict(COMPACT_STATS),
+        "slowest": [dict(playlist=pid, **m) for pid, m in slow],
+    }
+
+def step_summary(rep):
+    """Markdown for the GitHub Actions job summary."""
+    q = rep["quota"]
+    out = [f"### chunk_sheets {rep['status']}" + (f" · shard {rep['shard']}" if rep["shard"] is not None else ""),
+           "",
+           f"wall {rep['wall_s']}s · playlists {rep['done']}/{rep['playlists']} · YouTube units {q['units']} "
+           f"(rotations {q['rotations']}, retired keys {q['retired']})",
+           "",
+           "| phase | n | total s | p50 ms | p95 ms | max ms |",
+           "|---|---:|---:|---:|---:|---:|"]
+    for k, m in sorted(rep["phases"].items(), key=lambda kv: -kv[1]["total_s"]):
+        out.append(f"| {k} | {m['n']} | {m['total_s']} | ≤{m['p50_ms']} | ≤{m['p95_ms']} | {m['max_ms']} |")
+    out += ["", "| call | n | errors | retries | KB | p50 ms | p95 ms | max ms |",
+            "|---|---:|---:|---:|---:|---:|---:|---:|"]
+    for k, m in rep["api"].items():
+        out.append(f"| {k} | {m['n']} | {m['errors']} | {m['retries']} | {m['bytes'] // 1024} "
+                   f"| ≤{m['p50_ms']} | ≤{m['p95_ms']} | {m['max_ms']} |")
+    for api, h in sorted(rep["http"].items()):
+        out.append(f"\n{api} transport: {h['requests']} requests, {h['errors']} errors, "
+                   f"{h['bytes_out'] // 1024} KB out, {h['bytes_in'] // 1024} KB in")
+    v = rep.get("videos_list")
+    if v and v["requests"]:
+        out.append(f"\nvideos.list packing: {v['requests']} requests for {v['ids']} IDs "
+                   f"({v['ids'] / v['requests']:.1f}/50 per request), {v['shared']} shared between playlists")
+    c = rep.get("compaction")
+    if c and c["docs"]:
+        out.append(f"\nCompaction: {c['docs']} docs swept, {c['deleted']} dead rows deleted")
+    if rep.get("yt_cache"):
+        c = rep["yt_cache"]
+        out.append(f"\nYouTube cache: {c['revalidated']} revalidated (304), {c['stored']} stored, {c['evicted']} evicted")
+    if rep["slowest"]:
+        out += ["", "| slowest playlist | s | units | rows | counts |", "|---|---:|---:|---:|---:|"]
+        for m in rep["slowest"]:
+            out.append(f"| {m['playlist']} | {m['s']} | {m['units']} | {m['rows']} | {m['stats']} |")
+    return "\n".join(out) + "\n"
+
+def publish_report(rep):
+    """
+    Append the report to run_reports.json in CHUNKS_FOLDER_ID (last REPORT_HISTORY
+    runs) and to the job summary. Best effort: never masks the run's own outcome.
+    """
+    path = os.getenv("GITHUB_STEP_SUMMARY", "").strip()
+    if path:
+        try:
+            with open(path, "a", encoding="utf-8") as f:
+                f.write(step_summary(rep))
+        except OSError as e:
+            print(f"WARN[REPORT]: job summary {e}")
+    name = shard_name(REPORT_NAME) if SHARDED else REPORT_NAME
+    try:
+        raw = drive_read_state_text(name)
+        hist = json.loads(raw) if raw else []
+        hist = (hist + [rep])[-REPORT_HISTORY:]
+        drive_write_state_text(name, json.dumps(hist, ensure_ascii=False, separators=(",", ":")))
+    except (SystemExit, Exception) as e:
+        print(f"WARN[REPORT]: {name} not saved ({type(e).__name__})")
+        return
+    print(f"INFO[REPORT]: {name} wall={rep['wall_s']}s units={rep['quota']['units']}")
 
 # ---------- entry point ----------
 
@@ -570,38 +2382,91 @@ def main():
         fail("MISSING", "SOURCE_SHEET_*")
     if not CHUNKS_FOLDER_ID:
         fail("MISSING", "CHUNKS_FOLDER_ID")
+    if MERGE_SHARDS:
+        merge_shards()
+        return
+    started = dt.datetime.utcnow().replace(microsecond=0).isoformat() + "Z"
+    t0 = time.perf_counter()
 
-    header_map, topic_ru_map = get_helper_maps()
-    uploads, vcounts, topics, titles = get_baza_columns(header_map)
+    with timed("phase", "source"):
+        header_map, topic_ru_map, uploads, vcounts, topics, titles = load_source()
 
-    allowed = []
-    for pid, vc, tc in zip(uploads, vcounts, topics):
-        if not pid:
-            continue
-        if over_10k(vc):
-            continue
-        if is_tv(tc):
+    st = load_state()
+
+    candidates, title_map, vc_map = select_channels(uploads, vcounts, topics, titles)
+    allowed = []; cooling = 0
+    for pid in candidates:
+        if in_overflow_cooldown(st, pid):
+            cooling += 1
             continue
         allowed.append(pid)
-    allowed = [x for x in allowed if x][:PLAYLIST_LIMIT]
+    if cooling:
+        print(f"INFO[OVERFLOW_COOLDOWN]: skipped={cooling}")
+    allowed = [x for x in allowed if x]
     if not allowed:
         fail("NO_INPUT", "no playlists after filter")
+    # PLAYLIST_LIMIT is per run across all shards
+    limit = math.ceil(PLAYLIST_LIMIT / SHARD_COUNT) if SHARDED else PLAYLIST_LIMIT
+    if SHARDED:
+        allowed = [x for x in allowed if playlist_shard(st, x) == SHARD_INDEX]
+        print(f"INFO[SHARD]: {SHARD_INDEX}/{SHARD_COUNT} playlists={len(allowed)} keys={len(KEYS.keys)}")
+
+    since_iso = window_start()
+    prune_shorts(st, since_iso)
+
+    done = start_progress(st)
+    if done:
+        allowed = [x for x in allowed if x not in done]
+    KEYS.load(st.get("quota"))
+    limit = plan_budget(st, max(0, limit - len(done))) if allowed else 0
+    if allowed and not limit and not done:
+        fail("YOUTUBE_QUOTA", f"no quota left for {KEYS.day}")
+    allowed = schedule(st, allowed, limit) if limit else []
+    index_id = None if SHARDED else ensure_index_sheet()
+    load_video_index()
+    reconcile_video_index(st)
+    open_store()
+    open_yt_cache()
 
-    since_iso = (dt.datetime.utcnow() - dt.timedelta(days=WINDOW_DAYS)).replace(microsecond=0).isoformat() + "Z"
-
-    st = load_state()
-    index_id = ensure_index_sheet()
-
-    title_map = {}
-    for pid, t in zip(uploads, titles):
-        if pid:
-            title_map[pid] = t
-
-    for pid in allowed:
-        process_playlist(st, pid, title_map.get(pid, ""), since_iso, topic_ru_map, index_id)
-        time.sleep(0.2)
+    try:
+        with ThreadPoolExecutor(CONCURRENCY, thread_name_prefix="sheets") as writers:
+            if PACK_PLAYLISTS > 1:
+                run_concurrent(st, allowed, title_map, vc_map, since_iso, topic_ru_map, index_id, writers)
+            else:
+                for pid in allowed:
+                    process_playlist(st, pid, title_map.get(pid, ""), since_iso, topic_ru_map, index_id,
+                                     writers, vc_map.get(pid))
+                    time.sleep(0.2)
+        with timed("phase", "write"):
+            sync_store()
+        with timed("phase", "compact"):
+            compact_docs(st, since_iso)
+        with timed("phase", "index"):
+            flush_index(index_id)
+    except (SystemExit, Exception):
+        # keep whatever finished; a rerun with RESUME picks up from here
+        print("WARN[CHECKPOINT]: saving progress before exit")
+        checkpoint(st, index_id)
+        close_yt_cache()
+        publish_report(run_report(started, t0, len(allowed), "failed"))
+        raise
 
-    save_state(st)
+    st["progress"]["complete"] = True
+    record_quota(st, len(allowed))
+    with timed("phase", "state"):
+        save_state(st)
+    with timed("phase", "index"):
+        save_video_index()
+    if STORE is not None:
+        STORE.close()
+    close_yt_cache()
+    cs = client_stats()
+    http = cs.get("http", {})
+    v = VIDEOS.stats
+    print(f"INFO[VIDEOS_PACK]: requests={v['requests']} ids={v['ids']} shared={v['shared']}")
+    print(f"INFO[OAUTH]: refreshes={cs['refreshes']} requests="
+          + ",".join(f"{api}:{h['requests']}" for api, h in sorted(http.items())))
+    publish_report(run_report(started, t0, len(allowed), "ok"))
 
 if __name__ == "__main__":
     try:
@@ -0,0 +1,741 @@
+# scripts/fake_google.py
+# Offline stand-in for the YouTube Data v3, Sheets v4 and Drive v3 endpoints used by
+# chunk_sheets.py, backed by in-memory state. Point the script at it with
+#   GOOGLE_API_ROOT=http://127.0.0.1:PORT              (token, Drive, Sheets; see oauth_helper)
+#   YOUTUBE_ENDPOINT=http://127.0.0.1:PORT/youtube/v3
+# and SOURCE_SHEET_ID / SOURCE_SHEET_TAB / MAP_SHEET_TAB / CHUNKS_FOLDER_ID from env_for().
+#
+# Knobs (environment):
+#   FAKE_CHANNELS     synthetic channels in the source sheet (default 200)
+#   FAKE_SEED         RNG seed for channels and error injection (default 1)
+#   FAKE_LATENCY_MS   delay added to every request (default 0)
+#   FAKE_JITTER_MS    extra uniform random delay (default 0)
+#   FAKE_ERROR_RATE   fraction of API requests failed with 403/429/503 (default 0)
+#   FAKE_YT_QUOTA     daily YouTube units per API key (default 10000)
+#
+# Standalone: python scripts/fake_google.py [port]
+
+import os, sys, json, re, copy, time, random, hashlib, threading
+import datetime as dt
+from email.parser import BytesParser
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit, parse_qs, unquote
+
+CHANNELS   = int(os.getenv("FAKE_CHANNELS", "200") or "200")
+SEED       = int(os.getenv("FAKE_SEED", "1") or "1")
+LATENCY_MS = float(os.getenv("FAKE_LATENCY_MS", "0") or "0")
+JITTER_MS  = float(os.getenv("FAKE_JITTER_MS", "0") or "0")
+ERROR_RATE = float(os.getenv("FAKE_ERROR_RATE", "0") or "0")
+YT_QUOTA   = int(os.getenv("FAKE_YT_QUOTA", "10000") or "10000")
+
+SOURCE_ID  = "fake-source"
+SOURCE_TAB = "baza"
+MAP_TAB    = "map"
+FOLDER_ID  = "fake-folder"
+SHEET_MIME = "application/vnd.google-apps.spreadsheet"
+SCOPES     = ("https://www.googleapis.com/auth/drive", "https://www.googleapis.com/auth/spreadsheets")
+
+TOPICS = {
+    "https://en.wikipedia.org/wiki/Music": "Музыка",
+    "https://en.wikipedia.org/wiki/Entertainment": "Развлечения",
+    "https://en.wikipedia.org/wiki/Video_game_culture": "Видеоигры",
+    "https://en.wikipedia.org/wiki/Lifestyle_(sociology)": "Образ жизни",
+    "https://en.wikipedia.org/wiki/Knowledge": "Знания",
+    "https://en.wikipedia.org/wiki/Sport": "Спорт",
+    "https://en.wikipedia.org/wiki/Television_program": "Телевизионные программы",
+}
+
+# ---------- helpers ----------
+
+def col_index(letters):
+    n = 0
+    for ch in letters:
+        n = n * 26 + ord(ch) - 64
+    return n - 1
+
+def col_letter(i):
+    s = ""; i += 1
+    while i:
+        i, r = divmod(i - 1, 26)
+        s = chr(65 + r) + s
+    return s
+
+A1_REF = re.compile(r"^([A-Z]+)?(\d+)?(?::([A-Z]+)?(\d+)?)?$")
+
+def parse_range(rng):
+    """'tab'!A2:R -> (tab, c0, r0, c1, r1), zero-based inclusive, None = open end."""
+    tab, _, ref = rng.rpartition("!") if "!" in rng else (rng, "", "")
+    tab = tab[1:-1].replace("''", "'") if tab.startswith("'") else tab
+    m = A1_REF.match(ref)
+    if not m:
+        raise ApiError(400, "badRequest", f"Unable to parse range: {rng}")
+    c0, r0, c1, r1 = m.groups()
+    c0 = col_index(c0) if c0 else 0
+    r0 = int(r0) - 1 if r0 else 0
+    if ":" not in ref and ref:
+        return tab, c0, r0, c0 if m.group(1) else None, r0 if m.group(2) else None
+    return tab, c0, r0, col_index(c1) if c1 else None, int(r1) - 1 if r1 else None
+
+def parse_fields(spec):
+    """Partial-response mask 'items(id,snippet(title)),nextPageToken' -> nested dict."""
+    pos = 0
+    def group():
+        nonlocal pos
+        out = {}
+        while pos < len(spec):
+            m = re.compile(r"[\w.]+").match(spec, pos)
+            if not m:
+                break
+            pos = m.end(); sub = None
+            if pos < len(spec) and spec[pos] == "(":
+                pos += 1; sub = group(); pos += 1
+            out[m.group()] = sub
+            if pos < len(spec) and spec[pos] == ",":
+                pos += 1; continue
+            break
+        return out
+    return group()
+
+def apply_fields(obj, mask):
+    if mask is None:
+        return obj
+    if isinstance(obj, list):
+        return [apply_fields(x, mask) for x in obj]
+    if isinstance(obj, dict):
+        return {k: apply_fields(obj[k], sub) for k, sub in mask.items() if k in obj}
+    return obj
+
+def rfc3339(t):
+    return t.strftime("%Y-%m-%dT%H:%M:%S.") + f"{t.microsecond // 1000:03d}Z"
+
+def h32(*parts):
+    return int(hashlib.md5("|".join(map(str, parts)).encode()).hexdigest()[:8], 16)
+
+class ApiError(Exception):
+    def __init__(self, code, reason, message="", retry_after=None):
+        super().__init__(message or reason)
+        self.code, self.reason, self.retry_after = code, reason, retry_after
+
+# ---------- world ----------
+
+class World:
+    """
+    Synthetic channels plus in-memory spreadsheets and Drive files. Uploads are
+    deterministic: video k of a channel was published k * interval before the
+    world's start; advance(hours) moves the clock so newer uploads appear.
+    """
+
+    def __init__(self, channels=CHANNELS, seed=SEED):
+        self.lock = threading.RLock()
+        self.rng = random.Random(seed)
+        self.t0 = dt.datetime.now(dt.timezone.utc).replace(microsecond=0)
+        self.clock = self.t0
+        self.sheets = {}    # spreadsheetId -> {"title", "tabs": [{sheetId, title, rows, rowCount, columnCount}]}
+        self.files = {}     # fileId -> meta + "data"
+        self.units = {}     # (day, key) -> YouTube units
+        self.lists = {}     # playlistId -> (clock, uploads)
+        self.seq = 0
+        self.reset_stats()
+        self.channels = {}  # playlistId -> (index, title, videos, interval_hours)
+        rows = [["Channel title", "Uploads playlist", "Video count", "Topics"]]
+        for i in range(channels):
+            n = int(min(20000, self.rng.lognormvariate(5.3, 1.3)))
+            interval = self.rng.choice([6, 12, 24, 48, 96, 168])
+            pid = "UU" + hashlib.sha1(f"{seed}:{i}".encode()).hexdigest()[:22]
+            title = f"Channel {i:05d}"
+            topic = "Телевизионные программы" if self.rng.random() < 0.03 else self.rng.choice(list(TOPICS.values())[:6])
+            self.channels[pid] = (i, title, n, interval)
+            vc = f"{n:,}".replace(",", " ") if n > 999 and self.rng.random() < 0.3 else str(n)
+            rows.append([title, pid, vc, topic])
+        maps = [["relatedplaylists.uploads", "Uploads playlist"], ["videocount", "Video count"],
+                ["topiccategories[]", "Topics"], ["title", "Channel title"]]
+        for j, (url, ru) in enumerate(TOPICS.items()):
+            if j >= len(maps):
+                maps.append(["", ""])
+            maps[j] = maps[j] + ["", "", "", "", url, ru]
+        self.add_file(SOURCE_ID, "Source", SHEET_MIME, [], sheets={SOURCE_TAB: rows, MAP_TAB: maps})
+        self.add_file(FOLDER_ID, "Chunks", "application/vnd.google-apps.folder", [])
+
+    def reset_stats(self):
+        with self.lock:
+            self.stats = {"calls": {}, "bytes_in": 0, "bytes_out": 0, "errors": {},
+                          "yt_units": 0, "playlists": set()}
+
+    def snapshot(self):
+        with self.lock:
+            out = dict(self.stats)
+            out["calls"] = dict(out["calls"]); out["errors"] = dict(out["errors"])
+            out["playlists"] = len(out["playlists"])
+            return out
+
+    def count(self, name, bytes_in=0):
+        with self.lock:
+            self.stats["calls"][name] = self.stats["calls"].get(name, 0) + 1
+            self.stats["bytes_in"] += bytes_in
+
+    def advance(self, hours):
+        with self.lock:
+            self.clock += dt.timedelta(hours=hours)
+
+    def new_id(self, prefix):
+        with self.lock:
+            self.seq += 1
+            return f"{prefix}{self.seq:06d}" + hashlib.sha1(f"{prefix}{self.seq}".encode()).hexdigest()[:12]
+
+    # ---- YouTube ----
+
+    def spend(self, key, units):
+        if not key:
+            raise ApiError(403, "forbidden", "The request is missing a valid API key.")
+        day = self.clock.astimezone(dt.timezone(dt.timedelta(hours=-8))).date().isoformat()
+        with self.lock:
+            used = self.units.get((day, key), 0)
+            if used + units > YT_QUOTA:
+                raise ApiError(403, "quotaExceeded", "The request cannot be completed because you have exceeded your quota.")
+            self.units[(day, key)] = used + units
+            self.stats["yt_units"] += units
+
+    def uploads(self, pid):
+        """[(videoId, publishedAt)] newest first, as of the world clock."""
+        with self.lock:
+            hit = self.lists.get(pid)
+            if hit and hit[0] == self.clock:
+                return hit[1]
+        i, _, n, interval = self.channels[pid]
+        newer = int((self.clock - self.t0).total_seconds() // (interval * 3600))
+        out = []
+        for k in range(-newer, n):
+            t = self.t0 - dt.timedelta(hours=k * interval, minutes=h32(i, k) % 60)
+            out.append((self.video_id(i, k), rfc3339(t)))
+        with self.lock:
+            self.lists[pid] = (self.clock, out)
+        return out
+
+    def video_id(self, i, k):
+        return "v" + hashlib.sha1(f"{SEED}:{i}:{k}".encode()).hexdigest()[:10]
+
+    def video(self, vid, pid, published):
+        i = self.channels[pid][0]
+        x = h32(vid)
+        if x % 100 == 0:
+            return None  # removed / private: absent from videos.list
+        short = x % 100 < 30
+        secs = 15 + x % 165 if short else 200 + x % 3400
+        hh, rest = divmod(secs, 3600); mm, ss = divmod(rest, 60)
+        dur = "PT" + (f"{hh}H" if hh else "") + (f"{mm}M" if mm else "") + (f"{ss}S" if ss else "")
+        age_h = max(1.0, (self.clock - dt.datetime.fromisoformat(published.replace("Z", "+00:00"))).total_seconds() / 3600)
+        views = int((x % 5000 + 10) * age_h ** 0.5)
+        topics = [u for j, u in enumerate(list(TOPICS)[:6]) if (x >> j) & 3 == 0]
+        snippet = {"publishedAt": published, "title": f"Video {vid} of channel {i}", "categoryId": str(10 + x % 20)}
+        if x % 3 == 0:
+            snippet["defaultLanguage"] = "ru"
+        return {
+            "kind": "youtube#video", "etag": f"e{h32(vid, views):x}", "id": vid,
+            "snippet": snippet,
+            "contentDetails": {"duration": dur, "dimension": "2d", "definition": "hd", "caption": "false"},
+            "statistics": {"viewCount": str(views), "likeCount": str(views // 30),
+                           "favoriteCount": "0", "commentCount": str(views // 400)},
+            "topicDetails": {"topicCategories": topics},
+            "paidProductPlacementDetails": {"hasPaidProductPlacement": x % 17 == 0},
+        }
+
+    def playlist_items(self, q):
+        self.spend(q.get("key"), 1)
+        pid = q.get("playlistId", "")
+        if pid not in self.channels:
+            raise ApiError(404, "playlistNotFound", f"Playlist {pid} not found")
+        with self.lock:
+            self.stats["playlists"].add(pid)
+        size = max(0, min(50, int(q.get("maxResults", "5"))))
+        start = int((q.get("pageToken") or "p0")[1:])
+        videos = self.uploads(pid)
+        page = videos[start:start + size]
+        items = [{"kind": "youtube#playlistItem", "etag": f"i{h32(pid, v):x}", "id": f"{pid}.{v}",
+                  "contentDetails": {"videoId": v, "videoPublishedAt": pa}} for v, pa in page]
+        js = {"kind": "youtube#playlistItemListResponse",
+              "etag": f"p{h32(pid, start, *[v for v, _ in page]):x}",
+              "items": items, "pageInfo": {"totalResults": len(videos), "resultsPerPage": size}}
+        if start + size < len(videos):
+            js["nextPageToken"] = f"p{start + size}"
+        return js
+
+    def videos(self, q):
+        self.spend(q.get("key"), 1)
+        ids = [x for x in (q.get("id") or "").split(",") if x]
+        if len(ids) > 50:
+            raise ApiError(400, "invalidFilters", "Too many video ids")
+        parts = set((q.get("part") or "").split(","))
+        by_id = self.video_index()
+        items = []
+        for v in ids:
+            hit = by_id.get(v)
+            if not hit:
+                continue
+            it = self.video(v, *hit)
+            if it is None:
+                continue
+            items.append({k: val for k, val in it.items() if k in ("kind", "etag", "id") or k in parts})
+        # like the real API, the etag changes with the content, not just with the ids asked for
+        return {"kind": "youtube#videoListResponse", "etag": f"l{h32(*ids, *[it['etag'] for it in items]):x}", "items": items,
+                "pageInfo": {"totalResults": len(items), "resultsPerPage": len(items)}}
+
+    def video_index(self):
+        with self.lock:
+            if getattr(self, "_vindex_at", None) != self.clock:
+                self._vindex = {v: (pid, pa) for pid in self.channels for v, pa in self.uploads(pid)}
+                self._vindex_at = self.clock
+            return self._vindex
+
+    # ---- Drive ----
+
+    def add_file(self, fid, name, mime, parents, data=b"", sheets=None):
+        with self.lock:
+            now = rfc3339(dt.datetime.now(dt.timezone.utc))
+            self.files[fid] = {"id": fid, "name": name, "mimeType": mime, "parents": list(parents),
+                               "version": "1", "createdTime": now, "modifiedTime": now,
+                               "trashed": False, "data": data}
+            if mime == SHEET_MIME:
+                tabs = sheets or {"Sheet1": []}
+                self.sheets[fid] = {"title": name, "tabs": []}
+                for title, rows in tabs.items():
+                    self.add_tab(fid, title, rows)
+            return self.files[fid]
+
+    def touch(self, fid):
+        f = self.files.get(fid)
+        if f:
+            f["version"] = str(int(f["version"]) + 1)
+            f["modifiedTime"] = rfc3339(dt.datetime.now(dt.timezone.utc))
+
+    def file(self, fid):
+        f = self.files.get(fid)
+        if not f or f["trashed"]:
+            raise ApiError(404, "notFound", f"File not found: {fid}.")
+        return f
+
+    def public(self, f, fields):
+        meta = {k: v for k, v in f.items() if k != "data"}
+        meta["kind"] = "drive#file"
+        if f["mimeType"] != SHEET_MIME:
+            meta["size"] = str(len(f["data"]))
+        return apply_fields(meta, parse_fields(fields) if fields else
+                            {"kind": None, "id": None, "name": None, "mimeType": None})
+
+    def list_files(self, q):
+        query = q.get("q", "")
+        conds = []
+        for field, val in re.findall(r"(name|mimeType)\s*=\s*'((?:[^'\\]|\\.)*)'", query):
+            conds.append(lambda f, field=field, val=val.replace("\\'", "'"): f[field] == val)
+        for parent in re.findall(r"'((?:[^'\\]|\\.)*)'\s+in\s+parents", query):
+            conds.append(lambda f, parent=parent: parent in f["parents"])
+        if re.search(r"trashed\s*=\s*false", query):
+            conds.append(lambda f: not f["trashed"])
+        with self.lock:
+            hits = [f for f in self.files.values() if all(c(f) for c in conds)]
+        size = int(q.get("pageSize", "100"))
+        start = int((q.get("pageToken") or "0"))
+        fields = q.get("fields") or "files(id,name,mimeType,kind)"
+        js = {"kind": "drive#fileList", "files": [{k: v for k, v in f.items() if k != "data"} for f in hits[start:start + size]]}
+        if start + size < len(hits):
+            js["nextPageToken"] = str(start + size)
+        return apply_fields(js, parse_fields(fields))
+
+    def create_file(self, meta, data=None):
+        fid = self.new_id("f")
+        f = self.add_file(fid, meta.get("name", "Untitled"), meta.get("mimeType") or "application/octet-stream",
+                          meta.get("parents") or [], data or b"")
+        return f
+
+    def update_file(self, fid, meta, data=None):
+        with self.lock:
+            f = self.file(fid)
+            for k in ("name", "mimeType"):
+                if k in meta:
+                    f[k] = meta[k]
+            if data is not None:
+                f["data"] = data
+            self.touch(fid)
+            return f
+
+    def delete_file(self, fid):
+        with self.lock:
+            self.file(fid)
+            del self.files[fid]
+            self.sheets.pop(fid, None)
+
+    # ---- Sheets ----
+
+    def add_tab(self, sid, title, rows=None, rows_n=1000, cols_n=26, sheet_id=None):
+        book = self.sheets[sid]
+        if any(t["title"] == title for t in book["tabs"]):
+            raise ApiError(400, "badRequest", f'A sheet with the name "{title}" already exists.')
+        if sheet_id is None:
+            sheet_id = 0 if not book["tabs"] else self.new_sheet_id()
+        tab = {"sheetId": sheet_id, "title": title,
+               "rows": [list(r) for r in (rows or [])],
+               "rowCount": max(rows_n, len(rows or [])), "columnCount": max(cols_n, max((len(r) for r in rows or []), default=0))}
+        book["tabs"].append(tab)
+        return tab
+
+    def new_sheet_id(self):
+        return self.rng.randint(1, 2 ** 31 - 1)
+
+    def book(self, sid):
+        if sid not in self.sheets or self.files.get(sid, {}).get("trashed"):
+            raise ApiError(404, "notFound", "Requested entity was not found.")
+        return self.sheets[sid]
+
+    def tab(self, sid, title=None, sheet_id=None):
+        for t in self.book(sid)["tabs"]:
+            if t["title"] == title or (title is None and t["sheetId"] == sheet_id):
+                return t
+        raise ApiError(400, "badRequest", f"Unable to parse range: {title or sheet_id}")
+
+    def read(self, sid, rng, major="ROWS"):
+        tab, c0, r0, c1, r1 = parse_range(rng)
+        t = self.tab(sid, tab)
+        rows = t["rows"][r0:None if r1 is None else r1 + 1]
+        out = [[self.cell(x) for x in r[c0:None if c1 is None else c1 + 1]] for r in rows]
+        for r in out:
+            while r and r[-1] == "":
+                r.pop()
+        while out and not out[-1]:
+            out.pop()
+        if major == "COLUMNS":
+            w = max((len(r) for r in out), default=0)
+            out = [[r[j] if j < len(r) else "" for r in out] for j in range(w)]
+            for c in out:
+                while c and c[-1] == "":
+                    c.pop()
+        end_c = c1 if c1 is not None else max(c0, t["columnCount"] - 1)
+        end_r = r1 if r1 is not None else max(r0, t["rowCount"] - 1)
+        vr = {"range": f"'{tab}'!{col_letter(c0)}{r0 + 1}:{col_letter(end_c)}{end_r + 1}", "majorDimension": major}
+        if out:
+            vr["values"] = out
+        return vr
+
+    @staticmethod
+    def cell(x):
+        if x is None:
+            return ""
+        if isinstance(x, bool):
+            return "TRUE" if x else "FALSE"
+        if isinstance(x, float) and x.is_integer():
+            return str(int(x))
+        return str(x)
+
+    def write(self, t, r0, c0, values, grow=True):
+        need_r = r0 + len(values); need_c = c0 + max((len(r) for r in values), default=0)
+        if need_r > t["rowCount"] or need_c > t["columnCount"]:
+            if not grow:
+                raise ApiError(400, "badRequest",
+                               f"Range ('{t['title']}'!{col_letter(c0)}{r0 + 1}) exceeds grid limits. "
+                               f"Max rows: {t['rowCount']}, max columns: {t['columnCount']}")
+            t["rowCount"] = max(t["rowCount"], need_r); t["columnCount"] = max(t["columnCount"], need_c)
+        rows = t["rows"]
+        while len(rows) < need_r:
+            rows.append([])
+        for i, vals in enumerate(values):
+            row = rows[r0 + i]
+            for j, v in enumerate(vals):
+                if v is None:
+                    continue
+                while len(row) <= c0 + j:
+                    row.append("")
+                row[c0 + j] = v
+
+    def values_update(self, sid, data):
+        with self.lock:
+            cells = 0; out = []
+            for vr in data:
+                tab, c0, r0, _, _ = parse_range(vr["range"])
+                t = self.tab(sid, tab)
+                vals = vr.get("values", [])
+                self.write(t, r0, c0, vals)
+                n = sum(len(r) for r in vals); cells += n
+                out.append({"spreadsheetId": sid, "updatedRange": vr["range"], "updatedRows": len(vals), "updatedCells": n})
+            self.touch(sid)
+            return {"spreadsheetId": sid, "totalUpdatedRows": sum(r["updatedRows"] for r in out),
+                    "totalUpdatedCells": cells, "responses": out}
+
+    def values_append(self, sid, rng, values):
+        with self.lock:
+            tab, c0, _, _, _ = parse_range(rng)
+            t = self.tab(sid, tab)
+            last = max((i for i, r in enumerate(t["rows"]) if any(x not in ("", None) for x in r)), default=-1)
+            r0 = last + 1
+            self.write(t, r0, c0, values)
+            w = max((len(r) for r in values), default=1)
+            self.touch(sid)
+            return {"spreadsheetId": sid, "tableRange": f"'{tab}'!A1:{col_letter(c0 + w - 1)}{r0}",
+                    "updates": {"spreadsheetId": sid,
+                                "updatedRange": f"'{tab}'!{col_letter(c0)}{r0 + 1}:{col_letter(c0 + w - 1)}{r0 + len(values)}",
+                                "updatedRows": len(values), "updatedCells": sum(len(r) for r in values)}}
+
+    def meta(self, sid):
+        book = self.book(sid)
+        return {"spreadsheetId": sid, "properties": {"title": book["title"], "locale": "ru_RU"},
+                "sheets": [{"properties": {"sheetId": t["sheetId"], "title": t["title"], "index": i,
+                                           "sheetType": "GRID",
+                                           "gridProperties": {"rowCount": t["rowCount"], "columnCount": t["columnCount"]}}}
+                           for i, t in enumerate(book["tabs"])]}
+
+    @staticmethod
+    def cell_value(c):
+        # with fields=userEnteredValue a CellData without a value clears the cell
+        v = (c or {}).get("userEnteredValue")
+        if not v:
+            return ""
+        for k in ("stringValue", "numberValue", "boolValue", "formulaValue"):
+            if k in v:
+                return v[k]
+        return ""
+
+    def batch_update(self, sid, requests):
+        with self.lock:
+            saved = copy.deepcopy(self.book(sid))
+            try:
+                return self._batch_update(sid, requests)
+            except ApiError:
+                self.sheets[sid] = saved  # all or nothing, like the real API
+                raise
+
+    def _batch_update(self, sid, requests):
+        replies = []
+        for req in requests:
+            (kind, body), = req.items()
+            if kind == "addSheet":
+                p = body.get("properties", {})
+                gp = p.get("gridProperties", {})
+                t = self.add_tab(sid, p.get("title") or f"Sheet{len(self.book(sid)['tabs']) + 1}",
+                                 rows_n=gp.get("rowCount", 1000), cols_n=gp.get("columnCount", 26),
+                                 sheet_id=p.get("sheetId"))
+                replies.append({"addSheet": {"properties": {"sheetId": t["sheetId"], "title": t["title"]}}})
+                continue
+            if kind == "updateSheetProperties":
+                p = body["properties"]
+                t = self.tab(sid, sheet_id=p.get("sheetId"))
+                if "title" in p:
+                    t["title"] = p["title"]
+                gp = p.get("gridProperties", {})
+                t["rowCount"] = gp.get("rowCount", t["rowCount"]); t["columnCount"] = gp.get("columnCount", t["columnCount"])
+            elif kind == "deleteSheet":
+                book = self.book(sid)
+                book["tabs"] = [t for t in book["tabs"] if t["sheetId"] != body["sheetId"]]
+            elif kind == "appendDimension":
+                t = self.tab(sid, sheet_id=body["sheetId"])
+                key = "rowCount" if body.get("dimension", "ROWS") == "ROWS" else "columnCount"
+                t[key] += int(body["length"])
+            elif kind == "deleteDimension":
+                rg = body["range"]; t = self.tab(sid, sheet_id=rg["sheetId"])
+                a, b = rg.get("startIndex", 0), rg.get("endIndex")
+                if rg.get("dimension", "ROWS") == "ROWS":
+                    b = t["rowCount"] if b is None else b
+                    del t["rows"][a:b]; t["rowCount"] -= b - a
+                else:
+                    b = t["columnCount"] if b is None else b
+                    for r in t["rows"]:
+                        del r[a:b]
+                    t["columnCount"] -= b - a
+            elif kind == "updateCells":
+                if "start" in body:
+                    g = body["start"]; r0, c0 = g.get("rowIndex", 0), g.get("columnIndex", 0)
+                else:
+                    g = body["range"]; r0, c0 = g.get("startRowIndex", 0), g.get("startColumnIndex", 0)
+                t = self.tab(sid, sheet_id=g.get("sheetId", 0))
+                vals = [[self.cell_value(c) for c in r.get("values", [])] for r in body.get("rows", [])]
+                self.write(t, r0, c0, vals, grow=False)
+            elif kind == "appendCells":
+                t = self.tab(sid, sheet_id=body.get("sheetId", 0))
+                last = max((i for i, r in enumerate(t["rows"]) if any(x not in ("", None) for x in r)), default=-1)
+                vals = [[self.cell_value(c) for c in r.get("values", [])] for r in body.get("rows", [])]
+                self.write(t, last + 1, 0, vals)
+            else:
+                raise ApiError(400, "badRequest", f"Unsupported request: {kind}")
+            replies.append({})
+        self.touch(sid)
+        return {"spreadsheetId": sid, "replies": replies}
+
+# ---------- HTTP ----------
+
+class Handler(BaseHTTPRequestHandler):
+    world = None
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, fmt, *args):
+        pass
+
+    def do_GET(self):    self.dispatch("GET")
+    def do_POST(self):   self.dispatch("POST")
+    def do_PATCH(self):  self.dispatch("PATCH")
+    def do_PUT(self):    self.dispatch("PUT")
+    def do_DELETE(self): self.dispatch("DELETE")
+
+    def dispatch(self, method):
+        n = int(self.headers.get("Content-Length") or 0)
+        body = self.rfile.read(n) if n else b""
+        url = urlsplit(self.path)
+        q = {k: v[-1] for k, v in parse_qs(url.query, keep_blank_values=True).items()}
+        multi = parse_qs(url.query, keep_blank_values=True)
+        path = unquote(url.path)
+        w = self.world
+        if LATENCY_MS or JITTER_MS:
+            time.sleep((LATENCY_MS + random.random() * JITTER_MS) / 1000.0)
+        try:
+            if path == "/token":
+                w.count("oauth.token", n)
+                return self.send_json(200, {"access_token": w.new_id("tok"), "expires_in": 3599,
+                                            "token_type": "Bearer", "scope": " ".join(SCOPES)})
+            if ERROR_RATE and w.rng.random() < ERROR_RATE:
+                # failed before any side effect, like a throttled or unavailable backend
+                code = w.rng.choice([403, 429, 503])
+                raise ApiError(code, {403: "rateLimitExceeded", 429: "rateLimitExceeded", 503: "backendError"}[code],
+                               "Injected failure", retry_after="1" if code == 429 else None)
+            name, status, payload = self.route(method, path, q, multi, body)
+            w.count(name, n)
+            if isinstance(payload, bytes):
+                return self.send_raw(status, payload, "application/octet-stream")
+            etag = payload.get("etag") if name.startswith("yt.") else None
+            if etag and self.headers.get("If-None-Match") == etag:
+                return self.send_raw(304, b"", "application/json", {"ETag": etag})
+            fields = q.get("fields")
+            if fields and name.startswith(("yt.", "sheets.")):
+                payload = apply_fields(payload, parse_fields(fields))
+            return self.send_json(status, payload, {"ETag": etag} if etag else None)
+        except ApiError as e:
+            with w.lock:
+                w.stats["errors"][str(e.code)] = w.stats["errors"].get(str(e.code), 0) + 1
+            err = {"error": {"code": e.code, "message": str(e),
+                             "errors": [{"message": str(e), "domain": "global", "reason": e.reason}]}}
+            return self.send_json(e.code, err, {"Retry-After": e.retry_after} if e.retry_after else None)
+
+    def route(self, method, path, q, multi, body):
+        w = self.world
+        m = re.fullmatch(r"/youtube/v3/(playlistItems|videos)", path)
+        if m and method == "GET":
+            fn = w.playlist_items if m.group(1) == "playlistItems" else w.videos
+            return f"yt.{m.group(1)}", 200, fn(q)
+
+        m = re.fullmatch(r"/v4/spreadsheets/([^/:]+)(/values)?(?:/(.+?))?(:append|:batchGet|:batchUpdate)?", path)
+        if m:
+            sid, values, rng, verb = m.groups()
+            js = json.loads(body or b"{}")
+            if not values and verb is None and method == "GET":
+                return "sheets.get", 200, w.meta(sid)
+            if not values and verb == ":batchUpdate":
+                return "sheets.batchUpdate", 200, w.batch_update(sid, js.get("requests", []))
+            if values and rng is None and verb == ":batchGet":
+                major = q.get("majorDimension", "ROWS")
+                with w.lock:
+                    vrs = [w.read(sid, r, major) for r in multi.get("ranges", [])]
+                return "sheets.values.batchGet", 200, {"spreadsheetId": sid, "valueRanges": vrs}
+            if values and rng is None and verb == ":batchUpdate":
+                return "sheets.values.batchUpdate", 200, w.values_update(sid, js.get("data", []))
+            if values and rng is not None and verb == ":append":
+                return "sheets.values.append", 200, w.values_append(sid, rng, js.get("values", []))
+            if values and rng is not None and verb is None and method == "GET":
+                with w.lock:
+                    return "sheets.values.get", 200, w.read(sid, rng, q.get("majorDimension", "ROWS"))
+            if values and rng is not None and verb is None and method == "PUT":
+                return "sheets.values.update", 200, w.values_update(sid, [{"range": rng, "values": js.get("values", [])}])
+        if path == "/v4/spreadsheets" and method == "POST":
+            js = json.loads(body or b"{}")
+            f = w.create_file({"name": js.get("properties", {}).get("title", "Untitled"), "mimeType": SHEET_MIME})
+            return "sheets.create", 200, w.meta(f["id"])
+
+        m = re.fullmatch(r"(/upload)?/drive/v3/files(?:/([^/]+))?", path)
+        if m:
+            upload, fid = m.groups()
+            meta, data = {}, None
+            if upload:
+                meta, data = self.split_upload(body, q.get("uploadType", "media"))
+            elif body:
+                meta = json.loads(body)
+            fields = q.get("fields")
+            if fid is None and method == "GET":
+                return "drive.files.list", 200, w.list_files(q)
+            if fid is None and method == "POST":
+                f = w.create_file(meta, data)
+                return "drive.files.create", 200, w.public(f, fields)
+            if method == "GET" and q.get("alt") == "media":
+                with w.lock:
+                    return "drive.files.get_media", 200, w.file(fid)["data"]
+            if method == "GET":
+                with w.lock:
+                    return "drive.files.get", 200, w.public(w.file(fid), fields)
+            if method == "PATCH":
+                f = w.update_file(fid, meta, data)
+                return "drive.files.update", 200, w.public(f, fields)
+            if method == "DELETE":
+                w.delete_file(fid)
+                return "drive.files.delete", 204, b""
+        if path == "/drive/v3/about":
+            return "drive.about.get", 200, apply_fields({"kind": "drive#about", "user": {"displayName": "Fake", "me": True},
+                                                          "storageQuota": {"limit": "0", "usage": "0"}},
+                                                         parse_fields(q["fields"]) if q.get("fields") else None)
+        raise ApiError(404, "notFound", f"No fake for {method} {path}")
+
+    def split_upload(self, body, upload_type):
+        ctype = self.headers.get("Content-Type", "")
+        if upload_type != "multipart":
+            return {}, body
+        msg = BytesParser().parsebytes(b"Content-Type: " + ctype.encode() + b"\r\n\r\n" + body)
+        parts = msg.get_payload()
+        meta = json.loads(parts[0].get_payload(decode=True) or b"{}")
+        data = parts[1].get_payload(decode=True) if len(parts) > 1 else b""
+        return meta, data
+
+    def send_json(self, status, payload, headers=None):
+        self.send_raw(status, json.dumps(payload, ensure_ascii=False).encode("utf-8"),
+                      "application/json; charset=UTF-8", headers)
+
+    def send_raw(self, status, data, ctype, headers=None):
+        with self.world.lock:
+            self.world.stats["bytes_out"] += len(data)
+        self.send_response(status)
+        self.send_header("Content-Type", ctype)
+        self.send_header("Content-Length", str(len(data)))
+        for k, v in (headers or {}).items():
+            self.send_header(k, v)
+        self.end_headers()
+        if data and status != 304:
+            self.wfile.write(data)
+
+def serve(world=None, port=0):
+    """Start the fake on 127.0.0.1 in a daemon thread; returns (server, world, root_url)."""
+    world = world or World()
+    handler = type("BoundHandler", (Handler,), {"world": world})
+    srv = ThreadingHTTPServer(("127.0.0.1", port), handler)
+    srv.daemon_threads = True
+    threading.Thread(target=srv.serve_forever, daemon=True).start()
+    return srv, world, f"http://127.0.0.1:{srv.server_address[1]}"
+
+def env_for(root, keys=3):
+    """Environment that points chunk_sheets.py at a fake served from root."""
+    return {
+        "GOOGLE_API_ROOT": root,
+        "YOUTUBE_ENDPOINT": f"{root}/youtube/v3",
+        "YOUTUBE_API_KEYS": "\n".join(f"fake-key-{i}" for i in range(keys)),
+        "SOURCE_SHEET_ID": SOURCE_ID,
+        "SOURCE_SHEET_TAB": SOURCE_TAB,
+        "MAP_SHEET_TAB": MAP_TAB,
+        "CHUNKS_FOLDER_ID": FOLDER_ID,
+        "DRIVE_OAUTH_CLIENT_ID": "fake-client.apps.googleusercontent.com",
+        "DRIVE_OAUTH_CLIENT_SECRET": "fake-secret",
+        "DRIVE_OAUTH_REFRESH_TOKEN": "fake-refresh-token",
+    }
+
+def main():
+    port = int(sys.argv[1]) if len(sys.argv) > 1 else 8089
+    srv, world, root = serve(port=port)
+    print(f"FAKE_GOOGLE: {root} channels={len(world.channels)}")
+    for k, v in env_for(root).items():
+        print(f"  {k}={v!r}")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        srv.shutdown()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,236 @@
+# scripts/google_rest.py
+# Minimal REST client for the Sheets v4 and Drive v3 methods this project calls,
+# on one pooled requests.Session with bearer tokens from oauth_helper. Replaces
+# googleapiclient discovery: nothing to load at import, no per-call resource objects.
+#
+#   from google_rest import sheets, drive, HttpError
+#   sheets.values_get(spreadsheet_id, "'tab'!A1:B", retries=6)
+#   drive.files_list(q, fields="files(id,name)", retries=6)
+#
+# Retries follow googleapiclient's num_retries: 429, 5xx, 403 rate-limit reasons and
+# connection errors, with randomized exponential backoff. A 401 refreshes the token once.
+
+import json
+import random
+import threading
+import time
+from typing import Any, Dict, List, Optional, Sequence
+from urllib.parse import quote
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from oauth_helper import API_ROOT, HTTP_TIMEOUT, auth_header, refresh_now, client_stats as _oauth_stats
+
+SHEETS_ROOT = API_ROOT or "https://sheets.googleapis.com"
+DRIVE_ROOT  = API_ROOT or "https://www.googleapis.com"
+RATE_REASONS = ("userRateLimitExceeded", "rateLimitExceeded")
+
+_LOCK = threading.Lock()
+_SESSION: Optional[requests.Session] = None
+_HTTP_STATS: Dict[str, Dict[str, int]] = {}
+
+
+class _Resp:
+    def __init__(self, status: int, headers: Dict[str, str]):
+        self.status = status
+        self.headers = headers
+
+
+class HttpError(Exception):
+    """
+    Non-2xx response after retries. Like googleapiclient's HttpError it carries
+    .resp.status and the raw .content, so callers can parse the error body.
+    """
+
+    def __init__(self, status: int, content: bytes, uri: str, headers: Optional[Dict[str, str]] = None):
+        super().__init__(f"<HttpError {status} when requesting {uri}>")
+        self.resp = _Resp(status, dict(headers or {}))
+        self.content = content
+        self.uri = uri
+
+
+def _session() -> requests.Session:
+    global _SESSION
+    with _LOCK:
+        if _SESSION is None:
+            s = requests.Session()
+            s.mount("https://", HTTPAdapter(pool_connections=4, pool_maxsize=32))
+            s.mount("http://", HTTPAdapter(pool_connections=4, pool_maxsize=32))
+            s.headers["User-Agent"] = "VideosUpdate-chunker (gzip)"
+            _SESSION = s
+        return _SESSION
+
+
+def _should_retry(r: requests.Response) -> bool:
+    if r.status_code >= 500 or r.status_code == 429:
+        return True
+    if r.status_code == 403:
+        try:
+            errs = r.json().get("error", {}).get("errors", [])
+        except ValueError:
+            return False
+        return any(e.get("reason") in RATE_REASONS for e in errs)
+    return False
+
+
+def _count(api: str, r: Optional[requests.Response], sent: int) -> None:
+    with _LOCK:
+        s = _HTTP_STATS.setdefault(api, {"requests": 0, "errors": 0, "bytes_out": 0, "bytes_in": 0})
+        s["requests"] += 1
+        s["errors"] += r is None or r.status_code >= 400
+        s["bytes_out"] += sent
+        s["bytes_in"] += len(r.content) if r is not None else 0
+
+
+def request(api: str, method: str, url: str, params: Optional[Dict[str, Any]] = None,
+            body: Any = None, data: Optional[bytes] = None, content_type: Optional[str] = None,
+            retries: int = 0) -> requests.Response:
+    """
+    One API call with retries. `body` is sent as JSON, `data` as-is with content_type.
+    Returns the successful response; raises HttpError otherwise.
+    """
+    if body is not None:
+        data = json.dumps(body, ensure_ascii=False).encode("utf-8")
+        content_type = "application/json; charset=UTF-8"
+    refreshed = False
+    attempt = 0
+    while True:
+        headers = auth_header()
+        if content_type:
+            headers["Content-Type"] = content_type
+        try:
+            r = _session().request(method, url, params=params, data=data, headers=headers, timeout=HTTP_TIMEOUT)
+        except (requests.ConnectionError, requests.Timeout):
+            _count(api, None, len(data or b""))
+            if attempt >= retries:
+                raise
+            time.sleep(random.random() * 2 ** attempt)
+            attempt += 1
+            continue
+        _count(api, r, len(data or b""))
+        if r.status_code < 300:
+            return r
+        if r.status_code == 401 and not refreshed:
+            refresh_now(headers["Authorization"][len("Bearer "):])
+            refreshed = True
+            continue
+        if attempt < retries and _should_retry(r):
+            time.sleep(random.random() * 2 ** attempt)
+            attempt += 1
+            continue
+        raise HttpError(r.status_code, r.content, r.url, r.headers)
+
+
+def _multipart(meta: Dict[str, Any], media: bytes, mimetype: str):
+    boundary = f"=============={random.getrandbits(64):016x}=="
+    head = (f"--{boundary}\r\nContent-Type: application/json; charset=UTF-8\r\n\r\n"
+            f"{json.dumps(meta, ensure_ascii=False)}\r\n"
+            f"--{boundary}\r\nContent-Type: {mimetype}\r\n\r\n").encode("utf-8")
+    return head + media + f"\r\n--{boundary}--".encode("ascii"), f"multipart/related; boundary=\"{boundary}\""
+
+
+class _Sheets:
+    """
+    Sheets v4: spreadsheets.get/batchUpdate and spreadsheets.values.*.
+    """
+
+    def _url(self, spreadsheet_id: str, tail: str = "") -> str:
+        return f"{SHEETS_ROOT}/v4/spreadsheets/{quote(spreadsheet_id, safe='')}{tail}"
+
+    def get(self, spreadsheet_id: str, fields: Optional[str] = None, retries: int = 0) -> Dict[str, Any]:
+        params = {"fields": fields} if fields else None
+        return request("sheets", "GET", self._url(spreadsheet_id), params, retries=retries).json()
+
+    def batch_update(self, spreadsheet_id: str, body: Dict[str, Any], retries: int = 0) -> Dict[str, Any]:
+        return request("sheets", "POST", self._url(spreadsheet_id, ":batchUpdate"), body=body, retries=retries).json()
+
+    def values_get(self, spreadsheet_id: str, rng: str, major_dimension: str = "ROWS",
+                   retries: int = 0) -> Dict[str, Any]:
+        url = self._url(spreadsheet_id, f"/values/{quote(rng, safe='')}")
+        return request("sheets", "GET", url, {"majorDimension": major_dimension}, retries=retries).json()
+
+    def values_batch_get(self, spreadsheet_id: str, ranges: Sequence[str], major_dimension: str = "ROWS",
+                         retries: int = 0) -> Dict[str, Any]:
+        params = {"ranges": list(ranges), "majorDimension": major_dimension}
+        return request("sheets", "GET", self._url(spreadsheet_id, "/values:batchGet"), params, retries=retries).json()
+
+    def values_batch_update(self, spreadsheet_id: str, body: Dict[str, Any], retries: int = 0) -> Dict[str, Any]:
+        url = self._url(spreadsheet_id, "/values:batchUpdate")
+        return request("sheets", "POST", url, body=body, retries=retries).json()
+
+    def values_append(self, spreadsheet_id: str, rng: str, values: List[List[Any]],
+                      value_input_option: str = "RAW", insert_data_option: str = "INSERT_ROWS",
+                      retries: int = 0) -> Dict[str, Any]:
+        url = self._url(spreadsheet_id, f"/values/{quote(rng, safe='')}:append")
+        params = {"valueInputOption": value_input_option, "insertDataOption": insert_data_option}
+        return request("sheets", "POST", url, params, body={"values": values}, retries=retries).json()
+
+
+class _Drive:
+    """
+    Drive v3 files.* (all drives supported) and about.get.
+    """
+
+    FILES = "/drive/v3/files"
+    ALL_DRIVES = {"supportsAllDrives": "true"}
+
+    def files_list(self, q: str, fields: str, page_size: int = 100, page_token: Optional[str] = None,
+                   retries: int = 0) -> Dict[str, Any]:
+        params = {"q": q, "fields": fields, "pageSize": page_size, "spaces": "drive",
+                  "includeItemsFromAllDrives": "true", **self.ALL_DRIVES}
+        if page_token:
+            params["pageToken"] = page_token
+        return request("drive", "GET", DRIVE_ROOT + self.FILES, params, retries=retries).json()
+
+    def files_get(self, file_id: str, fields: str, retries: int = 0) -> Dict[str, Any]:
+        url = f"{DRIVE_ROOT}{self.FILES}/{quote(file_id, safe='')}"
+        return request("drive", "GET", url, {"fields": fields, **self.ALL_DRIVES}, retries=retries).json()
+
+    def files_get_media(self, file_id: str, retries: int = 0) -> bytes:
+        url = f"{DRIVE_ROOT}{self.FILES}/{quote(file_id, safe='')}"
+        return request("drive", "GET", url, {"alt": "media", **self.ALL_DRIVES}, retries=retries).content
+
+    def files_create(self, meta: Dict[str, Any], fields: str = "id", media: Optional[bytes] = None,
+                     mimetype: str = "application/octet-stream", retries: int = 0) -> Dict[str, Any]:
+        params = {"fields": fields, **self.ALL_DRIVES}
+        if media is None:
+            return request("drive", "POST", DRIVE_ROOT + self.FILES, params, body=meta, retries=retries).json()
+        data, ctype = _multipart(meta, media, mimetype)
+        params["uploadType"] = "multipart"
+        return request("drive", "POST", f"{DRIVE_ROOT}/upload{self.FILES}", params,
+                       data=data, content_type=ctype, retries=retries).json()
+
+    def files_update(self, file_id: str, meta: Optional[Dict[str, Any]] = None, fields: str = "id",
+                     media: Optional[bytes] = None, mimetype: str = "application/octet-stream",
+                     retries: int = 0) -> Dict[str, Any]:
+        params = {"fields": fields, **self.ALL_DRIVES}
+        fid = quote(file_id, safe="")
+        if media is None:
+            return request("drive", "PATCH", f"{DRIVE_ROOT}{self.FILES}/{fid}", params,
+                           body=meta or {}, retries=retries).json()
+        data, ctype = _multipart(meta or {}, media, mimetype)
+        params["uploadType"] = "multipart"
+        return request("drive", "PATCH", f"{DRIVE_ROOT}/upload{self.FILES}/{fid}", params,
+                       data=data, content_type=ctype, retries=retries).json()
+
+    def files_delete(self, file_id: str, retries: int = 0) -> None:
+        url = f"{DRIVE_ROOT}{self.FILES}/{quote(file_id, safe='')}"
+        request("drive", "DELETE", url, dict(self.ALL_DRIVES), retries=retries)
+
+    def about_get(self, fields: str, retries: int = 0) -> Dict[str, Any]:
+        return request("drive", "GET", f"{DRIVE_ROOT}/drive/v3/about", {"fields": fields}, retries=retries).json()
+
+
+sheets = _Sheets()
+drive = _Drive()
+
+
+def client_stats() -> Dict[str, Any]:
+    """
+    Token refreshes (oauth_helper) plus, under "http", requests/errors/bytes per API.
+    """
+    out: Dict[str, Any] = dict(_oauth_stats())
+    with _LOCK:
+        out["http"] = {api: dict(s) for api, s in _HTTP_STATS.items()}
+    return out
@@ -1,17 +1,29 @@
 # scripts/oauth_helper.py
-# Helpers to build Drive & Sheets clients using a long-lived OAuth refresh token.
+# OAuth credentials for the Drive & Sheets calls, from a long-lived refresh token.
 # Reads the following environment variables:
 #   DRIVE_OAUTH_CLIENT_ID
 #   DRIVE_OAUTH_CLIENT_SECRET
 #   DRIVE_OAUTH_REFRESH_TOKEN
+#
+# Credentials are process-wide: the refresh token is exchanged once and the access
+# token is reused until it is close to expiry. The calls themselves go through
+# google_rest.py, which sends auth_header() as a bearer token.
+#
+# GOOGLE_API_ROOT (e.g. http://127.0.0.1:8089) sends token, Drive and Sheets
+# requests to a local stand-in such as scripts/fake_google.py instead of Google.
+#
+# google-auth is imported on the first token refresh, not at import time, so jobs
+# that never reach Drive or Sheets do not pay for it.
 
 import os
 import sys
-from typing import Sequence
+import functools
+import threading
+import datetime as dt
+from typing import TYPE_CHECKING, Dict, Optional, Sequence
 
-from google.oauth2.credentials import Credentials
-from google.auth.transport.requests import Request
-from googleapiclient.discovery import build
+if TYPE_CHECKING:
+    from google.oauth2.credentials import Credentials
 
 
 # Scopes we rely on for the whole project
@@ -20,6 +32,15 @@ SCOPES: Sequence[str] = (
     "https://www.googleapis.com/auth/spreadsheets",
 )
 
+# Refresh the access token this long before Google says it expires.
+REFRESH_MARGIN = dt.timedelta(seconds=300)
+HTTP_TIMEOUT = 120
+API_ROOT = os.getenv("GOOGLE_API_ROOT", "").strip().rstrip("/")
+
+_LOCK = threading.RLock()
+_CREDS: Optional["Credentials"] = None
+_STATS: Dict[str, int] = {"refreshes": 0}
+
 
 def _need(name: str) -> str:
     val = os.getenv(name, "").strip()
@@ -29,19 +50,54 @@ def _need(name: str) -> str:
     return val
 
 
-def _user_credentials() -> Credentials:
+@functools.lru_cache(maxsize=None)
+def _shared_credentials_class():
+    from google.oauth2.credentials import Credentials
+
+    class _SharedCredentials(Credentials):
+        """
+        Credentials whose refresh is serialized across threads and counted.
+        A thread that waited for the lock reuses the token another thread just obtained.
+        """
+
+        def refresh(self, request):
+            stale = self.token
+            with _LOCK:
+                if self.token and self.token != stale and not _near_expiry(self):
+                    return
+                super().refresh(request)
+                _STATS["refreshes"] += 1
+
+    return _SharedCredentials
+
+
+def _request():
+    from google.auth.transport.requests import Request
+    return Request()
+
+
+def _near_expiry(creds: "Credentials") -> bool:
+    if not creds.token:
+        return True
+    if creds.expiry is None:
+        return False
+    # google-auth keeps expiry as naive UTC
+    now = dt.datetime.now(dt.timezone.utc).replace(tzinfo=None)
+    return creds.expiry - REFRESH_MARGIN <= now
+
+
+def _user_credentials() -> "Credentials":
     """
-    Create user credentials object from env refresh token.
-    This does NOT hit the network yet; token is fetched lazily on first request.
+    Create user credentials object from env refresh token and exchange it once.
     """
     client_id = _need("DRIVE_OAUTH_CLIENT_ID")
     client_secret = _need("DRIVE_OAUTH_CLIENT_SECRET")
     refresh_token = _need("DRIVE_OAUTH_REFRESH_TOKEN")
 
-    creds = Credentials(
+    creds = _shared_credentials_class()(
         token=None,  # access token will be obtained via refresh flow
         refresh_token=refresh_token,
-        token_uri="https://oauth2.googleapis.com/token",
+        token_uri=f"{API_ROOT}/token" if API_ROOT else "https://oauth2.googleapis.com/token",
         client_id=client_id,
         client_secret=client_secret,
         scopes=list(SCOPES),
@@ -49,8 +105,7 @@ def _user_credentials() -> Credentials:
 
     # Proactively refresh once so downstream code fails fast with a clear error.
     try:
-        Request()  # ensure import side-effects
-        creds.refresh(Request())
+        creds.refresh(_request())
     except Exception as e:
         print(
             "ERROR[OAUTH_REFRESH]: invalid OAuth refresh: "
@@ -68,17 +123,39 @@ def _user_credentials() -> Credentials:
     return creds
 
 
-def build_drive_service():
+def get_credentials() -> "Credentials":
+    """
+    Process-wide credentials with a valid access token (refreshed only near expiry).
+    """
+    global _CREDS
+    with _LOCK:
+        if _CREDS is None:
+            _CREDS = _user_credentials()
+        elif _near_expiry(_CREDS):
+            _CREDS.refresh(_request())
+        return _CREDS
+
+
+def auth_header() -> Dict[str, str]:
+    """
+    Authorization header with the current access token (refreshed near expiry).
+    """
+    return {"Authorization": f"Bearer {get_credentials().token}"}
+
+
+def refresh_now(stale: str) -> None:
     """
-    v3 Drive client with supportsAllDrives enabled in requests where applicable.
+    Refresh after a 401 on token `stale`, unless another thread already replaced it.
     """
-    creds = _user_credentials()
-    return build("drive", "v3", credentials=creds, cache_discovery=False)
+    with _LOCK:
+        creds = get_credentials()
+        if creds.token == stale:
+            creds.refresh(_request())
 
 
-def build_sheets_service():
+def client_stats() -> Dict[str, int]:
     """
-    v4 Sheets client using the same user credentials.
+    Counters for this process: token refreshes.
     """
-    creds = _user_credentials()
-    return build("sheets", "v4", credentials=creds, cache_discovery=False)
+    with _LOCK:
+        return dict(_STATS)
@@ -2,31 +2,23 @@
 # Small diagnostic to confirm the OAuth refresh token works and Drive/Sheets are reachable.
 
 import sys, json
-from googleapiclient.errors import HttpError
-from oauth_helper import build_drive_service, build_sheets_service
+from oauth_helper import get_credentials
 
 def main():
-    # 1) Try exchanging refresh->access implicitly by building clients
+    # 1) Exchange refresh->access (get_credentials refreshes eagerly)
     print("OAUTH_PROBE: requesting access_token via refresh_token (no scope)...")
     try:
-        # Build services (this performs a refresh under the hood)
-        drive = build_drive_service()
-        sheets = build_sheets_service()
+        get_credentials()
         print("OAUTH_PROBE: status = 200")
-    except HttpError as e:
-        try:
-            body = e.content.decode() if isinstance(e.content, bytes) else (e.content or "")
-        except Exception:
-            body = str(e)
-        print("OAUTH_PROBE: ERROR", getattr(e.resp, "status", None), body[:400])
-        sys.exit(2)
     except Exception as e:
         print("OAUTH_PROBE: ERROR", type(e).__name__, str(e)[:400])
         sys.exit(2)
 
     # 2) Call a harmless Drive endpoint to verify scope drive.file or drive
+    # the REST client (and requests) only load once the token is known to work
+    from google_rest import drive, HttpError
     try:
-        about = drive.about().get(fields="user,storageQuota").execute()
+        about = drive.about_get(fields="user,storageQuota")
         print("DRIVE about.get status = 200")
         # Trim noisy fields before printing
         safe = {
@@ -0,0 +1,13 @@
+# tests/conftest.py
+# scripts/ is not a package: put it on sys.path so tests can import chunk_sheets and
+# fake_google directly. chunk_sheets reads its configuration at import time, so the
+# environment it needs is set here, before any test module imports it.
+#
+# Run from the repository root: python -m pytest -q tests
+
+import os, sys
+
+SCRIPTS = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "scripts")
+sys.path.insert(0, SCRIPTS)
+
+os.environ.setdefault("YOUTUBE_API_KEYS", "test-key-0\ntest-key-1")
@@ -0,0 +1,45 @@
+# tests/test_docs.py
+# Placing playlists in chunk docs.
+
+import threading
+
+import chunk_sheets as cs
+
+def test_new_doc_created_once_outside_st_lock(monkeypatch):
+    created = []
+    lock_free = []
+    release = threading.Event()
+    def probe():
+        ok = cs.ST_LOCK.acquire(timeout=5)
+        if ok:
+            cs.ST_LOCK.release()
+        lock_free.append(ok)
+    def create(name, folder_id):
+        # other threads can take ST_LOCK while the Drive call is in flight
+        t = threading.Thread(target=probe)
+        t.start(); t.join()
+        release.wait(5)
+        created.append(name)
+        return f"doc-{len(created)}"
+    monkeypatch.setattr(cs, "drive_create_sheet_in_folder", create)
+    monkeypatch.setattr(cs, "write_doc", lambda doc_id: 1)
+    monkeypatch.setattr(cs, "DOC_GRIDS", {})
+    st = {"docs": [{"id": "full", "name": "VideosChunk_0003", "rows": cs.ROWS_PER_DOC}], "playlist_to_doc": {}}
+    out = {}
+    threads = [threading.Thread(target=lambda p=p: out.setdefault(p, cs.pick_doc_for_playlist(st, p)))
+               for p in ("p1", "p2", "p3")]
+    for t in threads:
+        t.start()
+    release.set()
+    for t in threads:
+        t.join(10)
+    assert created == ["VideosChunk_0004"]
+    assert lock_free == [True]
+    assert out == {"p1": "doc-1", "p2": "doc-1", "p3": "doc-1"}
+    assert st["playlist_to_doc"] == out
+    assert [d["id"] for d in st["docs"]] == ["full", "doc-1"]
+    assert cs.NEW_DOC == {}
+    # placed playlists and docs with room are used without creating anything
+    assert cs.pick_doc_for_playlist(st, "p1") == "doc-1"
+    assert cs.pick_doc_for_playlist(st, "p4") == "doc-1"
+    assert created == ["VideosChunk_0004"]
@@ -0,0 +1,314 @@
+# tests/test_end_to_end.py
+# chunk_sheets.py run as a subprocess against fake_google.py; assertions are on what
+# ends up in the fake's spreadsheets and Drive files.
+
+import os, sys, json, subprocess, collections
+import datetime as dt
+
+import pytest
+
+import chunk_sheets as cs
+from fake_google import World, serve, env_for, SHEET_MIME, SOURCE_ID
+
+SCRIPT = os.path.join(os.path.dirname(os.path.abspath(cs.__file__)), "chunk_sheets.py")
+COL = {h: i for i, h in enumerate(cs.HEADERS)}
+
+def run_script(env):
+    r = subprocess.run([sys.executable, SCRIPT], env=env, capture_output=True, text=True, timeout=300)
+    assert r.returncode == 0, r.stdout[-3000:] + r.stderr[-3000:]
+    return r.stdout
+
+def sheet_rows(world, title):
+    """{videoId: row} over every spreadsheet tab called `title`, blank rows skipped."""
+    out = {}
+    for book in world.sheets.values():
+        for tab in book["tabs"]:
+            if tab["title"] != title:
+                continue
+            for row in tab["rows"][1:]:
+                if row and row[0]:
+                    assert row[0] not in out, f"{row[0]} written twice"
+                    out[row[0]] = list(row)
+    return out
+
+def drive_json(world, name):
+    """A JSON file the script keeps in Drive (chunks_state.json, ...), or None."""
+    f = next((f for f in world.files.values() if f["name"] == name and not f.get("trashed")), None)
+    return json.loads(f["data"]) if f else None
+
+def expected_videos(world, skip=()):
+    """{videoId: (playlistId, published, item)} for the long-form uploads the fake serves now."""
+    out = {}
+    for pid in world.channels:
+        if pid in skip:
+            continue
+        for vid, published in world.uploads(pid):
+            it = world.video(vid, pid, published)
+            if it is None:
+                continue
+            if cs.iso_to_sec(it["contentDetails"]["duration"]) <= cs.SHORTS_LIMIT:
+                continue
+            out[vid] = (pid, published, it)
+    return out
+
+def check_sheet(world):
+    """
+    Sheet rows are exactly the fake's long-form uploads in the window, with current
+    counts. Playlists over the annual cap are not written at all.
+    """
+    rows = sheet_rows(world, "videos")
+    overflow = drive_json(world, cs.STATE_NAME).get("overflow") or {}
+    want = expected_videos(world, skip=overflow)
+    now = dt.datetime.now(dt.timezone.utc)
+    age = lambda published: now - dt.datetime.fromisoformat(published.replace("Z", "+00:00"))
+    window = dt.timedelta(days=cs.WINDOW_DAYS)
+    # a day of slack on either side of the window edge, which moves while the script runs
+    inside = {v for v, (_, p, _) in want.items() if age(p) < window - dt.timedelta(days=1)}
+    near = {v for v, (_, p, _) in want.items() if age(p) < window + dt.timedelta(days=1)}
+    assert inside <= set(rows) <= near
+    for vid, row in rows.items():
+        pid, published, it = want[vid]
+        st = it["statistics"]
+        assert row[COL["playlistId"]] == pid
+        assert row[COL["publishedAt"]] == cs.fmt_baku(published)
+        assert int(row[COL["duration_s"]]) == cs.iso_to_sec(it["contentDetails"]["duration"])
+        assert row[COL["isShorts"]] == "FALSE"
+        assert row[COL["isTombstoned"]] == "FALSE"
+        assert [str(row[COL[k]]) for k in ("viewCount", "likeCount", "commentCount")] == \
+            [st["viewCount"], st["likeCount"], st["commentCount"]]
+    return rows
+
+def start_fake(tmp_path, store=False, channels=8):
+    """A fake served in this process and the environment that points the script at it."""
+    srv, world, root = serve(World(channels=channels))
+    env = dict(os.environ)
+    env.update(env_for(root))
+    env.update(PLAYLIST_LIMIT=str(len(world.channels)), REFRESH_MAX_DAYS="0", YT_KEY_QPS="200",
+               SOURCE_CACHE=str(tmp_path / "source.json"), PYTHONUNBUFFERED="1")
+    if store:
+        env["STORE_PATH"] = str(tmp_path / "store.sqlite")
+    return srv, world, env
+
+@pytest.fixture(params=["direct", "store"])
+def fake(request, tmp_path):
+    srv, world, env = start_fake(tmp_path, store=request.param == "store")
+    yield world, env
+    srv.shutdown()
+
+@pytest.fixture
+def fake_direct(tmp_path):
+    srv, world, env = start_fake(tmp_path)
+    yield world, env
+    srv.shutdown()
+
+def test_incremental_and_stats_runs(fake):
+    world, env = fake
+    run_script(env)
+    first = check_sheet(world)
+    assert first
+
+    world.advance(48)  # new uploads appear and every view count grows
+    out = run_script(env)
+    rows = check_sheet(world)
+    new = set(rows) - set(first)
+    assert new, "the second run picked up no new uploads"
+    assert all(row[COL["firstSeenAt"]] == first[v][COL["firstSeenAt"]] for v, row in rows.items() if v in first)
+    changed = sum(rows[v][COL["viewCount"]] != first[v][COL["viewCount"]] for v in first)
+    assert changed, "the stats refresh updated no view counts"
+    assert "stats=0 " not in out.split("DONE[PLAYLIST]", 1)[1]
+
+    # VideosIndex points every playlist at the chunk doc holding its rows
+    index = sheet_rows(world, "index")
+    assert set(index) == set(world.channels) - set(drive_json(world, cs.STATE_NAME).get("overflow") or {})
+    doc_rows = collections.Counter()
+    for sid, book in world.sheets.items():
+        for tab in book["tabs"]:
+            if tab["title"] == "videos":
+                for row in tab["rows"][1:]:
+                    if row and row[0]:
+                        assert index[row[COL["playlistId"]]][1] == sid
+                        doc_rows[sid] += 1
+    for pid, r in index.items():
+        f = world.files[r[1]]
+        assert f["name"] == r[2] and f["mimeType"] == SHEET_MIME
+        assert 0 < int(r[4]) <= doc_rows[r[1]]
+
+def test_rerun_without_changes_writes_nothing_new(fake):
+    world, env = fake
+    run_script(env)
+    before = {sid: [list(r) for t in b["tabs"] if t["title"] == "videos" for r in t["rows"]]
+              for sid, b in world.sheets.items()}
+    run_script(env)
+    after = {sid: [list(r) for t in b["tabs"] if t["title"] == "videos" for r in t["rows"]]
+             for sid, b in world.sheets.items()}
+    skip = {COL["lastUpdatedAt"]}
+    strip = lambda rows: [[x for i, x in enumerate(r) if i not in skip] for r in rows if r and r[0]]
+    assert {k: strip(v) for k, v in before.items()} == {k: strip(v) for k, v in after.items()}
+    check_sheet(world)
+
+def test_shorts_cache(fake):
+    world, env = fake
+    run_script(env)
+    world.advance(72)
+    run_script(env)
+    st = drive_json(world, cs.STATE_NAME)
+    since = cs.window_start()
+    uploads = {vid: (pid, published) for pid in world.channels for vid, published in world.uploads(pid)}
+    # every entry is a Short with its publish date, inside the window
+    for vid, published in st["shorts"].items():
+        pid, pa = uploads[vid]
+        assert published == pa and published >= since
+        assert cs.iso_to_sec(world.video(vid, pid, pa)["contentDetails"]["duration"]) <= cs.SHORTS_LIMIT
+    # and every Short of a playlist that is still scanned is remembered
+    scanned = set(world.channels) - set(st.get("overflow") or {})
+    for vid, (pid, published) in uploads.items():
+        it = world.video(vid, pid, published)
+        if pid in scanned and it and published >= since and \
+                cs.iso_to_sec(it["contentDetails"]["duration"]) <= cs.SHORTS_LIMIT:
+            assert vid in st["shorts"]
+    assert not set(st["shorts"]) & set(sheet_rows(world, "videos"))
+
+def source_reads(world):
+    """Records the source sheet's metadata gets and value reads as they happen."""
+    seen = []
+    public, read = world.public, world.read
+    def traced_public(f, fields):
+        if f["id"] == SOURCE_ID:
+            seen.append(("meta", fields))
+        return public(f, fields)
+    def traced_read(sid, rng, major="ROWS"):
+        if sid == SOURCE_ID:
+            seen.append(("values", rng))
+        return read(sid, rng, major)
+    world.public, world.read = traced_public, traced_read
+    return seen
+
+def test_source_cache(fake_direct):
+    world, env = fake_direct
+    seen = source_reads(world)
+    run_script(env)
+    assert ("meta", "modifiedTime") in seen and any(k == "values" for k, _ in seen)
+    seen.clear()
+    out = run_script(env)
+    assert seen == [("meta", "modifiedTime")]
+    assert "INFO[SOURCE_CACHE]: unchanged" in out
+    # an edit to the source sheet shows up as a new modifiedTime
+    world.touch(SOURCE_ID)
+    seen.clear()
+    run_script(env)
+    assert ("meta", "modifiedTime") in seen and any(k == "values" for k, _ in seen)
+    check_sheet(world)
+
+def test_no_source_cache_skips_modified_time(fake_direct):
+    world, env = fake_direct
+    env.pop("SOURCE_CACHE")
+    seen = source_reads(world)
+    run_script(env)
+    assert seen and all(k == "values" for k, _ in seen)
+
+def test_overflow_projection_and_cooldown(fake_direct):
+    world, env = fake_direct
+    # channel 0 uploads every two hours: ~4380 a year, far past the annual cap
+    pid = next(p for p, c in world.channels.items() if c[0] == 0)
+    i, title, _, _ = world.channels[pid]
+    world.channels[pid] = (i, title, 9000, 2)
+    source = world.sheets[SOURCE_ID]["tabs"][0]
+    assert source["rows"][1 + i][1] == pid
+    source["rows"][1 + i][2] = "9000"
+    pages = collections.Counter()
+    listing = world.playlist_items
+    def traced(q):
+        pages[q.get("playlistId")] += 1
+        return listing(q)
+    world.playlist_items = traced
+
+    run_script(env)
+    overflow = drive_json(world, cs.STATE_NAME)["overflow"]
+    assert overflow[pid]["count"] >= cs.ANNUAL_LIMIT * cs.OVERFLOW_MARGIN
+    assert pages[pid] == 1, "the projection should stop after the first page"
+    assert not any(row[COL["playlistId"]] == pid for row in check_sheet(world).values())
+
+    pages.clear()
+    out = run_script(env)
+    assert "INFO[OVERFLOW_COOLDOWN]: skipped=" in out
+    assert pages[pid] == 0
+    check_sheet(world)
+
+def test_resume_after_kill(fake_direct):
+    world, env = fake_direct
+    env["CHECKPOINT_SECS"] = "0"  # checkpoint after every playlist
+    p = subprocess.Popen([sys.executable, SCRIPT], env=env, stdout=subprocess.PIPE,
+                         stderr=subprocess.STDOUT, text=True)
+    try:
+        for line in p.stdout:
+            if line.startswith("INFO[CHECKPOINT]"):
+                break
+        p.kill()  # no chance to save anything on the way out
+    finally:
+        p.wait(timeout=30)
+        p.stdout.close()
+    progress = drive_json(world, cs.STATE_NAME)["progress"]
+    done = progress["done"]
+    assert done and not progress["complete"]
+
+    pages = collections.Counter()
+    listing = world.playlist_items
+    def traced(q):
+        pages[q.get("playlistId")] += 1
+        return listing(q)
+    world.playlist_items = traced
+    out = run_script(env)
+    assert "INFO[RESUME]: " in out
+    assert not any(pages[pid] for pid in done), "finished playlists were listed again"
+    progress = drive_json(world, cs.STATE_NAME)["progress"]
+    assert progress["complete"] and set(progress["done"]) >= set(done)
+    check_sheet(world)
+
+def yt_cache_line(out):
+    """{'revalidated': n, 'stored': n, 'evicted': n} from the run's closing YT_CACHE line."""
+    line = [l for l in out.splitlines() if l.startswith("INFO[YT_CACHE]: revalidated=")][-1]
+    return {k: int(v) for k, v in (kv.split("=") for kv in line.split(": ", 1)[1].split())}
+
+def test_yt_etag_cache(fake_direct, tmp_path):
+    world, env = fake_direct
+    env["YT_CACHE_PATH"] = str(tmp_path / "yt_cache.sqlite")
+    c = yt_cache_line(run_script(env))
+    assert c["stored"] and not c["revalidated"]
+    check_sheet(world)
+
+    # nothing changed: every playlist head page comes back as a 304 and is served from the cache
+    world.reset_stats()
+    c = yt_cache_line(run_script(env))
+    assert c["revalidated"] >= world.snapshot()["calls"]["yt.playlistItems"] > 0
+    check_sheet(world)
+
+    # new uploads and counts change the etags; the cached bodies must not be served
+    world.advance(48)
+    run_script(env)
+    check_sheet(world)
+
+def test_compaction_deletes_tombstoned_rows(fake):
+    world, env = fake
+    env["COMPACT_SHARE"] = "0"  # any tombstone makes its doc due
+    run_script(env)
+    first = check_sheet(world)
+
+    # half of one playlist's videos stop coming back from videos.list
+    pid = collections.Counter(r[COL["playlistId"]] for r in first.values()).most_common(1)[0][0]
+    mine = sorted(v for v, r in first.items() if r[COL["playlistId"]] == pid)
+    gone = set(mine[::2])
+    video = world.video
+    world.video = lambda vid, p, published: None if vid in gone else video(vid, p, published)
+    out = run_script(env)
+    assert "INFO[COMPACT_DOC]: " in out
+
+    rows = check_sheet(world)
+    assert not gone & set(rows) and set(mine) - gone <= set(rows)
+    st = drive_json(world, cs.STATE_NAME)
+    vx = drive_json(world, cs.VIDEO_INDEX_NAME)
+    for d in st["docs"]:
+        tab = world.tab(d["id"], "videos")
+        ids = [r[0] if r else "" for r in tab["rows"][1:]]
+        # the dead rows were deleted, not blanked, and every index agrees with the sheet
+        assert all(ids) and d["rows"] == len(ids) and not d.get("dead")
+        assert vx["docs"][d["id"]]["ids"].split(",") == ids
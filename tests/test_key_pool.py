@@ -0,0 +1,43 @@
+# tests/test_key_pool.py
+
+import time
+
+import chunk_sheets as cs
+
+def test_key_pool_retire():
+    pool = cs.KeyPool(["k1", "k2"], daily_quota=100, qps=1000)
+    assert pool.acquire(1) == "k1"
+    pool.retire("k1")
+    pool.retire("k1")
+    assert pool.rotations == 1
+    assert {pool.acquire(1) for _ in range(5)} == {"k2"}
+    assert pool.remaining() == 100 - 5
+    saved = pool.dump()
+    assert saved["keys"][cs.key_fp("k1")] == {"spent": 1, "retired": True}
+
+    restored = cs.KeyPool(["k1", "k2"], daily_quota=100, qps=1000)
+    restored.load(saved)
+    assert restored.retired == {"k1"} and restored.spent["k2"] == 5
+    stale = cs.KeyPool(["k1", "k2"], daily_quota=100, qps=1000)
+    stale.load(dict(saved, day="2000-01-01"))
+    assert not stale.retired and stale.spent == {"k1": 0, "k2": 0}
+
+    pool.retire("k2")
+    assert pool.acquire(1) is None and pool.remaining() == 0
+
+def test_key_pool_quota_exhaustion():
+    pool = cs.KeyPool(["k1", "k2"], daily_quota=10, qps=1000)
+    got = [pool.acquire(4) for _ in range(5)]
+    assert sorted(got[:4]) == ["k1", "k1", "k2", "k2"] and got[4] is None
+    assert pool.acquire(2) in ("k1", "k2")
+    assert pool.remaining() == 2 and pool.run_units == 18
+
+def test_key_pool_cool():
+    pool = cs.KeyPool(["k1", "k2"], daily_quota=100, qps=1000)
+    pool.cool("k1", 60)
+    assert pool.acquire(1) == "k2"
+    pool.cool("k2", 0.3)
+    t0 = time.monotonic()
+    assert pool.acquire(1) == "k2"
+    assert time.monotonic() - t0 >= 0.25
+    assert pool.rotations == 2 and pool.spent == {"k1": 0, "k2": 2}
@@ -0,0 +1,87 @@
+# tests/test_listing.py
+# Uploads-playlist paging, with a stub in place of playlistItems.list.
+
+import datetime as dt
+
+import chunk_sheets as cs
+
+SINCE = "2026-01-01T00:00:00Z"
+
+def stub_listing(monkeypatch, videos, etag="e1", size=3):
+    """playlistItems pages over [(videoId, publishedAt)] newest first; returns the page tokens asked for."""
+    asked = []
+    def yt_get(path, params, cost=1):
+        assert path == "playlistItems"
+        start = int(params.get("pageToken", "0"))
+        asked.append(start)
+        page = videos[start:start + size]
+        js = {"etag": etag, "items": [{"contentDetails": {"videoId": v, "videoPublishedAt": pa}} for v, pa in page]}
+        if start + size < len(videos):
+            js["nextPageToken"] = str(start + size)
+        return js
+    monkeypatch.setattr(cs, "yt_get", yt_get)
+    return asked
+
+VIDEOS = [(f"v{i}", f"2026-0{9 - i}-01T00:00:00Z") for i in range(9)]  # v0 newest
+
+def test_first_scan_lists_the_window(monkeypatch):
+    asked = stub_listing(monkeypatch, VIDEOS)
+    out, etag, projected = cs.list_since("UU1", "2026-04-15T00:00:00Z")
+    assert out == dict(VIDEOS[:5]) and etag == "e1" and projected is None
+    assert asked == [0, 3]
+
+def test_incremental_scan_stops_at_a_known_video(monkeypatch):
+    asked = stub_listing(monkeypatch, VIDEOS)
+    known = dict(VIDEOS[2:6])
+    out, _, _ = cs.list_since("UU1", SINCE, known=known, head_etag="old")
+    assert out == dict(VIDEOS[:2])
+    assert asked == [0]
+
+def test_unchanged_head_etag_reads_one_page(monkeypatch):
+    asked = stub_listing(monkeypatch, VIDEOS, etag="same")
+    out, etag, _ = cs.list_since("UU1", SINCE, known=dict(VIDEOS[5:]), head_etag="same")
+    assert out == {} and etag == "same" and asked == [0]
+
+def test_annual_cap(monkeypatch):
+    stub_listing(monkeypatch, VIDEOS)
+    out, _, count = cs.list_since("UU1", SINCE, limit_annual=4)
+    assert out is None and count == 4
+
+# ---------- annual cap projection ----------
+
+def uploads_every(hours, n):
+    now = dt.datetime.now(dt.timezone.utc).replace(microsecond=0)
+    return [(f"b{i}", (now - dt.timedelta(hours=hours * i + 1)).isoformat().replace("+00:00", "Z")) for i in range(n)]
+
+def test_project_annual():
+    since = cs.window_start()
+    page = [{"contentDetails": {"videoPublishedAt": pa}} for _, pa in uploads_every(24, 50)]
+    # 50 videos over ~49 days -> about 370 a year
+    assert 360 <= cs.project_annual(page, since) <= 380
+    assert cs.project_annual(page[:49], since) is None  # not a full page
+    old = [{"contentDetails": {"videoPublishedAt": "2000-01-01T00:00:00Z"}}] * 50
+    assert cs.project_annual(old, since) is None  # the page already reaches the window's start
+
+def test_projection_stops_busy_playlists_after_one_page(monkeypatch):
+    videos = uploads_every(2, 1200)  # ~4380 a year
+    asked = stub_listing(monkeypatch, videos, size=50)
+    out, _, projected = cs.list_since("UU1", cs.window_start(), project=True)
+    assert out is None and asked == [0]
+    assert projected >= cs.ANNUAL_LIMIT * cs.OVERFLOW_MARGIN
+    # without projection the same playlist is paged until the cap
+    asked = stub_listing(monkeypatch, videos, size=50)
+    out, _, count = cs.list_since("UU1", cs.window_start())
+    assert out is None and count == cs.ANNUAL_LIMIT and len(asked) == 21
+
+def test_scan_playlist_records_overflow(monkeypatch):
+    stub_listing(monkeypatch, uploads_every(2, 600), size=50)
+    st = {"docs": [], "playlist_to_doc": {}, "playlists": {"UU1": {"etag": "", "videos": {}}}}
+    assert cs.scan_playlist(st, "UU1", cs.window_start(), video_count=9000) == ([], [], [], None)
+    assert st["overflow"]["UU1"]["count"] >= cs.ANNUAL_LIMIT * cs.OVERFLOW_MARGIN
+    assert "UU1" not in st["playlists"]
+    assert cs.in_overflow_cooldown(st, "UU1")
+    # a channel with fewer videos than the cap is listed in full, never projected
+    stub_listing(monkeypatch, uploads_every(2, 600), size=50)
+    st = {"docs": [], "playlist_to_doc": {}}
+    new, known, expired, scan = cs.scan_playlist(st, "UU2", cs.window_start(), video_count=600)
+    assert len(new) == 600 and scan["videos"] and not st.get("overflow")
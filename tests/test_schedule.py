@@ -0,0 +1,70 @@
+# tests/test_schedule.py
+# Refresh scheduler, simulated over days of runs with fixed upload rates.
+
+import math
+import datetime as dt
+
+import chunk_sheets as cs
+
+RATES = [5, 2, 1, 0.3, 0.1, 0.02, 0]  # new videos per day
+
+def simulate_schedule(monkeypatch, limit, days=28, n=300):
+    """Daily runs over n playlists with fixed upload rates; (rate by playlist, run days by playlist)."""
+    monkeypatch.setattr(cs, "REFRESH_MIN_DAYS", 1)
+    monkeypatch.setattr(cs, "REFRESH_MAX_DAYS", 7)
+    monkeypatch.setattr(cs, "REFRESH_COVER_SHARE", 0.25)
+    pids = [f"P{i:03d}" for i in range(n)]
+    rate = {p: RATES[i % len(RATES)] for i, p in enumerate(pids)}
+    st = {"activity": {}, "quota": {"units_per_playlist": 3}}
+    today = dt.datetime.utcnow().date()
+    scans = {p: [] for p in pids}
+    for day in range(days):
+        picked = cs.schedule(st, pids, limit)
+        assert len(picked) <= limit and len(set(picked)) == len(picked)
+        for p in picked:
+            st["activity"][p] = {"at": today.isoformat() + "T00:00:00Z", "new": rate[p], "churn": 0, "units": 3}
+            scans[p].append(day)
+        for a in st["activity"].values():  # a day passes
+            a["at"] = (dt.date.fromisoformat(a["at"][:10]) - dt.timedelta(days=1)).isoformat() + "T00:00:00Z"
+    return rate, scans
+
+def gaps(runs, days=28):
+    return [b - a for a, b in zip(runs, runs[1:])] + [days - runs[-1]]
+
+def test_schedule_refresh_intervals(monkeypatch, capsys):
+    # room for every due playlist: each is scanned on its own interval
+    rate, scans = simulate_schedule(monkeypatch, limit=300)
+    capsys.readouterr()
+    for p, runs in scans.items():
+        assert runs[0] == 0
+        g = gaps(runs)[:-1]
+        if rate[p] >= 1:
+            assert set(g) == {1}, (p, runs)
+        else:
+            want = min(7, max(1, math.ceil(1 / rate[p]))) if rate[p] else 7
+            assert set(g) == {want}, (p, rate[p], runs)
+
+def test_schedule_covers_every_playlist_under_a_tight_limit(monkeypatch, capsys):
+    rate, scans = simulate_schedule(monkeypatch, limit=60)
+    capsys.readouterr()
+    # never-scanned playlists go first: one pass over the list takes ceil(300 / 60) runs
+    assert all(runs and runs[0] < 5 for runs in scans.values())
+    # busy channels could fill every run alone; the cover share still comes back to quiet ones
+    assert all(len(runs) >= 2 and max(gaps(runs)[:-1]) <= 2 * 7 for runs in scans.values())
+    per_rate = {r: sum(len(scans[p]) for p in scans if rate[p] == r) for r in RATES}
+    assert per_rate[5] > per_rate[0.3] > per_rate[0]
+
+def test_schedule_skips_playlists_not_due(monkeypatch, capsys):
+    monkeypatch.setattr(cs, "REFRESH_MIN_DAYS", 1)
+    monkeypatch.setattr(cs, "REFRESH_MAX_DAYS", 7)
+    today = dt.datetime.utcnow().date()
+    at = lambda days: (today - dt.timedelta(days=days)).isoformat() + "T00:00:00Z"
+    st = {"activity": {
+        "busy":  {"at": at(1), "new": 5, "churn": 0, "units": 3},
+        "quiet": {"at": at(3), "new": 0.1, "churn": 0, "units": 3},   # due every 7 days
+        "stale": {"at": at(8), "new": 0, "churn": 0, "units": 3},
+        "today": {"at": at(0), "new": 5, "churn": 0, "units": 3},
+    }}
+    assert cs.schedule(st, ["busy", "quiet", "stale", "today", "fresh"], 10) == ["fresh", "stale", "busy"]
+    assert cs.schedule(st, ["busy", "quiet", "stale", "today", "fresh"], 1) == ["fresh"]
+    capsys.readouterr()
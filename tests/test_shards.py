@@ -0,0 +1,75 @@
+# tests/test_shards.py
+# Folding shard state fragments back into one state.
+
+import chunk_sheets as cs
+
+def test_merge_fragment_takes_only_owned_parts(monkeypatch):
+    monkeypatch.setattr(cs, "SHARD_COUNT", 2)
+    # playlists outside any doc are placed by id hash
+    by_shard = [[p for p in (f"UU{i}" for i in range(100)) if cs.stable_hash(p) % 2 == s] for s in (0, 1)]
+    (new0, gone0), other1 = by_shard[0][:2], by_shard[1][0]
+    base = {
+        "docs": [{"id": "D0", "name": "VideosChunk_0002", "rows": 10, "shard": 0},
+                 {"id": "D1", "name": "VideosChunk_0001", "rows": 20, "shard": 1}],
+        "playlist_to_doc": {"p0": "D0", "p0old": "D0", "p1": "D1"},
+        "playlists": {"p0": {"etag": "a"}, "p1": {"etag": "b"}, gone0: {"etag": "c"}, other1: {"etag": "d"}},
+        "activity": {"p1": {"new": 1}},
+        "shorts": {"s1": 1},
+        "quota": {"day": "2026-01-01", "keys": {"old": {"spent": 5}}},
+        "progress": {"day": "2026-01-02", "done": ["p1"], "complete": True},
+    }
+    frag = {
+        "docs": [{"id": "D0", "name": "VideosChunk_0002", "rows": 15, "shard": 0},
+                 {"id": "D1", "name": "VideosChunk_0001", "rows": 99, "shard": 1},
+                 {"id": "D2", "name": "VideosChunk_0004", "rows": 3, "shard": 0}],
+        "playlist_to_doc": {"p0": "D0", "p1": "D1", new0: "D2"},
+        "playlists": {"p0": {"etag": "A"}, "p1": {"etag": "stale"}, new0: {"etag": "N"}},
+        "activity": {"p0": {"new": 2}, "p1": {"new": 9}},
+        "shorts": {"s2": 1},
+        "quota": {"day": "2026-01-02", "keys": {"k": {"spent": 7}}},
+        "progress": {"day": "2026-01-02", "done": ["p0", new0], "complete": False},
+    }
+    owned = cs.merge_fragment(base, 0, frag)
+    assert owned == {"D0", "D2"}
+    assert [(d["id"], d["rows"]) for d in base["docs"]] == [("D1", 20), ("D0", 15), ("D2", 3)]
+    # p0old sat in an owned doc and is gone from the fragment: compacted away
+    assert base["playlist_to_doc"] == {"p0": "D0", "p1": "D1", new0: "D2"}
+    assert base["playlists"] == {"p0": {"etag": "A"}, "p1": {"etag": "b"}, new0: {"etag": "N"}, other1: {"etag": "d"}}
+    assert base["activity"] == {"p0": {"new": 2}, "p1": {"new": 1}}
+    assert base["shorts"] == {"s1": 1, "s2": 1}
+    assert base["quota"] == {"day": "2026-01-02", "keys": {"k": {"spent": 7, "retired": False}}}
+    assert base["progress"] == {"day": "2026-01-02", "done": sorted(["p0", "p1", new0]), "complete": False}
+
+def test_merge_fragment_sums_shared_keys(monkeypatch):
+    monkeypatch.setattr(cs, "SHARD_COUNT", 2)
+    base = {"docs": [], "playlist_to_doc": {}, "progress": {"day": None, "done": [], "complete": True},
+            "quota": {"day": "2026-01-02", "keys": {"shared": {"spent": 100, "retired": False},
+                                                     "own0": {"spent": 10, "retired": False}}}}
+    prior = cs.snapshot(base["quota"])
+    # both shards started from base's tally and spent on top of it
+    frag0 = {"quota": {"day": "2026-01-02", "keys": {"shared": {"spent": 400, "retired": False},
+                                                      "own0": {"spent": 60, "retired": True}}}}
+    frag1 = {"quota": {"day": "2026-01-02", "keys": {"shared": {"spent": 250, "retired": True}}}}
+    cs.merge_fragment(base, 0, frag0, prior)
+    cs.merge_fragment(base, 1, frag1, prior)
+    assert base["quota"]["keys"] == {"shared": {"spent": 100 + 300 + 150, "retired": True},
+                                     "own0": {"spent": 60, "retired": True}}
+
+def test_merge_fragment_new_quota_day(monkeypatch):
+    monkeypatch.setattr(cs, "SHARD_COUNT", 2)
+    base = {"docs": [], "playlist_to_doc": {}, "progress": {"day": None, "done": [], "complete": True},
+            "quota": {"day": "2026-01-01", "keys": {"shared": {"spent": 9000, "retired": True}}}}
+    prior = cs.snapshot(base["quota"])
+    for shard, spent in ((0, 30), (1, 20)):
+        cs.merge_fragment(base, shard, {"quota": {"day": "2026-01-02", "keys": {"shared": {"spent": spent}}}}, prior)
+    assert base["quota"] == {"day": "2026-01-02", "keys": {"shared": {"spent": 50, "retired": False}}}
+
+def test_plan_budget_shares_keys_between_shards(monkeypatch, capsys):
+    monkeypatch.setattr(cs, "KEYS", cs.KeyPool(["k"], daily_quota=1200))
+    monkeypatch.setattr(cs, "SHARD_COUNT", 4)
+    st = {"quota": {"units_per_playlist": 3}}
+    monkeypatch.setattr(cs, "KEYS_SHARED", False)
+    assert cs.plan_budget(st, 1000) == 400
+    monkeypatch.setattr(cs, "KEYS_SHARED", True)
+    assert cs.plan_budget(st, 1000) == 100
+    assert "INFO[QUOTA_SHARED]: 1 keys for 4 shards" in capsys.readouterr().out
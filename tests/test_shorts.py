@@ -0,0 +1,37 @@
+# tests/test_shorts.py
+# The Shorts cache: verdicts from a durations-only fetch, kept until the video
+# leaves the window.
+
+import chunk_sheets as cs
+
+def durations_batcher(monkeypatch, secs):
+    calls = []
+    def fetch(ids):
+        calls.append(list(ids))
+        return [(v, secs[v]) for v in ids if v in secs]
+    monkeypatch.setattr(cs, "VIDEOS", cs.VideoBatcher({"durations": (fetch, lambda it: it[0])}))
+    monkeypatch.setattr(cs, "VX", {"docs": {}, "where": {}, "dirty": set()})
+    return calls
+
+def test_classify_shorts_remembers_verdicts(monkeypatch):
+    calls = durations_batcher(monkeypatch, {"s1": 30, "s2": cs.SHORTS_LIMIT, "l1": 600, "x": None})
+    published = {"s1": "2026-05-01T00:00:00Z", "s2": "2026-06-01T00:00:00Z", "l1": "2026-07-01T00:00:00Z"}
+    st = {}
+    with cs.VIDEOS.producer():
+        assert cs.classify_shorts(st, ["s1", "l1", "s2", "x"], published) == ["l1", "x"]
+        assert st["shorts"] == {"s1": "2026-05-01T00:00:00Z", "s2": "2026-06-01T00:00:00Z"}
+        # known Shorts are not fetched again
+        assert list(cs.iter_unshorts(st, ["s1", "s2", "l2"], published)) == ["l2"]
+    assert calls == [["s1", "l1", "s2", "x"], ["l2"]]
+
+def test_prune_shorts(capsys):
+    st = {
+        "shorts": {"old": "2025-01-01T00:00:00Z", "new": "2026-06-01T00:00:00Z",
+                   "legacy_in": 40, "legacy_out": 40, "legacy_lost": 40},
+        "playlists": {"UU1": {"videos": {"legacy_in": "2026-03-01T00:00:00Z", "legacy_out": "2025-02-01T00:00:00Z"}}},
+    }
+    cs.prune_shorts(st, "2025-10-01T00:00:00Z")
+    assert st["shorts"] == {"new": "2026-06-01T00:00:00Z", "legacy_in": "2026-03-01T00:00:00Z"}
+    assert "INFO[SHORTS_PRUNE]: dropped=3 kept=2" in capsys.readouterr().out
+    cs.prune_shorts(st, "2025-10-01T00:00:00Z")
+    assert capsys.readouterr().out == ""
@@ -0,0 +1,15 @@
+# tests/test_source.py
+# Channel selection from the source sheet's columns.
+
+import chunk_sheets as cs
+
+def test_select_channels():
+    uploads = ["UU1", "UU2", "", "UU3", "UU4", "UU5"]
+    vcounts = ["120", "10 001", "5", "", "9 999", "abc"]
+    topics  = ["Музыка", "Спорт", "", "  Телевизионные ПРОГРАММЫ ", "Знания", ""]
+    titles  = ["One", "Two", "blank", "Three", "Four", "Five"]
+    candidates, title_map, vc_map = cs.select_channels(uploads, vcounts, topics, titles)
+    # over 10k videos and TV channels are dropped; rows without a playlist are ignored
+    assert candidates == ["UU1", "UU4", "UU5"]
+    assert title_map == {"UU1": "One", "UU2": "Two", "UU3": "Three", "UU4": "Four", "UU5": "Five"}
+    assert vc_map == {"UU1": 120, "UU2": 10001, "UU3": None, "UU4": 9999, "UU5": None}
@@ -0,0 +1,15 @@
+# tests/test_startup.py
+# Heavy dependencies stay out of the import path; they load on first use.
+
+import os, sys, subprocess
+
+SCRIPTS = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "scripts")
+
+def test_import_skips_heavy_modules():
+    code = ("import sys, chunk_sheets; "
+            "print(sorted(m for m in sys.modules if m.split('.')[0] in ('pandas', 'googleapiclient') "
+            "or m.startswith('google.auth') or m.startswith('google.oauth2')))")
+    r = subprocess.run([sys.executable, "-c", code], cwd=SCRIPTS, capture_output=True, text=True,
+                       env=dict(os.environ, YOUTUBE_API_KEYS="k"))
+    assert r.returncode == 0, r.stderr
+    assert r.stdout.strip() == "[]"
@@ -0,0 +1,51 @@
+# tests/test_state_files.py
+# State files updated in place, with a stub Drive.
+
+import pytest
+
+import chunk_sheets as cs
+
+class StubDrive:
+    """files.update / files.create on in-memory files whose version counts every write."""
+
+    def __init__(self):
+        self.files = {}
+        self.updates = 0
+
+    def files_update(self, file_id, media=None, mimetype=None, fields="id", retries=0):
+        self.updates += 1
+        f = self.files[file_id]
+        f["version"] += 1; f["data"] = media
+        return {"id": file_id, "version": str(f["version"])}
+
+    def files_create(self, body, media=None, mimetype=None, fields="id", retries=0):
+        fid = f"f{len(self.files)}"
+        self.files[fid] = {"version": 1, "data": media}
+        return {"id": fid, "version": "1"}
+
+@pytest.fixture
+def stub_drive(monkeypatch):
+    d = StubDrive()
+    monkeypatch.setattr(cs, "drive", d)
+    monkeypatch.setattr(cs, "DRIVE_FILES", {})
+    monkeypatch.setattr(cs, "drive_lookup", lambda name, folder_id: None)
+    return d
+
+def test_state_writes_check_versions_without_a_get(stub_drive):
+    fid = cs.drive_write_state_text("s.json", "{}")
+    for i in range(3):
+        assert cs.drive_write_state_text("s.json", '{"n":%d}' % i) == fid
+    # only the writes themselves: StubDrive has no files_get for a pre-check to call
+    assert stub_drive.updates == 3
+    assert cs.DRIVE_FILES["s.json"] == {"id": fid, "version": "4"}
+
+def test_state_conflict(stub_drive, capsys):
+    fid = cs.drive_write_state_text("s.json", "{}")
+    stub_drive.files[fid]["version"] += 1  # another run saved it
+    with pytest.raises(SystemExit):
+        cs.drive_write_state_text("s.json", '{"mine":1}')
+    assert "ERROR[STATE_CONFLICT]" in capsys.readouterr().out
+    # later saves (the failure checkpoint, say) leave the file alone
+    with pytest.raises(SystemExit):
+        cs.drive_write_state_text("s.json", '{"mine":2}')
+    assert stub_drive.updates == 1
@@ -0,0 +1,70 @@
+# tests/test_video_batcher.py
+# Run-wide videos.list packing, with a stub fetch in place of the API.
+
+import threading
+
+import pytest
+
+import chunk_sheets as cs
+
+def batcher(fail=()):
+    """A VideoBatcher over a stub fetch that echoes IDs, drops 'gone*' and raises on `fail`."""
+    calls = []
+    def fetch(ids):
+        calls.append(list(ids))
+        if any(v in fail for v in ids):
+            raise RuntimeError("videos.list failed")
+        return [v for v in ids if not v.startswith("gone")]
+    return cs.VideoBatcher({"k": (fetch, lambda it: it)}), calls
+
+def run_producers(b, wanted):
+    """get() from one producer thread per ID list, all in flight together; {i: items or exception}."""
+    out = {}
+    barrier = threading.Barrier(len(wanted))
+    def work(i, ids):
+        with b.producer():
+            barrier.wait()
+            try:
+                out[i] = b.get("k", ids)
+            except Exception as e:
+                out[i] = e
+    threads = [threading.Thread(target=work, args=(i, ids)) for i, ids in enumerate(wanted)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join(10)
+    assert not any(t.is_alive() for t in threads)
+    return out
+
+def test_video_batcher_packs_across_playlists():
+    b, calls = batcher()
+    ids = [f"v{i:03d}" for i in range(100)]
+    wanted = [ids[0:40], ids[30:70], ids[60:100] + ["gone1"]]
+    out = run_producers(b, wanted)
+    for i, w in enumerate(wanted):
+        assert out[i] == [v for v in w if not v.startswith("gone")]
+    assert sorted(len(c) for c in calls) == [1, 50, 50]
+    assert sorted(v for c in calls for v in c) == sorted(ids + ["gone1"])
+    assert b.stats == {"requests": 3, "ids": 101, "shared": 20}
+    assert b.entries == {} and b.active == 0 and b.waiting == 0
+
+def test_video_batcher_single_playlist():
+    b, calls = batcher()
+    with b.producer():
+        assert b.get("k", ["a", "b", "a", "gone"]) == ["a", "b"]
+    assert calls == [["a", "b", "gone"]]
+
+def test_video_batcher_error_fails_only_its_callers():
+    b, calls = batcher(fail={"bad"})
+    a_ids = [f"a{i:02d}" for i in range(49)] + ["bad"]
+    b_ids = [f"b{i:02d}" for i in range(10)]
+    out = run_producers(b, [a_ids, b_ids])
+    assert isinstance(out[0], RuntimeError)
+    assert out[1] == b_ids
+    assert b.entries == {}
+    # the failure is not sticky: IDs that shared the failed request resolve next time
+    with b.producer():
+        with pytest.raises(RuntimeError):
+            b.get("k", ["x", "bad"])
+        assert b.get("k", ["x", "y"]) == ["x", "y"]
+    assert b.entries == {}
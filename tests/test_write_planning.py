@@ -0,0 +1,22 @@
+# tests/test_write_planning.py
+# Turning row updates into range writes.
+
+import chunk_sheets as cs
+
+def test_row_runs_merges_adjacent_rows():
+    runs = cs.row_runs([(5, ["a"]), (3, ["b"]), (4, ["c"]), (9, ["d"]), (4, ["e"])])
+    assert runs == [(3, [["b"], ["e"], ["a"]]), (9, [["d"]])]
+    assert cs.row_runs([]) == []
+
+def test_row_runs_caps_run_length(monkeypatch):
+    monkeypatch.setattr(cs, "MAX_RANGE_ROWS", 2)
+    runs = cs.row_runs([(r, [r]) for r in range(10, 15)])
+    assert runs == [(10, [[10], [11]]), (12, [[12], [13]]), (14, [[14]])]
+
+def test_cell_diff():
+    assert cs.cell_diff(["a", "b", "c"], ["a", "b", "c"]) == []
+    assert cs.cell_diff(["a", "b", "c"], ["a", "X", "c", "Y"]) == [(1, 1, ["X"]), (3, 3, ["Y"])]
+    assert cs.cell_diff(["a", "b", "c"], ["A", "B", "c"]) == [(0, 1, ["A", "B"])]
+    # None leaves the cell alone
+    assert cs.cell_diff(["a", "b", "c"], [None, "b", "Z"]) == [(2, 2, ["Z"])]
+    assert cs.cell_diff([], ["x", None, "y"]) == [(0, 0, ["x"]), (2, 2, ["y"])]